@@ -0,0 +1,120 @@
+from collections import defaultdict
+
+from classes import TicketType, workshop_day
+
+
+def ticket_label(t):
+    return "All Access" if t.ticket_type == TicketType.AllAccessPass else "Exhibition"
+
+
+def cents(amount):
+    return round(amount * 100)
+
+
+def _split(total, n):
+    """Splits integer cents into n shares, the remainder going to the first one."""
+    share, rest = divmod(total, n)
+    return [share + rest] + [share] * (n - 1)
+
+
+class Aggregates:
+    """Running totals behind the admin dashboard, updated by DataStore in O(1) per changed record.
+
+    Every ticket and workshop contributes to the totals through ticket() / workshop(); a change
+    is applied as "remove the old contribution, add the new one". Money is kept in integer cents
+    so that adding and removing the same record always cancels out exactly.
+    """
+
+    def __init__(self):
+        # Each total is [count, cents]
+        self.by_type = defaultdict(lambda: [0, 0])
+        # Exhibition Passes split their price over their selected exhibitions; All-Access passes are
+        # kept apart and shared over the exhibitions when read (see by_exhibition_totals)
+        self.by_exhibition = defaultdict(lambda: [0, 0])
+        self.all_access = [0, 0]
+        self.by_day = defaultdict(lambda: [0, 0])
+        # Workshop date -> [booked seats, capacity]
+        self.seats_by_day = defaultdict(lambda: [0, 0])
+        # Workshop date -> workshops on that date, in exhibition order (dates of workshops do not change)
+        self.workshops_by_day = defaultdict(list)
+
+    @classmethod
+    def build(cls, ds):
+        agg = cls()
+        for t in ds.tickets: agg.ticket(t, 1)
+        for ws in ds.workshops.values():
+            agg.workshop(ws, 1)
+            agg.workshops_by_day[ws.date].append(ws)
+        return agg
+
+    def ticket(self, t, sign):
+        """Adds (sign=1) or removes (sign=-1) a ticket's contribution."""
+        amount = cents(t.price)
+        for total in (self.by_type[ticket_label(t)], self.by_day[t.purchase_day]):
+            total[0] += sign
+            total[1] += sign * amount
+        if t.ticket_type == TicketType.AllAccessPass:
+            self.all_access[0] += sign
+            self.all_access[1] += sign * amount
+            return
+        selected = getattr(t, "selected_exhibitions", None) or []
+        for name, share in zip(selected, _split(amount, len(selected)) if selected else []):
+            total = self.by_exhibition[name]
+            total[0] += sign
+            total[1] += sign * share
+
+    def workshop(self, ws, sign):
+        """Adds (sign=1) or removes (sign=-1) a workshop's booked seats and capacity."""
+        total = self.seats_by_day[ws.date]
+        total[0] += sign * len(ws.attendees_ids)
+        total[1] += sign * ws.capacity
+
+    # ---------- reading ----------
+
+    def by_type_totals(self):
+        """{label: (count, amount)}"""
+        return {k: (v[0], v[1] / 100) for k, v in self.by_type.items() if v[0]}
+
+    def by_exhibition_totals(self, names):
+        """{exhibition: (tickets giving access, amount)}, All-Access revenue shared equally."""
+        if not names: return {}
+        shares = _split(self.all_access[1], len(names))
+        return {n: (self.by_exhibition[n][0] + self.all_access[0], (self.by_exhibition[n][1] + s) / 100)
+                for n, s in zip(names, shares)}
+
+    def by_day_totals(self):
+        """[(purchase_day ordinal, count, amount)] in date order."""
+        return [(d, v[0], v[1] / 100) for d, v in sorted(self.by_day.items()) if v[0]]
+
+    def revenue(self):
+        return sum(v[1] for v in self.by_type.values()) / 100
+
+    def seats_on(self, date):
+        """(booked, capacity) over the workshops on a date."""
+        return tuple(self.seats_by_day.get(date, (0, 0)))
+
+    def workshops_on(self, date):
+        return self.workshops_by_day.get(date, [])
+
+    def dates(self):
+        return sorted(self.workshops_by_day, key=workshop_day)
+
+    # ---------- verification ----------
+
+    def _state(self):
+        live = lambda d: {k: tuple(v) for k, v in d.items() if any(v)}
+        return {"by_type": live(self.by_type), "by_exhibition": live(self.by_exhibition),
+                "all_access": tuple(self.all_access), "by_day": live(self.by_day),
+                "seats_by_day": live(self.seats_by_day)}
+
+    def diff(self, other):
+        """[(total, key, ours, theirs)] for every total that differs from `other`."""
+        out = []
+        mine, theirs = self._state(), other._state()
+        for name, ours in mine.items():
+            if name == "all_access":
+                if ours != theirs[name]: out.append((name, None, ours, theirs[name]))
+                continue
+            for k in ours.keys() | theirs[name].keys():
+                if ours.get(k) != theirs[name].get(k): out.append((name, k, ours.get(k), theirs[name].get(k)))
+        return out
@@ -0,0 +1,584 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+import bulk_import
+import export
+import storage
+from classes import (Workshop, Exhibition, Attendee, ExhibitionPass, AllAccessPass, Payment, Reservation,
+                     WaitlistEntry, TicketType, PaymentMethod, BUNDLE_PRICES, ALL_ACCESS_PRICE)
+
+# ==========================================
+# SYNTHETIC DATA GENERATOR
+# ==========================================
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def generate(ds, exhibitions=3, days=4, sessions=3, capacity=30, attendees=1000, tickets_per_attendee=1,
+             reservations_per_attendee=1, seed=0):
+    """Fills `ds` in memory with a synthetic conference (nothing is written to disk)."""
+    rng = random.Random(seed)
+    start = datetime.date(2026, 4, 15)
+    dates = [f"{d:%B} {d.day}, {d.year}" for d in (start + datetime.timedelta(days=i) for i in range(days))]
+    ds.exhibitions, ds.workshops = [], {}
+    for e in range(exhibitions):
+        ex = Exhibition(f"Exhibition {e + 1}", f"Hall {e + 1}")
+        ds.exhibitions.append(ex)
+        for d in dates:
+            for s in range(sessions):
+                t0 = datetime.datetime(2026, 1, 1, 9) + datetime.timedelta(minutes=70 * s)
+                ws = Workshop(f"EX{e + 1}_S{s + 1}_{d}", f"Session {s + 1} of Exhibition {e + 1}", d,
+                              f"{t0:%I:%M %p}", f"{t0 + datetime.timedelta(hours=1):%I:%M %p}", ex.name, capacity)
+                ex.add_workshop(ws)
+                ds.workshops[ws.workshop_id] = ws
+
+    names = [ex.name for ex in ds.exhibitions]
+    by_ex = defaultdict(list)
+    for ws in ds.workshops.values(): by_ex[ws.exhibition_name].append(ws)
+    ds.attendees, ds.tickets, ds.payments, ds.reservations, ds.waitlist = {}, [], [], [], {}
+    # Who is booked on each workshop, as sets: add_attendee() scans the list, which is quadratic at the 1m scale
+    booked = defaultdict(set)
+    for i in range(attendees):
+        a = Attendee(f"U{i + 1}", f"Attendee {i + 1}", f"user{i + 1}@example.com", f"05{i:08d}"[:10], "password")
+        ds.attendees[a.email] = a
+        allowed = set()
+        for _ in range(tickets_per_attendee):
+            tid = len(ds.tickets) + 1
+            if rng.random() < 0.2:
+                t = AllAccessPass(tid, a.attendee_id, ALL_ACCESS_PRICE)
+                allowed.update(names)
+            else:
+                sel = rng.sample(names, min(len(names), rng.choice((1, 2))))
+                t = ExhibitionPass(tid, a.attendee_id, BUNDLE_PRICES[len(sel)], sel)
+                allowed.update(sel)
+            t.purchase_date = datetime.date(2026, 3, 1) + datetime.timedelta(days=rng.randrange(45))
+            ds.tickets.append(t)
+            a.tickets.append(tid)
+            ds.payments.append(Payment(len(ds.payments) + 1, a.attendee_id, t.price, PaymentMethod.Wallet, "Wallet: bench"))
+        for _ in range(reservations_per_attendee):
+            ws = rng.choice(by_ex[rng.choice(sorted(allowed))])
+            if a.attendee_id not in booked[ws.workshop_id] and not ws.is_full():
+                booked[ws.workshop_id].add(a.attendee_id)
+                ws.attendees_ids.append(a.attendee_id)
+                ds.reservations.append(Reservation(len(ds.reservations) + 1, a.attendee_id, ws.workshop_id))
+    ds._reindex()
+    return ds
+
+
+def conference_for(n):
+    """Generator settings for a target of ~n attendees (and ~n tickets, payments and reservations)."""
+    workshops = 3 * 4 * 3
+    return dict(attendees=n, capacity=max(30, 2 * n // workshops))
+
+
+# ==========================================
+# ADMIN AGGREGATIONS (same data work as the AdminDashboard tabs, without Tk)
+# ==========================================
+
+def admin_analytics(ds):
+    agg = ds.aggregates
+    return agg.by_type_totals(), agg.by_exhibition_totals([e.name for e in ds.exhibitions]), agg.by_day_totals()
+
+
+def admin_orders(ds, sort=None, search=""):
+    # The order table only renders the visible page
+    rows = []
+    for t in ds.query_orders(sort, False, search, 0, 20)[1]:
+        u = ds.get_attendee_by_id(t.attendee_id)
+        rows.append((t.ticket_id, t.purchase_date, u.email if u else "Unknown", t.price))
+    return ds.aggregates.revenue(), rows
+
+
+def admin_capacity(ds):
+    agg = ds.aggregates
+    d = agg.dates()[0]
+    return agg.seats_on(d), [(w.topic, len(w.attendees_ids), w.capacity) for w in agg.workshops_on(d)]
+
+
+# ==========================================
+# BENCHMARK CASES
+# ==========================================
+
+CASES = []
+
+
+def case(name, repeat=False):
+    """Registers a benchmark. repeat=True cases are timed once per sampled operation. A case that returns a
+    number of seconds is timed by itself (to leave its setup out)."""
+    def deco(fn):
+        CASES.append((name, fn, repeat))
+        return fn
+    return deco
+
+
+@case("save_all")
+def bench_save_all(ds, rng):
+    ds.snapshot()
+
+
+@case("load_all")
+def bench_load_all(ds, rng):
+    ds.load_all()
+
+
+def _cold_start(rng, lazy):
+    fresh = storage.DataStore(storage.make_backend())
+    t = time.perf_counter()
+    fresh.load_all(lazy)
+    fresh.attendees[f"user{rng.randrange(len(fresh.attendees)) + 1}@example.com"].password
+    took = time.perf_counter() - t
+    close = getattr(fresh.backend, "close", None)
+    if close: close()
+    return took
+
+
+@case("cold_start")
+def bench_cold_start(ds, rng):
+    """A terminal starting up: load_all() into a new store, then a login's lookup of one attendee."""
+    return _cold_start(rng, False)
+
+
+@case("cold_start_lazy")
+def bench_cold_start_lazy(ds, rng):
+    """cold_start as the GUI does it, with load_all(lazy=True): the login only reads the attendees."""
+    return _cold_start(rng, True)
+
+
+@case("login_lookup", repeat=True)
+def bench_login(ds, rng):
+    """LoginScreen.do_login's lookup of a random attendee by email (from disk with --attendee-cache)."""
+    ds.attendees.get(f"user{rng.randrange(bench_login.n) + 1}@example.com").password
+
+
+@case("commit_one_change", repeat=True)
+def bench_commit(ds, rng):
+    ws = rng.choice(list(ds.workshops.values()))
+    with ds.transaction(), ds.modifying(ws):
+        ws.capacity += 1
+
+
+@case("purchase_ticket", repeat=True)
+def bench_purchase(ds, rng):
+    a = ds.get_attendee_by_id(f"U{rng.randrange(len(ds.attendees)) + 1}")
+    a.purchase_ticket(TicketType.AllAccessPass, ALL_ACCESS_PRICE, PaymentMethod.Wallet, {"wallet_id": "bench"})
+
+
+@case("purchase_ticket_in_view", repeat=True)
+def bench_purchase_in_view(ds, rng):
+    """purchase_ticket while a read view is open (appending a ticket and a payment copies nothing for it)."""
+    with ds.read_view():
+        bench_purchase(ds, rng)
+
+
+@case("reserve_workshop", repeat=True)
+def bench_reserve(ds, rng):
+    a = ds.get_attendee_by_id(f"U{rng.randrange(len(ds.attendees)) + 1}")
+    a.reserve_workshop(rng.choice(list(ds.workshops)))
+
+
+@case("can_access", repeat=True)
+def bench_can_access(ds, rng):
+    a = ds.get_attendee_by_id(f"U{rng.randrange(len(ds.attendees)) + 1}")
+    a.can_access(rng.choice(ds.exhibitions).name)
+
+
+@case("schedule_clash", repeat=True)
+def bench_clash(ds, rng):
+    a = ds.get_attendee_by_id(f"U{rng.randrange(len(ds.attendees)) + 1}")
+    ds.schedule.clash(a.attendee_id, rng.choice(list(ds.workshops)))
+
+
+@case("refund_ticket", repeat=True)
+def bench_refund(ds, rng):
+    a = ds.get_attendee_by_id(f"U{rng.randrange(len(ds.attendees)) + 1}")
+    if a.tickets: a.refund_ticket(a.tickets[-1])
+
+
+@case("refresh_one_change")
+def bench_refresh(ds, rng):
+    """Another terminal changes one workshop and compacts; times picking that up with refresh()."""
+    cwd, other = getattr(bench_refresh, "other", (None, None))
+    if cwd != os.getcwd():
+        other = storage.DataStore(storage.make_backend())
+        other.load_all()
+        bench_refresh.other = (os.getcwd(), other)
+    ws = rng.choice(list(other.workshops.values()))
+    with other.transaction(), other.modifying(ws):
+        ws.capacity += 1
+    if hasattr(other.backend, "compact"):
+        with other._lock, other.backend.lock(): other.backend.compact(other)
+    t = time.perf_counter()
+    ds.refresh()
+    return time.perf_counter() - t
+
+
+@case("waitlist_promote")
+def bench_waitlist(ds, rng):
+    """Up to 2000 attendees wait for one full workshop; times a capacity increase that promotes 100 of them."""
+    ws = rng.choice(list(ds.workshops.values()))
+    waiters = [a for a in ds.attendees.values() if a.attendee_id not in ws.attendees_ids
+               and a.can_access(ws.exhibition_name)][:2000]
+    with ds.transaction():
+        ds.set_capacity(ws.workshop_id, len(ws.attendees_ids))
+        for a in waiters:
+            ds.add_waitlist_entry(WaitlistEntry(ds.next_waitlist_id(), ws.workshop_id, a.attendee_id))
+    t = time.perf_counter()
+    ds.set_capacity(ws.workshop_id, ws.capacity + 100)
+    return time.perf_counter() - t
+
+
+@case("bulk_import_1k_rows")
+def bench_bulk_import(ds, rng):
+    """1000 registrations with an Exhibition Pass each, through bulk_import (one batch, one commit)."""
+    n = bench_bulk_import.n = getattr(bench_bulk_import, "n", 0) + 1
+    names = [ex.name for ex in ds.exhibitions]
+    rows = ((i, {"name": f"Bulk {i}", "email": f"bulk{n}_{i}@example.com", "phone": "0500000000",
+                 "password": "password", "exhibitions": [rng.choice(names)], "payment_method": "Wallet",
+                 "wallet_id": "bench"}) for i in range(1000))
+    bulk_import.import_rows(rows)
+
+
+@case("export_orders_csv")
+def bench_export(ds, rng):
+    export.export("orders", os.devnull)
+
+
+@case("export_orders_during_writes")
+def bench_export_writes(ds, rng):
+    """export_orders_csv while another thread keeps buying tickets (it writes the orders as of its start)."""
+    done = threading.Event()
+
+    def buy():
+        while not done.is_set(): bench_purchase(ds, rng)
+    writer = threading.Thread(target=buy)
+    writer.start()
+    try:
+        t = time.perf_counter()
+        export.export("orders", os.devnull)
+        return time.perf_counter() - t
+    finally:
+        done.set()
+        writer.join()
+
+
+@case("admin_analytics")
+def bench_analytics(ds, rng):
+    admin_analytics(ds)
+
+
+@case("admin_orders")
+def bench_orders(ds, rng):
+    admin_orders(ds)
+
+
+@case("admin_orders_search", repeat=True)
+def bench_orders_search(ds, rng):
+    admin_orders(ds, "customer", f"user{rng.randrange(100)}")
+
+
+@case("admin_capacity")
+def bench_capacity(ds, rng):
+    admin_capacity(ds)
+
+
+@case("verify_aggregates")
+def bench_verify(ds, rng):
+    ds.verify_aggregates()
+
+
+def _stats(samples):
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"n": len(s), "mean_ms": 1000 * sum(s) / len(s), "p50_ms": 1000 * pick(0.5), "p95_ms": 1000 * pick(0.95),
+            "max_ms": 1000 * s[-1]}
+
+
+def run(scales, ops=200, backend="pickle", only=None, seed=0, log=print, snapshot_format="pickle", attendee_cache=0):
+    """Runs every case at every scale in a scratch directory; returns the machine-readable results."""
+    results = []
+    sizes = {}
+    cwd = os.getcwd()
+    storage.STORAGE_CONFIG["backend"] = backend
+    storage.STORAGE_CONFIG["snapshot_format"] = snapshot_format
+    storage.STORAGE_CONFIG["attendee_cache"] = attendee_cache
+    for label in scales:
+        n = SCALES[label]
+        with tempfile.TemporaryDirectory(prefix="greenwave-bench-") as tmp:
+            os.chdir(tmp)
+            try:
+                # The Attendee methods use the global store, so benchmark that one
+                ds = storage.data_store
+                ds.__init__(storage.make_backend())
+                t0 = time.perf_counter()
+                generate(ds, seed=seed, **conference_for(n))
+                log(f"[{label}] generated {len(ds.attendees)} attendees, {len(ds.tickets)} tickets, "
+                    f"{len(ds.reservations)} reservations in {time.perf_counter() - t0:.1f}s")
+                ds.snapshot()
+                sizes[label] = sum(os.path.getsize(f) for f in os.listdir(tmp))
+                log(f"[{label}] data files: {sizes[label] / 2 ** 20:.1f} MiB")
+                # The generator fills plain dicts: read the attendees back through the repository
+                if attendee_cache: ds.load_all()
+                bench_login.n = n
+                rng = random.Random(seed)
+                for name, fn, repeat in CASES:
+                    if only and name not in only: continue
+                    samples = []
+                    gc.collect()
+                    for _ in range(ops if repeat else 3):
+                        t = time.perf_counter()
+                        took = fn(ds, rng)
+                        samples.append(took if took is not None else time.perf_counter() - t)
+                    res = dict(scale=label, records=n, case=name, **_stats(samples))
+                    results.append(res)
+                    log(f"[{label}] {name:<20} mean {res['mean_ms']:10.3f} ms   p95 {res['p95_ms']:10.3f} ms")
+                drift = ds.verify_aggregates()
+                if drift: log(f"[{label}] WARNING: dashboard aggregates drifted: {drift[:5]}")
+                if attendee_cache: log(f"[{label}] attendee cache: {ds.attendees.stats()}")
+                ds.flush()
+                close = getattr(ds.backend, "close", None)
+                if close: close()
+            finally:
+                os.chdir(cwd)
+    return {"meta": {"python": sys.version.split()[0], "platform": platform.platform(), "backend": backend,
+                     "mode": storage.STORAGE_CONFIG["mode"], "snapshot_format": snapshot_format,
+                     "attendee_cache": attendee_cache,
+                     "data_bytes": sizes, "ops": ops, "seed": seed,
+                     "time": datetime.datetime.now().isoformat(timespec="seconds")},
+            "results": results}
+
+
+# ==========================================
+# MEMORY FOOTPRINT
+# ==========================================
+
+# Bytes per loaded record (the object, its own strings and lists, and its slot in the store's container), and
+# bytes per attendee for the lookup indexes, on CPython 3.11. The budget adds up to ~1.8 GB for 1M attendees with
+# one ticket, payment and reservation each.
+MEMORY_BUDGET = {"attendees": 600, "tickets": 260, "payments": 250, "reservations": 180, "indexes": 480}
+
+
+def footprint(n=100_000, seed=0):
+    """Measured bytes per record of each store as load_all() unpickles it, plus the indexes per attendee."""
+    src = generate(storage.DataStore(storage.PickleBackend()), seed=seed, **conference_for(n))
+    ds = storage.DataStore(src.backend)
+    sizes = {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for name in ("attendees", "tickets", "payments", "reservations"):
+            data = pickle.dumps(getattr(src, name), protocol=pickle.HIGHEST_PROTOCOL)
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            setattr(ds, name, pickle.loads(data))
+            sizes[name] = (tracemalloc.get_traced_memory()[0] - before) / len(getattr(ds, name))
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        ds._reindex()
+        sizes["indexes"] = (tracemalloc.get_traced_memory()[0] - before) / len(ds.attendees)
+    finally:
+        tracemalloc.stop()
+    return sizes
+
+
+def repository_footprint(n=100_000, size=10_000, lookups=None, seed=0):
+    """Bytes per attendee the attendees take with STORAGE_CONFIG["attendee_cache"] = size (the repository, its
+    open file and a full cache after `lookups` random logins, 2 * size by default), and its stats()."""
+    cwd, saved = os.getcwd(), storage.STORAGE_CONFIG["attendee_cache"]
+    storage.STORAGE_CONFIG["attendee_cache"] = size
+    try:
+        with tempfile.TemporaryDirectory(prefix="greenwave-bench-") as tmp:
+            os.chdir(tmp)
+            generate(storage.DataStore(storage.PickleBackend()), seed=seed, **conference_for(n)).snapshot()
+            ds = storage.DataStore(storage.PickleBackend())
+            ds.load_all(lazy=True)
+            rng = random.Random(seed)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                for _ in range(lookups or 2 * size): ds.attendees.get(f"user{rng.randrange(n) + 1}@example.com")
+                gc.collect()
+                used = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            return used / n, ds.attendees.stats()
+    finally:
+        os.chdir(cwd)
+        storage.STORAGE_CONFIG["attendee_cache"] = saved
+
+
+# ==========================================
+# NAVIGATION LATENCY (drives the Tk screens, needs a display)
+# ==========================================
+
+def navigation(n=10_000, rounds=20, seed=0):
+    """Walks the main screens `rounds` times and returns switch_frame latency per screen, split
+    into first builds and cached visits (GreenWaveApp.nav_times)."""
+    import gui
+    from classes import AppState
+    ds = storage.data_store
+    ds.__init__(storage.PickleBackend())
+    generate(ds, seed=seed, **conference_for(n))
+    AppState.current_user = ds.get_attendee_by_id("U1")
+    route = [(gui.ProfileScreen, None), (gui.ExhibitionBrowserFrame, None), (gui.WorkshopListFrame, ds.exhibitions[0]),
+             (gui.ProfileScreen, None), (gui.AdminDashboard, None), (gui.LoginScreen, None)]
+    app = gui.GreenWaveApp()
+    try:
+        for _ in range(rounds):
+            for cls, context in route:
+                app.switch_frame(cls, context)
+                app.update()
+    finally:
+        app.destroy()
+    samples = defaultdict(list)
+    for name, how, dt in app.nav_times: samples[(name, how)].append(dt)
+    return [dict(screen=name, how=how, **_stats(s)) for (name, how), s in sorted(samples.items())]
+
+
+# ==========================================
+# STARTUP (fresh processes, time to the first frame)
+# ==========================================
+
+# What controller.py does before its first frame, without Tk, then a login's lookup
+HEADLESS_START = """
+import sys, time
+t = time.perf_counter()
+from storage import data_store
+data_store.load_all(lazy={lazy})
+ready = time.perf_counter() - t
+data_store.attendees["user1@example.com"].password
+print(ready, time.perf_counter() - t, "tkinter" in sys.modules)
+"""
+
+
+def startup(n=100_000, runs=5, snapshot_format="pickle", seed=0, log=print):
+    """Starts fresh processes on a generated conference of n attendees, with eager and lazy loading, and returns
+    {mode: {measure: stats}}: the data ready for the first frame and a login answered (headless, which also checks
+    that importing storage does not import Tk), and controller.py's first frame (only with a display)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    cwd = os.getcwd()
+    samples = defaultdict(lambda: defaultdict(list))
+    storage.STORAGE_CONFIG["snapshot_format"] = snapshot_format
+    with tempfile.TemporaryDirectory(prefix="greenwave-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            generate(storage.DataStore(storage.PickleBackend()), seed=seed, **conference_for(n)).snapshot()
+        finally:
+            os.chdir(cwd)
+        env = dict(os.environ, PYTHONPATH=here, GREENWAVE_BACKEND="pickle", GREENWAVE_SNAPSHOT_FORMAT=snapshot_format)
+        display = True
+        for _ in range(runs):
+            for mode in ("eager", "lazy"):
+                lazy = mode == "lazy"
+                out = subprocess.run([sys.executable, "-c", HEADLESS_START.format(lazy=lazy)], cwd=tmp, env=env,
+                                     capture_output=True, text=True, check=True).stdout.split()
+                if out[2] == "True": raise RuntimeError("importing storage imported tkinter")
+                samples[mode]["data_ready"].append(float(out[0]))
+                samples[mode]["login_lookup"].append(float(out[1]))
+                if not display: continue
+                gui = subprocess.run([sys.executable, os.path.join(here, "controller.py"), "--first-frame"], cwd=tmp,
+                                     env=dict(env, GREENWAVE_LAZY_LOAD="1" if lazy else "0"), capture_output=True,
+                                     text=True)
+                if gui.returncode:
+                    display = False
+                    log(f"first frame not measured: {gui.stderr.strip().splitlines()[-1]}")
+                    continue
+                samples[mode]["first_frame"].append(float(gui.stdout.split()[-1]))
+    return {mode: {k: _stats(v) for k, v in measures.items()} for mode, measures in samples.items()}
+
+
+def compare(old, new, threshold=0.2, metric="mean_ms"):
+    """Lists (scale, case, old, new, ratio) for every case that got slower by more than `threshold`."""
+    base = {(r["scale"], r["case"]): r[metric] for r in old["results"]}
+    worse = []
+    for r in new["results"]:
+        before = base.get((r["scale"], r["case"]))
+        if before and r[metric] > before * (1 + threshold):
+            worse.append((r["scale"], r["case"], before, r[metric], r[metric] / before))
+    return worse
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="GreenWave synthetic-load benchmarks")
+    sub = ap.add_subparsers(dest="cmd")
+    rp = sub.add_parser("run", help="run the benchmarks (default)")
+    rp.add_argument("--scales", default="1k,10k,100k,1m", help="comma list of " + ",".join(SCALES))
+    rp.add_argument("--ops", type=int, default=200, help="samples per repeated operation")
+    rp.add_argument("--backend", default="pickle", choices=("pickle", "sqlite"))
+    rp.add_argument("--snapshot-format", default="pickle", choices=("pickle", "columnar"),
+                    help="snapshot files of the pickle backend")
+    rp.add_argument("--attendee-cache", type=int, default=0,
+                    help="keep the attendees on disk behind a cache of this many (default 0: all in memory)")
+    rp.add_argument("--only", help="comma list of case names")
+    rp.add_argument("--seed", type=int, default=0)
+    rp.add_argument("-o", "--output", default="bench_results.json")
+    cp = sub.add_parser("compare", help="compare two result files and flag regressions")
+    cp.add_argument("old")
+    cp.add_argument("new")
+    cp.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown ratio (default 0.2 = 20%%)")
+    cp.add_argument("--metric", default="mean_ms", choices=("mean_ms", "p50_ms", "p95_ms", "max_ms"))
+    np_ = sub.add_parser("nav", help="measure screen navigation latency (needs a display)")
+    np_.add_argument("-n", type=int, default=10_000, help="attendees to generate")
+    np_.add_argument("--rounds", type=int, default=20)
+    mp = sub.add_parser("memory", help="measure bytes per loaded record and check them against MEMORY_BUDGET")
+    mp.add_argument("-n", type=int, default=100_000, help="attendees to generate")
+    mp.add_argument("--attendee-cache", type=int, default=1000,
+                    help="also measure the attendees kept on disk behind a cache of this many (0: skip)")
+    sp = sub.add_parser("startup", help="measure time to the first frame, eager and lazy, in fresh processes")
+    sp.add_argument("-n", type=int, default=100_000, help="attendees to generate")
+    sp.add_argument("--runs", type=int, default=5)
+    sp.add_argument("--snapshot-format", default="pickle", choices=("pickle", "columnar"))
+    args = ap.parse_args(sys.argv[1:] if len(sys.argv) > 1 and sys.argv[1] in ("run", "compare", "memory", "nav",
+                                                                                  "startup", "-h", "--help")
+                         else ["run"] + sys.argv[1:])
+
+    if args.cmd == "startup":
+        for mode, measures in startup(args.n, args.runs, args.snapshot_format).items():
+            for name, s in measures.items():
+                print(f"{mode:<6} {name:<13} mean {s['mean_ms']:9.1f} ms   p50 {s['p50_ms']:9.1f} ms   "
+                      f"max {s['max_ms']:9.1f} ms")
+        sys.exit(0)
+
+    if args.cmd == "nav":
+        for r in navigation(args.n, args.rounds):
+            print(f"{r['screen']:<24} {r['how']:<7} n {r['n']:4d}   mean {r['mean_ms']:9.2f} ms   p95 {r['p95_ms']:9.2f} ms")
+        sys.exit(0)
+
+    if args.cmd == "memory":
+        sizes = footprint(args.n)
+        over = [k for k, v in sizes.items() if v > MEMORY_BUDGET[k]]
+        for k, v in sizes.items():
+            print(f"{k:<14} {v:8.0f} B/record   budget {MEMORY_BUDGET[k]:5d}{'   OVER' if k in over else ''}")
+        total = sum(sizes.values()) * 1_000_000 / 2 ** 20
+        print(f"~{total:.0f} MiB for 1M attendees with one ticket, payment and reservation each")
+        if args.attendee_cache:
+            per, stats = repository_footprint(args.n, args.attendee_cache)
+            print(f"attendees on disk, cache of {args.attendee_cache}: {per:8.0f} B/attendee   "
+                  f"hits {stats['hits']} misses {stats['misses']} evictions {stats['evictions']}")
+        sys.exit(1 if over else 0)
+
+    if args.cmd == "compare":
+        with open(args.old) as f: old = json.load(f)
+        with open(args.new) as f: new = json.load(f)
+        worse = compare(old, new, args.threshold, args.metric)
+        for scale, name, b, a, ratio in worse:
+            print(f"REGRESSION [{scale}] {name}: {b:.3f} -> {a:.3f} ms ({ratio:.2f}x)")
+        print(f"{len(worse)} regression(s)" if worse else "No regressions")
+        sys.exit(1 if worse else 0)
+
+    out = run(args.scales.split(","), args.ops, args.backend, set(args.only.split(",")) if args.only else None,
+              args.seed, snapshot_format=args.snapshot_format, attendee_cache=args.attendee_cache)
+    with open(args.output, "w") as f: json.dump(out, f, indent=2)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,149 @@
+import argparse
+import csv
+import gc
+import json
+import sys
+import time
+from itertools import islice
+from classes import TicketType, PaymentMethod, Attendee, BUNDLE_PRICES, ALL_ACCESS_PRICE
+from storage import data_store
+
+# ==========================================
+# BULK IMPORT (registrations, purchases and reservations from CSV / JSONL)
+# ==========================================
+#
+# One row per attendee. Every column except email is optional:
+#
+#   name, email, phone, password    registers the attendee (without a password the email must already be registered)
+#   all_access                      true/yes/1 for an All-Access pass, or
+#   exhibitions                     1 or 2 exhibition names for an Exhibition Pass
+#   payment_method                  CreditCard, DebitCard or Wallet, with card_number or wallet_id
+#                                   (or a payment_details object in JSONL)
+#   workshops                       workshop ids to reserve
+#
+# Lists are "A;B" in CSV, and JSON arrays of strings (or "A;B") in JSONL. Other JSONL values must be strings, numbers
+# or booleans: a row with an array or object anywhere else is rejected. Rows follow the same rules and prices as the
+# registration and checkout screens (Attendee.validate, Payment.mask, reserve_workshop). Each row is all or nothing:
+# it runs in a savepoint of its batch's transaction, so a bad row is rolled back on its own and reported, and each
+# batch is written as one commit. Rows are read and applied one batch at a time, so memory does not grow with the file.
+
+BATCH_SIZE = 1000
+TRUE = ("1", "true", "yes", "y")
+
+
+def read_rows(path):
+    """Yields (line number, row) from a .csv or .jsonl file. Lines that are not a JSON object yield None."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            for row in reader: yield reader.line_num, row
+            return
+        for n, line in enumerate(f, 1):
+            if not line.strip(): continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield n, row
+
+
+def _text(row, key):
+    v = row.get(key)
+    if v is None: return ""
+    # A JSONL value that is an array or object is a mistake in the row, not a name to store as its repr
+    if not isinstance(v, (str, int, float, bool)): raise ValueError(f"{key} must be a single value")
+    return str(v).strip()
+
+
+def _list(row, key):
+    v = row.get(key)
+    if isinstance(v, list):
+        if not all(isinstance(x, str) for x in v): raise ValueError(f"{key} must be a list of strings")
+        return [x.strip() for x in v]
+    if v is not None and not isinstance(v, str): raise ValueError(f"{key} must be a list or an \"A;B\" string")
+    return [x.strip() for x in (v or "").split(";") if x.strip()]
+
+
+def apply_row(row):
+    """Registers / purchases / reserves what one row asks for. Raises ValueError (with the screen's message)."""
+    if not isinstance(row, dict): raise ValueError("Not a JSON object")
+    email, password = _text(row, "email"), _text(row, "password")
+    if password:
+        a, err = Attendee.register(_text(row, "name"), email, _text(row, "phone"), password)
+        if err: raise ValueError(err)
+    else:
+        a = data_store.attendees.get(email)
+        if a is None: raise ValueError("Unknown email (give name, phone and password to register)")
+
+    sel, all_access = _list(row, "exhibitions"), _text(row, "all_access").lower() in TRUE
+    if all_access or sel:
+        if all_access:
+            tt, price, sel = TicketType.AllAccessPass, ALL_ACCESS_PRICE, None
+        elif len(sel) in BUNDLE_PRICES and all(any(e.name == x for e in data_store.exhibitions) for x in sel):
+            tt, price = TicketType.ExhibitionPass, BUNDLE_PRICES[len(sel)]
+        else:
+            raise ValueError("Select 1 or 2 valid exhibitions, or all_access")
+        try:
+            method = PaymentMethod[_text(row, "payment_method")]
+        except KeyError:
+            raise ValueError("payment_method must be one of " + ", ".join(m.name for m in PaymentMethod))
+        details = row.get("payment_details") or {k: _text(row, k) for k in ("card_number", "wallet_id")}
+        if not isinstance(details, dict) or not all(isinstance(v, str) for v in details.values()):
+            raise ValueError("payment_details must be an object of strings")
+        t, err = a.purchase_ticket(tt, price, method, details, sel)
+        if err: raise ValueError(err)
+
+    for wid in _list(row, "workshops"):
+        r, err = a.reserve_workshop(wid)
+        if err: raise ValueError(f"{wid}: {err}")
+    return a
+
+
+def import_rows(rows, batch_size=BATCH_SIZE, on_error=None):
+    """Applies (line, row) pairs in transactions of batch_size rows. on_error(line, message) is called for every
+    rejected row once its batch is committed. Returns {"rows", "imported", "failed", "seconds"}."""
+    t0 = time.perf_counter()
+    rows = iter(rows)
+    done = failed = 0
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch: break
+            errors = []
+            with data_store.transaction():
+                for line, row in batch:
+                    try:
+                        with data_store.transaction():
+                            apply_row(row)
+                        done += 1
+                    except ValueError as e:
+                        errors.append((line, str(e)))
+            # The committed records live as long as the store: keep the garbage collector from walking them
+            # again on every collection, which otherwise makes each batch slower than the one before
+            gc.freeze()
+            failed += len(errors)
+            if on_error:
+                for line, msg in errors: on_error(line, msg)
+    finally:
+        gc.unfreeze()
+    return {"rows": done + failed, "imported": done, "failed": failed, "seconds": time.perf_counter() - t0}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Bulk import of registrations, ticket purchases and reservations")
+    ap.add_argument("file", help=".csv (with a header row) or .jsonl file")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE, help=f"rows per commit (default: {BATCH_SIZE})")
+    ap.add_argument("--errors", help="write rejected rows to this CSV file (line, error) instead of stderr")
+    args = ap.parse_args()
+
+    data_store.load_all()
+    out = open(args.errors, "w", newline="", encoding="utf-8") if args.errors else sys.stderr
+    try:
+        writer = csv.writer(out)
+        if args.errors: writer.writerow(("line", "error"))
+        stats = import_rows(read_rows(args.file), args.batch, lambda line, msg: writer.writerow((line, msg)))
+    finally:
+        if args.errors: out.close()
+        data_store.flush()
+    rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"{stats['imported']} imported, {stats['failed']} rejected, {stats['seconds']:.1f}s ({rate:,.0f} rows/s)")
@@ -1,6 +1,9 @@
 import datetime
+import re
+import time
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from metrics import timed
 
 
 # We do not import storage at the top to avoid circular errors.
@@ -21,16 +24,177 @@ class PaymentMethod(Enum):
     Wallet = 3
 
 
+# Ticket bundles and prices (AED), as the checkout screen offers them: an Exhibition Pass for 1 or 2 exhibitions, or
+# an All-Access pass; an upgrade adds one exhibition to an Exhibition Pass
+BUNDLE_PRICES = {1: 200.0, 2: 400.0}
+ALL_ACCESS_PRICE = 500.0
+EXHIBITION_ADD_COST = 200.0
+
+# The email rule of Attendee.validate, compiled once rather than looked up in re's cache on every row of a bulk import
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+
 class AppState:
     """Global state to hold the currently logged-in user."""
     current_user = None
 
 
+# Waitlisted All-Access holders get freed seats before everyone else (first come, first served within each group)
+WAITLIST_ALL_ACCESS_FIRST = True
+
+
 # ==========================================
 # LOGIC MODELS
 # ==========================================
 
-class Workshop:
+DATE_FORMAT = "%d / %B / %Y"
+_days = {}
+_formatted = {}
+
+
+def _day(value) -> int:
+    """A purchase date as a date ordinal, one shared int per day; accepts ordinals, dates and the old
+    formatted strings."""
+    if not isinstance(value, (int, str)): value = value.toordinal()
+    day = _days.get(value)
+    if day is None:
+        day = value if isinstance(value, int) else datetime.datetime.strptime(value, DATE_FORMAT).toordinal()
+        day = _days[value] = _days.setdefault(day, day)
+    return day
+
+
+# Workshops keep their date and times as display strings ("April 15, 2026", "10:30 AM"); these parse them once
+WORKSHOP_DATE_FORMAT = "%B %d, %Y"
+TIME_FORMAT = "%I:%M %p"
+MINUTES_PER_DAY = 24 * 60
+_workshop_days = {}
+_minutes = {}
+
+
+def workshop_day(date: str) -> int:
+    """Date ordinal of a workshop date string."""
+    day = _workshop_days.get(date)
+    if day is None:
+        day = _workshop_days[date] = datetime.datetime.strptime(date, WORKSHOP_DATE_FORMAT).toordinal()
+    return day
+
+
+def day_minute(t: str) -> int:
+    """Minutes after midnight of a workshop time string."""
+    m = _minutes.get(t)
+    if m is None:
+        parsed = datetime.datetime.strptime(t, TIME_FORMAT)
+        m = _minutes[t] = parsed.hour * 60 + parsed.minute
+    return m
+
+
+# Exhibitions are interned to small ids (saved with them as Exhibition.ex_id) so that a ticket's selection is
+# one int bitmask: bit ex_id is set for each selected exhibition
+_exhibition_ids = {}
+_exhibition_names = []
+# Entitlement of an All-Access pass: every bit set
+ALL_EXHIBITIONS = -1
+
+
+def _assign(name: str, ex_id: int):
+    while len(_exhibition_names) <= ex_id: _exhibition_names.append(None)
+    old = _exhibition_names[ex_id]
+    if old is not None and old != name: _exhibition_ids.pop(old, None)
+    _exhibition_names[ex_id] = name
+    _exhibition_ids[name] = ex_id
+
+
+def exhibition_id(name: str) -> int:
+    """The interned id of an exhibition name, assigning the next free one to a new name."""
+    ex_id = _exhibition_ids.get(name)
+    if ex_id is None:
+        ex_id = len(_exhibition_names)
+        _assign(name, ex_id)
+    return ex_id
+
+
+def exhibition_bit(name: str) -> int:
+    """The selection bit of an exhibition name (0 for a name never seen)."""
+    ex_id = _exhibition_ids.get(name)
+    return 0 if ex_id is None else 1 << ex_id
+
+
+def exhibition_mask(names) -> int:
+    """The selection bitmask of exhibition names. Raises ValueError for a name that is not an exhibition's: an id
+    interned for it here would be saved in the mask, but never with an exhibition."""
+    mask = 0
+    for n in names:
+        if n is None: continue
+        bit = exhibition_bit(n)
+        if not bit: raise ValueError(f"Unknown exhibition {n!r}")
+        mask |= bit
+    return mask
+
+
+def exhibition_names(mask: int) -> List[str]:
+    return [n for i, n in enumerate(_exhibition_names) if mask >> i & 1 and n is not None]
+
+
+def register_exhibitions(exhibitions) -> bool:
+    """Adopts the ids saved with loaded exhibitions; exhibitions saved before ids existed are interned in list
+    order. Must run before tickets are loaded. Returns True if any had no id (the files need rewriting)."""
+    legacy = False
+    for ex in exhibitions:
+        if getattr(ex, "ex_id", None) is None:
+            ex.ex_id = exhibition_id(ex.name)
+            legacy = True
+        else:
+            _assign(ex.name, ex.ex_id)
+    return legacy
+
+
+class Record:
+    """Base of the stored models: fixed __slots__ instead of a per-object __dict__.
+
+    The pickled state is a plain {field: value} dict, so objects written before the models were
+    slotted (whose state is their old __dict__) load through the same __setstate__, and the
+    property setters upgrade their old field formats on the way in.
+
+    Records read from a columnar snapshot may start as shells (see columnar.py): `_src` then says
+    where the rest of their row is, and the first read of an unset field fills them in."""
+    __slots__ = ("_src",)
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(s for c in reversed(cls.__mro__) for s in c.__dict__.get("__slots__", ())
+                            if s not in ("_src", "__weakref__"))
+
+    def __getattr__(self, name):
+        # Only called for unset slots (and names that do not exist), so it costs nothing once a record is filled
+        src = None if name.startswith("__") else _shell_source(self, None)
+        if src is None: raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        src[0].fill(self)
+        return getattr(self, name)
+
+    def __getstate__(self):
+        state = {}
+        for k in self._fields:
+            try: state[k] = getattr(self, k)
+            except AttributeError: pass
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple): state = {**(state[0] or {}), **state[1]}
+        for k, v in state.items(): setattr(self, k, v)
+
+
+def _shell_source(obj, default):
+    try:
+        return Record._src.__get__(obj)
+    except AttributeError:
+        return default
+
+
+class Workshop(Record):
+    __slots__ = ("workshop_id", "topic", "date", "start_time", "end_time", "exhibition_name", "capacity",
+                 "attendees_ids")
+
     def __init__(self, workshop_id: str, topic: str, date: str, start_time: str, end_time: str, exhibition_name: str,
                  capacity: int = 30):
         self.workshop_id = workshop_id
@@ -60,27 +224,66 @@ class Workshop:
     def get_seats_remaining(self) -> int:
         return self.capacity - len(self.attendees_ids)
 
+    @property
+    def day(self) -> int:
+        return workshop_day(self.date)
+
+    @property
+    def interval(self) -> Tuple[int, int]:
+        """(start, end) in minutes since day 1: date ordinal * MINUTES_PER_DAY + minute of the day."""
+        base = workshop_day(self.date) * MINUTES_PER_DAY
+        return base + day_minute(self.start_time), base + day_minute(self.end_time)
+
+
+class Exhibition(Record):
+    __slots__ = ("name", "location", "workshops", "ex_id")
 
-class Exhibition:
     def __init__(self, name: str, location: str):
         self.name = name
         self.location = location
+        self.ex_id = exhibition_id(name)
         self.workshops: List[Workshop] = []
 
     def add_workshop(self, ws: Workshop):
         self.workshops.append(ws)
 
 
-class Ticket:
+class Ticket(Record):
+    # selected_mask lives here (unset on All-Access passes) so the admin editor can turn any ticket into an
+    # Exhibition Pass in place
+    __slots__ = ("ticket_id", "attendee_id", "price", "ticket_type", "purchase_day", "selected_mask")
+
     def __init__(self, ticket_id: int, attendee_id: str, price: float, ticket_type: TicketType):
         self.ticket_id = ticket_id
         self.attendee_id = attendee_id
         self.price = price
         self.ticket_type = ticket_type
-        self.purchase_date = datetime.datetime.now().strftime("%d / %B / %Y")
+        self.purchase_day = _day(datetime.date.today())
+
+    @property
+    def purchase_date(self) -> str:
+        s = _formatted.get(self.purchase_day)
+        if s is None:
+            s = _formatted[self.purchase_day] = datetime.date.fromordinal(self.purchase_day).strftime(DATE_FORMAT)
+        return s
+
+    @purchase_date.setter
+    def purchase_date(self, value):
+        self.purchase_day = _day(value)
+
+    @property
+    def selected_exhibitions(self) -> List[str]:
+        """Names of the selected exhibitions (a new list: change selected_mask to change the selection)."""
+        return exhibition_names(self.selected_mask)
+
+    @selected_exhibitions.setter
+    def selected_exhibitions(self, names):
+        self.selected_mask = exhibition_mask(names)
 
 
 class ExhibitionPass(Ticket):
+    __slots__ = ()
+
     def __init__(self, ticket_id: int, attendee_id: str, price: float, selected_exhibitions: List[str]):
         super().__init__(ticket_id, attendee_id, price, TicketType.ExhibitionPass)
         self.selected_exhibitions = selected_exhibitions if isinstance(selected_exhibitions, list) else [
@@ -88,21 +291,45 @@ class ExhibitionPass(Ticket):
 
 
 class AllAccessPass(Ticket):
+    __slots__ = ()
+
     def __init__(self, ticket_id: int, attendee_id: str, price: float):
         super().__init__(ticket_id, attendee_id, price, TicketType.AllAccessPass)
 
 
-class Payment:
+class Payment(Record):
+    __slots__ = ("payment_id", "attendee_id", "amount", "method", "details", "paid_at")
+
     def __init__(self, payment_id: int, attendee_id: str, amount: float, method: PaymentMethod, details: str):
         self.payment_id = payment_id
         self.attendee_id = attendee_id
         self.amount = amount
         self.method = method
         self.details = details
-        self.timestamp = datetime.datetime.now()
+        self.paid_at = time.time()
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.paid_at)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime.datetime):
+        self.paid_at = value.timestamp()
 
+    @staticmethod
+    def mask(method: PaymentMethod, details: dict) -> str:
+        """Validates payment details (raises ValueError) and returns what is stored of them: never a full card number."""
+        if method in (PaymentMethod.CreditCard, PaymentMethod.DebitCard):
+            cn = details.get('card_number', '').strip()
+            if not cn.isdigit() or len(cn) != 16: raise ValueError("Card must be 16 digits")
+            return f"Card **{cn[-4:]}"
+        if not details.get('wallet_id'): raise ValueError("Wallet ID required")
+        return f"Wallet: {details.get('wallet_id')}"
+
+
+class Reservation(Record):
+    __slots__ = ("reservation_id", "attendee_id", "workshop_id", "status")
 
-class Reservation:
     def __init__(self, reservation_id: int, attendee_id: str, workshop_id: str, status: bool = True):
         self.reservation_id = reservation_id
         self.attendee_id = attendee_id
@@ -113,7 +340,22 @@ class Reservation:
         self.status = False
 
 
-class Attendee:
+class WaitlistEntry(Record):
+    """A place in a full workshop's queue. Entries are served by (priority, entry_id): lower priority first,
+    then in joining order; promoting or leaving removes the entry."""
+    __slots__ = ("entry_id", "workshop_id", "attendee_id", "priority")
+
+    def __init__(self, entry_id: int, workshop_id: str, attendee_id: str, priority: int = 1):
+        self.entry_id = entry_id
+        self.workshop_id = workshop_id
+        self.attendee_id = attendee_id
+        self.priority = priority
+
+
+class Attendee(Record):
+    # Weakly referenced by a disk-backed AttendeeRepository while in use (see repository.py)
+    __slots__ = ("attendee_id", "name", "email", "phone", "password", "tickets", "reservations", "__weakref__")
+
     def __init__(self, attendee_id: str, name: str, email: str, phone: str, password: str):
         self.attendee_id = attendee_id
         self.name = name
@@ -123,114 +365,193 @@ class Attendee:
         self.tickets: List[int] = []
         self.reservations: List[int] = []
 
+    @staticmethod
+    def validate(name: str, email: str, phone: str, password: str):
+        """The account field rules (raises ValueError), shared by register() and bulk imports."""
+        # 1. Check Empty Fields
+        if not all([name, email, phone, password]):
+            raise ValueError("All fields required")
+
+        # 2. Validate Email
+        if not EMAIL_PATTERN.match(email):
+            raise ValueError("Invalid Email")
+
+        # 3. Validate Phone (Must be 10 digits, start with 0)
+        if not (phone.isdigit() and len(phone) == 10 and phone.startswith('0')):
+            raise ValueError("Phone must be 10 digits starting with 0")
+
+        # 4. Validate Password Length
+        if len(password) < 8:
+            raise ValueError("Password min 8 chars")
+
+    @staticmethod
+    @timed("attendee.register")
+    def register(name: str, email: str, phone: str, password: str):
+        """Validates and stores a new account. Returns (attendee, None) or (None, error)."""
+        from storage import data_store
+        try:
+            Attendee.validate(name, email, phone, password)
+
+            with data_store.transaction():
+                # 5. Check Duplicate
+                if email in data_store.attendees:
+                    raise ValueError("Email already exists")
+
+                a = Attendee(f"U{data_store.next_id('attendees')}", name, email, phone, password)
+                data_store.add_attendee(a)
+            return a, None
+
+        except ValueError as e:
+            return None, str(e)
+
+    @timed("attendee.update_profile")
     def update_profile(self, new_name, new_email, new_phone, new_password):
         # Local import to prevent circular dependency
         from storage import data_store
 
-        if new_email != self.email and new_email in data_store.attendees:
-            return "Email already taken"
+        with data_store.transaction():
+            if new_email != self.email and new_email in data_store.attendees:
+                return "Email already taken"
 
-        if new_email != self.email:
-            del data_store.attendees[self.email]
-            self.email = new_email
-            data_store.attendees[self.email] = self
+            with data_store.modifying(self):
+                if new_email != self.email:
+                    old_email = self.email
+                    self.email = new_email
+                    data_store.rekey_attendee(self, old_email)
 
-        self.name = new_name
-        self.phone = new_phone
-        if new_password:
-            self.password = new_password
-        data_store.save_all()
+                self.name = new_name
+                self.phone = new_phone
+                if new_password:
+                    self.password = new_password
         return None
 
+    @timed("attendee.purchase_ticket")
     def purchase_ticket(self, ticket_type: TicketType, price: float, payment_method: PaymentMethod,
                         payment_details: dict, selected_exhibitions: List[str] = None):
         from storage import data_store
         try:
-            masked = "Wallet"
-            if payment_method in (PaymentMethod.CreditCard, PaymentMethod.DebitCard):
-                cn = payment_details.get('card_number', '').strip()
-                if not cn.isdigit() or len(cn) != 16: raise ValueError("Card must be 16 digits")
-                masked = f"Card **{cn[-4:]}"
-            else:
-                if not payment_details.get('wallet_id'): raise ValueError("Wallet ID required")
-                masked = f"Wallet: {payment_details.get('wallet_id')}"
-
-            pay = Payment(len(data_store.payments) + 1, self.attendee_id, price, payment_method, masked)
-            data_store.payments.append(pay)
-
-            tid = len(data_store.tickets) + 1
-            if ticket_type == TicketType.ExhibitionPass:
-                t = ExhibitionPass(tid, self.attendee_id, price, selected_exhibitions)
-            else:
-                t = AllAccessPass(tid, self.attendee_id, price)
-
-            data_store.tickets.append(t)
-            self.tickets.append(tid)
-            data_store.save_all()
+            masked = Payment.mask(payment_method, payment_details)
+
+            with data_store.transaction():
+                pay = Payment(data_store.next_id("payments"), self.attendee_id, price, payment_method, masked)
+                data_store.add_payment(pay)
+
+                tid = data_store.next_id("tickets")
+                if ticket_type == TicketType.ExhibitionPass:
+                    t = ExhibitionPass(tid, self.attendee_id, price, selected_exhibitions)
+                else:
+                    t = AllAccessPass(tid, self.attendee_id, price)
+
+                data_store.add_ticket(t)
+                with data_store.modifying(self):
+                    self.tickets.append(tid)
             return t, None
 
         except ValueError as e:
             return None, str(e)
 
+    @timed("attendee.refund_ticket")
     def refund_ticket(self, ticket_id: int):
         from storage import data_store
-        t = next((tk for tk in data_store.tickets if tk.ticket_id == ticket_id), None)
-        if not t: return "Not found"
-        act_res = [r for r in data_store.reservations if r.attendee_id == self.attendee_id and r.status]
-        for r in act_res:
-            self.cancel_reservation(r.reservation_id)
-        if ticket_id in self.tickets: self.tickets.remove(ticket_id)
-        if t in data_store.tickets: data_store.tickets.remove(t)
-        data_store.save_all()
+        with data_store.transaction():
+            t = data_store.get_ticket(ticket_id)
+            if not t: return "Not found"
+            act_res = data_store.reservations_for(self.attendee_id, active_only=True)
+            for r in act_res:
+                self.cancel_reservation(r.reservation_id)
+            with data_store.modifying(self):
+                if ticket_id in self.tickets: self.tickets.remove(ticket_id)
+            data_store.remove_ticket(t)
         return None
 
+    @timed("attendee.upgrade_ticket")
     def upgrade_ticket(self, ticket_id: int, new_access: TicketType, cost: float, adds: List[str] = None):
         from storage import data_store
-        t = next((tk for tk in data_store.tickets if tk.ticket_id == ticket_id), None)
-        if not t: return None, "Not found"
-
-        if new_access == TicketType.ExhibitionPass and isinstance(t, ExhibitionPass):
-            if adds:
-                for x in adds:
-                    if x not in t.selected_exhibitions: t.selected_exhibitions.append(x)
-                t.price += cost
-            else:
-                return None, "No exhibitions added"
-        elif new_access == TicketType.AllAccessPass:
-            idx = data_store.tickets.index(t)
-            up = AllAccessPass(t.ticket_id, t.attendee_id, 500.0)
-            data_store.tickets[idx] = up
-            t = up
-        data_store.save_all()
-        return t, None
+        try:
+            with data_store.transaction():
+                t = data_store.get_ticket(ticket_id)
+                if not t: return None, "Not found"
+
+                if new_access == TicketType.ExhibitionPass and isinstance(t, ExhibitionPass):
+                    if adds:
+                        with data_store.modifying(t):
+                            t.selected_mask |= exhibition_mask(adds)
+                            t.price += cost
+                    else:
+                        return None, "No exhibitions added"
+                elif new_access == TicketType.AllAccessPass:
+                    up = AllAccessPass(t.ticket_id, t.attendee_id, ALL_ACCESS_PRICE)
+                    data_store.replace_ticket(t, up)
+                    t = up
+            return t, None
+        except ValueError as e:
+            return None, str(e)
 
+    @timed("attendee.reserve_workshop")
     def reserve_workshop(self, workshop_id: str):
         from storage import data_store
-        ws = data_store.workshops.get(workshop_id)
-        if not ws: return None, "Workshop not found"
-        if not self.can_access(ws.exhibition_name): return None, f"You don't have a ticket for {ws.exhibition_name}"
-        if not ws.add_attendee(self.attendee_id): return None, "Workshop Full or already booked"
+        try:
+            with data_store.transaction():
+                ws = data_store.workshops.get(workshop_id)
+                if not ws: raise ValueError("Workshop not found")
+                if not self.can_access(ws.exhibition_name):
+                    raise ValueError(f"You don't have a ticket for {ws.exhibition_name}")
+                clash = data_store.schedule.clash(self.attendee_id, workshop_id)
+                if clash:
+                    raise ValueError(f"Clashes with {clash.topic} ({clash.date}, {clash.start_time}-{clash.end_time})")
+                if not data_store.reserve_seat(workshop_id, self.attendee_id):
+                    raise ValueError("Workshop Full or already booked")
+
+                res = Reservation(data_store.next_id("reservations"), self.attendee_id, workshop_id)
+                data_store.add_reservation(res)
+            return res, None
+        except ValueError as e:
+            return None, str(e)
 
-        res = Reservation(len(data_store.reservations) + 1, self.attendee_id, workshop_id)
-        data_store.reservations.append(res)
-        data_store.save_all()
-        return res, None
+    @timed("attendee.join_waitlist")
+    def join_waitlist(self, workshop_id: str):
+        """Queues for a full workshop; a freed seat is then reserved automatically. Returns (entry, error)."""
+        from storage import data_store
+        try:
+            with data_store.transaction():
+                ws = data_store.workshops.get(workshop_id)
+                if not ws: raise ValueError("Workshop not found")
+                if not self.can_access(ws.exhibition_name):
+                    raise ValueError(f"You don't have a ticket for {ws.exhibition_name}")
+                if data_store.active_reservation(workshop_id, self.attendee_id): raise ValueError("Already booked")
+                if data_store.waitlist_entry(workshop_id, self.attendee_id): raise ValueError("Already on the waitlist")
+                if not ws.is_full(): raise ValueError("Seats are available, reserve one instead")
+                clash = data_store.schedule.clash(self.attendee_id, workshop_id)
+                if clash: raise ValueError(f"Clashes with {clash.topic} ({clash.date}, {clash.start_time}-{clash.end_time})")
+
+                first = WAITLIST_ALL_ACCESS_FIRST and data_store.entitlement(self) == ALL_EXHIBITIONS
+                e = WaitlistEntry(data_store.next_waitlist_id(), workshop_id, self.attendee_id, 0 if first else 1)
+                data_store.add_waitlist_entry(e)
+            return e, None
+        except ValueError as e:
+            return None, str(e)
+
+    @timed("attendee.leave_waitlist")
+    def leave_waitlist(self, workshop_id: str):
+        from storage import data_store
+        with data_store.transaction():
+            e = data_store.waitlist_entry(workshop_id, self.attendee_id)
+            if not e: return "Not on the waitlist"
+            data_store.remove_waitlist_entry(e)
+        return None
 
+    @timed("attendee.cancel_reservation")
     def cancel_reservation(self, rid):
         from storage import data_store
-        r = next((x for x in data_store.reservations if x.reservation_id == rid), None)
-        if not r or not r.status: return "Invalid"
-        ws = data_store.workshops.get(r.workshop_id)
-        if ws: ws.remove_attendee(self.attendee_id)
-        r.cancel()
-        data_store.save_all()
+        with data_store.transaction():
+            r = data_store.get_reservation(rid)
+            if not r or not r.status: return "Invalid"
+            data_store.release_seat(r.workshop_id, self.attendee_id)
+            with data_store.modifying(r):
+                r.cancel()
         return None
 
     def can_access(self, ex_name):
         from storage import data_store
-        for tid in self.tickets:
-            t = next((x for x in data_store.tickets if x.ticket_id == tid), None)
-            if t:
-                if t.ticket_type == TicketType.AllAccessPass: return True
-                if hasattr(t, 'selected_exhibitions') and ex_name in t.selected_exhibitions: return True
-        return False
\ No newline at end of file
+        mask = data_store.entitlement(self)
+        return mask == ALL_EXHIBITIONS or bool(mask & exhibition_bit(ex_name))
\ No newline at end of file
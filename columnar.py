@@ -0,0 +1,416 @@
+import gc
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from itertools import accumulate, compress, islice, repeat
+from classes import (Record, _shell_source, Attendee, Ticket, ExhibitionPass, AllAccessPass, Payment, Reservation,
+                     WaitlistEntry, TicketType, PaymentMethod)
+
+# ==========================================
+# COLUMNAR SNAPSHOTS (STORAGE_CONFIG["snapshot_format"] = "columnar")
+# ==========================================
+#
+# A store is written as one typed column per field, cut into chunks of CHUNK_ROWS rows. Every chunk is compressed
+# and checksummed on its own, and a JSON footer at the end of the file says where each one is:
+#
+#   MAGIC | chunk | chunk | ... | footer | footer length (8 bytes) | footer crc32 (4 bytes) | MAGIC
+#
+#   int, float, bool   little-endian int64 / float64 / int8
+#   str                the values joined by "\0" (strjson: a JSON array, when a value contains "\0")
+#   dict               the chunk's distinct strings once, then one index per row
+#   enum, class        positions in the member / class names listed in the footer
+#   ints               lists of ints: one length per row, then all the values
+#   obj                pickled values, for a chunk whose values do not fit the declared type (old records)
+#
+# A chunk of a column with unset fields (All-Access passes have no selected_mask) starts with one presence byte
+# per row. The file is memory-mapped: a chunk is only read and decompressed when one of its rows is needed.
+#
+# LAZY stores (attendees, payments) load as shells: records holding only their KEYS, which decode the rest of their
+# row the first time another field is read (see Record.__getattr__). The other stores are read in full by
+# DataStore._reindex() at startup anyway, so they are built in one pass.
+#
+# dump(index=True) also writes, after the columns, a sorted index of each of the schema's INDEX fields: chunks of
+# INDEX_CHUNK_KEYS (key, row number) pairs, the first key of each listed in the footer. Table.find() then reaches a
+# row by reading one index chunk and Table.get() builds it from one chunk of the columns, which is how the attendees
+# are read record by record when they are kept on disk (see repository.py).
+
+MAGIC = b"GWCOL1\r\n"
+SUFFIX = ".col"
+CHUNK_ROWS = 16384
+# Smaller chunks for files read record by record: a lookup decodes one chunk of each column
+INDEXED_CHUNK_ROWS = 2048
+INDEX_CHUNK_KEYS = 4096
+# Decoded chunks Table.find() / get() keep, most recently used first out
+RECENT_CHUNKS = 8
+COMPRESSION = 6
+# Windows cannot replace a file that is mapped, and another terminal may compact while we still read shells
+MAP = os.name != "nt"
+
+SCHEMAS = {
+    "attendees": {"classes": (Attendee,), "key": "email", "keys": ("attendee_id", "email"), "lazy": True,
+                  "index": ("email", "attendee_id"),
+                  "columns": (("attendee_id", "str"), ("name", "str"), ("email", "str"), ("phone", "str"),
+                              ("password", "dict"), ("tickets", "ints"), ("reservations", "ints"))},
+    "tickets": {"classes": (Ticket, ExhibitionPass, AllAccessPass), "key": None, "keys": ("ticket_id",),
+                "lazy": False,
+                "columns": (("ticket_id", "int"), ("attendee_id", "str"), ("price", "float"),
+                            ("ticket_type", TicketType), ("purchase_day", "int"), ("selected_mask", "int"))},
+    "payments": {"classes": (Payment,), "key": None, "keys": ("payment_id",), "lazy": True,
+                 "columns": (("payment_id", "int"), ("attendee_id", "str"), ("amount", "float"),
+                             ("method", PaymentMethod), ("details", "dict"), ("paid_at", "float"))},
+    "reservations": {"classes": (Reservation,), "key": None, "keys": ("reservation_id",), "lazy": False,
+                     "columns": (("reservation_id", "int"), ("attendee_id", "str"), ("workshop_id", "dict"),
+                                 ("status", "bool"))},
+    "waitlist": {"classes": (WaitlistEntry,), "key": "entry_id", "keys": ("entry_id",), "lazy": False,
+                 "columns": (("entry_id", "int"), ("workshop_id", "dict"), ("attendee_id", "str"),
+                             ("priority", "int"))},
+}
+
+_MISSING = object()
+# Stored for unset fields, under the presence bytes
+_PLACEHOLDERS = {"int": 0, "float": 0.0, "bool": False, "str": "", "dict": "", "ints": []}
+_set_source = Record._src.__set__
+_unshell = Record._src.__delete__
+_BIG = sys.byteorder == "big"
+
+
+# ---------- encoding ----------
+
+def _array(code, values):
+    a = array(code, values)
+    if _BIG: a.byteswap()
+    return a.tobytes()
+
+
+def _from_array(code, data):
+    a = array(code)
+    a.frombytes(data)
+    if _BIG: a.byteswap()
+    return a
+
+
+def _strings(values):
+    s = "\0".join(values)
+    if s.count("\0") != len(values) - 1: return "strjson", [json.dumps(values).encode()]
+    return "str", [s.encode("utf-8", "surrogatepass")]
+
+
+def _codes(n):
+    return "B" if n <= 0xFF else "H" if n <= 0xFFFF else "I"
+
+
+def _encode(kind, values, members):
+    """(type, payload parts) of one chunk of a column. Raises TypeError / ValueError / KeyError if a value does
+    not fit `kind`."""
+    if kind == "int": return "int", [_array("q", values)]
+    if kind == "float": return "float", [_array("d", values)]
+    if kind == "bool": return "bool", [bytes(1 if v else 0 for v in values)]
+    if kind in ("str", "dict") and not all(type(v) is str for v in values): raise TypeError("not a str")
+    if kind == "str": return _strings(values)
+    if kind == "dict":
+        index = {}
+        codes = [index.setdefault(v, len(index)) for v in values]
+        t, parts = _strings(list(index))
+        return "dict", [t.encode(), *parts, _array(_codes(len(index)), codes)]
+    if kind == "ints":
+        return "ints", [_array("I", map(len, values)), _array("q", (i for v in values for i in v))]
+    pos = {m: i for i, m in enumerate(members)}
+    return "enum", [_array(_codes(len(pos)), (pos[v] for v in values))]
+
+
+def _pack(parts):
+    return struct.pack(f"<B{len(parts)}Q", len(parts), *map(len, parts)) + b"".join(parts)
+
+
+def _unpack(data):
+    n = data[0]
+    sizes = struct.unpack_from(f"<{n}Q", data, 1)
+    parts, at = [], 1 + 8 * n
+    for size in sizes:
+        parts.append(data[at:at + size])
+        at += size
+    return parts
+
+
+def _decode_strings(t, data):
+    if t == "strjson": return json.loads(data)
+    return data.decode("utf-8", "surrogatepass").split("\0")
+
+
+def _decode(t, parts, n, members):
+    if t == "int": return _from_array("q", parts[0]).tolist()
+    if t == "float": return _from_array("d", parts[0]).tolist()
+    if t == "bool": return list(map(bool, parts[0]))
+    if t in ("str", "strjson"): return _decode_strings(t, parts[0]) if n else []
+    if t == "dict":
+        table = _decode_strings(parts[0].decode(), parts[1])
+        return list(map(table.__getitem__, _from_array(_codes(len(table)), parts[2])))
+    if t == "ints": return _Lists(_from_array("I", parts[0]), _from_array("q", parts[1]))
+    if t in ("enum", "class"): return list(map(members.__getitem__, _from_array(_codes(len(members)), parts[0])))
+    return pickle.loads(parts[0])
+
+
+def _slot_value(cls, name, obj):
+    try:
+        return getattr(cls, name).__get__(obj)
+    except AttributeError:
+        return _MISSING
+
+
+class _Lists:
+    """The rows of an ints column, each made a list only when asked for."""
+    __slots__ = ("flat", "ends")
+
+    def __init__(self, lengths, flat):
+        self.flat, self.ends = flat, [0, *accumulate(lengths)]
+
+    def __getitem__(self, j):
+        return self.flat[self.ends[j]:self.ends[j + 1]].tolist()
+
+    def __len__(self):
+        return len(self.ends) - 1
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+def dump(store, records, f, chunk_rows=CHUNK_ROWS, index=False):
+    """Writes `records` (the store's list, or anything with its records as values()) to the binary file f, reading
+    them once, a chunk at a time. index=True adds the sorted indexes of the schema's "index" fields. Raises
+    ValueError for a record of a class the store's schema does not know."""
+    schema = SCHEMAS[store]
+    rows = iter(records.values() if hasattr(records, "values") else records)
+    keys = {name: [] for name in schema["index"]} if index else {}
+    names = [c.__name__ for c in schema["classes"]]
+    classes = {c: i for i, c in enumerate(schema["classes"])}
+    columns = [{"name": "__class__", "type": "class", "members": names, "chunks": []}]
+    for name, kind in schema["columns"]:
+        col = {"name": name, "type": kind if isinstance(kind, str) else "enum", "chunks": []}
+        if not isinstance(kind, str): col["members"] = [m.name for m in kind]
+        columns.append(col)
+    at = f.write(MAGIC)
+    n = 0
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk: break
+        # Shells must be filled before their source file is replaced
+        for o in chunk:
+            src = _shell_source(o, None)
+            if src is not None: src[0].fill(o)
+        for col, (name, kind) in zip(columns, (("__class__", None),) + schema["columns"]):
+            if name == "__class__":
+                try:
+                    values = [classes[type(o)] for o in chunk]
+                except KeyError as e:
+                    raise ValueError(f"{store}: cannot store a {e.args[0].__name__} in columns") from None
+                t, parts, present = "class", [_array(_codes(len(classes)), values)], None
+            else:
+                values = [getattr(o, name, _MISSING) for o in chunk]
+                present = None
+                if any(v is _MISSING for v in values):
+                    present = bytes(0 if v is _MISSING else 1 for v in values)
+                    fill = _PLACEHOLDERS[kind] if isinstance(kind, str) else next(iter(kind))
+                    values = [fill if v is _MISSING else v for v in values]
+                try:
+                    t, parts = _encode(kind, values, list(kind) if not isinstance(kind, str) else None)
+                except (TypeError, ValueError, KeyError, OverflowError):
+                    t, parts = "obj", [pickle.dumps(values, pickle.HIGHEST_PROTOCOL)]
+            if present is not None: parts = [present] + parts
+            data = zlib.compress(_pack(parts), COMPRESSION)
+            col["chunks"].append([t, at, len(data), zlib.crc32(data), present is not None])
+            at += f.write(data)
+        for name, values in keys.items(): values += [getattr(o, name) for o in chunk]
+        n += len(chunk)
+    indexes = {}
+    for name, values in keys.items():
+        order = sorted(range(n), key=values.__getitem__)
+        chunks = indexes[name] = []
+        for start in range(0, n, INDEX_CHUNK_KEYS):
+            rows_ = order[start:start + INDEX_CHUNK_KEYS]
+            t, parts = _strings([values[i] for i in rows_])
+            data = zlib.compress(_pack([t.encode(), *parts, _array("q", rows_)]), COMPRESSION)
+            chunks.append([values[rows_[0]], at, len(data), zlib.crc32(data)])
+            at += f.write(data)
+    footer = json.dumps({"store": store, "rows": n, "chunk_rows": chunk_rows, "columns": columns,
+                         "indexes": indexes}).encode()
+    f.write(footer + struct.pack("<QI", len(footer), zlib.crc32(footer)) + MAGIC)
+
+
+# ---------- reading ----------
+
+class Table:
+    """An open columnar snapshot. Keeps the file mapped while some of its rows are shells."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if MAP else f.read()
+        tail = len(MAGIC) + 12
+        if len(self._buf) < len(MAGIC) + tail or self._buf[:len(MAGIC)] != MAGIC or self._buf[-len(MAGIC):] != MAGIC:
+            raise ValueError(f"{path} is not a columnar snapshot")
+        size, crc = struct.unpack_from("<QI", self._buf, len(self._buf) - tail)
+        footer = self._buf[len(self._buf) - tail - size:len(self._buf) - tail]
+        if zlib.crc32(footer) != crc: raise ValueError(f"{path}: footer checksum mismatch")
+        meta = json.loads(footer)
+        self.store, self.rows, self.chunk_rows = meta["store"], meta["rows"], meta["chunk_rows"]
+        schema = SCHEMAS[self.store]
+        self.schema = schema
+        self.columns = meta["columns"]
+        kinds = dict(schema["columns"])
+        for col in self.columns:
+            if col["type"] == "class":
+                known = {c.__name__: c for c in schema["classes"]}
+                col["members"] = [known[n] for n in col["members"]]
+            elif col["type"] == "enum":
+                col["members"] = [kinds[col["name"]][n] for n in col["members"]]
+        # Indexed field -> [[first key, offset, size, crc32] of each index chunk], see find()
+        self.indexes = meta.get("indexes", {})
+        self._firsts = {name: [c[0] for c in chunks] for name, chunks in self.indexes.items()}
+        # Chunk -> its decoded columns, while some of its rows are shells; and how many shells each chunk has left
+        self._decoded = {}
+        self._left = {}
+        # The chunks find() and get() decoded last: chunk number -> columns, (field, index chunk) -> (keys, rows)
+        self._recent = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _chunk_rows(self, c):
+        return min(self.chunk_rows, self.rows - c * self.chunk_rows)
+
+    def _column(self, col, c):
+        """(values, presence bytes or None) of chunk c of a column."""
+        t, at, size, crc, nullable = col["chunks"][c]
+        data = self._buf[at:at + size]
+        if zlib.crc32(data) != crc: raise ValueError(f"{self.path}: checksum mismatch in {col['name']}, chunk {c}")
+        parts = _unpack(zlib.decompress(data))
+        present = parts.pop(0) if nullable else None
+        return _decode(t, parts, self._chunk_rows(c), col.get("members")), present
+
+    def decode(self, c, names=None):
+        """[(field name, values, presence)] of chunk c, every column or only `names` (the class column first)."""
+        return [(col["name"], *self._column(col, c)) for col in self.columns
+                if names is None or col["name"] == "__class__" or col["name"] in names]
+
+    def _build(self, c, names):
+        """The rows of chunk c as new records with the `names` fields set (every field if None). The fields are set
+        column by column through the slots, without a Python-level loop over the rows."""
+        (_, classes, _), *fields = self.decode(c, names)
+        objs = list(map(object.__new__, classes))
+        base = self.schema["classes"][0]
+        for name, values, present in fields:
+            if present is not None: objs_, values = compress(objs, present), compress(values, present)
+            else: objs_ = objs
+            deque(map(getattr(base, name).__set__, objs_, values), 0)
+        return objs
+
+    def _chunks(self):
+        return range((self.rows + self.chunk_rows - 1) // self.chunk_rows)
+
+    def scan(self, names=None):
+        """Every row as a new record with the `names` fields set (every field if None), built a chunk at a time."""
+        for c in self._chunks(): yield from self._build(c, names)
+
+    def _cached(self, key, read):
+        with self._lock:
+            value = self._recent.get(key)
+            if value is None:
+                value = self._recent[key] = read()
+                if len(self._recent) > RECENT_CHUNKS: self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(key)
+            return value
+
+    def _index_chunk(self, name, i):
+        """(sorted keys, row numbers) of chunk i of the index of field `name`."""
+        _, at, size, crc = self.indexes[name][i]
+        data = self._buf[at:at + size]
+        if zlib.crc32(data) != crc: raise ValueError(f"{self.path}: checksum mismatch in the {name} index, chunk {i}")
+        t, keys, rows = _unpack(zlib.decompress(data))
+        return _decode_strings(t.decode(), keys), _from_array("q", rows)
+
+    def find(self, name, key):
+        """Row number of a record whose field `name` (one of the indexed fields) is `key`, or None."""
+        i = bisect_right(self._firsts[name], key) - 1
+        if i < 0: return None
+        keys, rows = self._cached((name, i), lambda: self._index_chunk(name, i))
+        j = bisect_left(keys, key)
+        return rows[j] if j < len(keys) and keys[j] == key else None
+
+    def get(self, row):
+        """Row number `row` as a new complete record."""
+        c, j = divmod(row, self.chunk_rows)
+        (_, classes, _), *fields = self._cached(c, lambda: self.decode(c))
+        obj = object.__new__(classes[j])
+        base = self.schema["classes"][0]
+        for name, values, present in fields:
+            if present is None or present[j]: getattr(base, name).__set__(obj, values[j])
+        return obj
+
+    def keys(self, name):
+        """Every value of indexed field `name`, in sorted order."""
+        for i in range(len(self.indexes[name])): yield from self._index_chunk(name, i)[0]
+
+    def records(self):
+        """Every row as a complete record."""
+        out = []
+        for c in self._chunks(): out += self._build(c, None)
+        self.close()
+        return out
+
+    def shells(self):
+        """Every row as a shell: a record with only the schema's key fields set, see fill()."""
+        out = []
+        for c in self._chunks():
+            objs = self._build(c, self.schema["keys"])
+            first = c * self.chunk_rows
+            deque(map(_set_source, objs, zip(repeat(self), range(first, first + len(objs)))), 0)
+            self._left[c] = len(objs)
+            out += objs
+        if not out: self.close()
+        return out
+
+    def fill(self, obj):
+        """Sets the fields of shell `obj` that are still unset from its row, and makes it an ordinary record."""
+        with self._lock:
+            src = _shell_source(obj, None)
+            if src is None or src[0] is not self: return
+            c, j = divmod(src[1], self.chunk_rows)
+            fields = self._decoded.get(c)
+            if fields is None: fields = self._decoded[c] = self.decode(c)[1:]
+            cls = type(obj)
+            for name, values, present in fields:
+                if present is not None and not present[j]: continue
+                # Fields set since it was loaded keep their new value
+                if _slot_value(cls, name, obj) is _MISSING: getattr(cls, name).__set__(obj, values[j])
+            _unshell(obj)
+            self._left[c] -= 1
+            if not self._left[c]:
+                del self._left[c]
+                self._decoded.pop(c, None)
+                if not self._left: self.close()
+
+    def close(self):
+        buf, self._buf = self._buf, None
+        if MAP and buf is not None: buf.close()
+
+
+def load(path):
+    """Reads a columnar snapshot back as what DataStore keeps for its store (a dict for attendees and the waitlist,
+    a list otherwise). Raises ValueError if the file is damaged."""
+    # Records cannot form reference cycles: keep the collector from walking the growing heap over and over
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        table = Table(path)
+        records = table.shells() if table.schema["lazy"] else table.records()
+        key = table.schema["key"]
+        return {getattr(o, key): o for o in records} if key else records
+    finally:
+        if collecting: gc.enable()
@@ -0,0 +1,72 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from enum import Enum
+
+
+class Change(Enum):
+    TICKET_PURCHASED = 1
+    TICKET_REFUNDED = 2
+    # Upgrades, and any other in-place change to a ticket (admin modify)
+    TICKET_UPGRADED = 3
+    RESERVATION_CREATED = 4
+    RESERVATION_CANCELLED = 5
+    ATTENDEE_REGISTERED = 6
+    ATTENDEE_UPDATED = 7
+    ATTENDEE_DELETED = 8
+    # Seats or capacity of a workshop changed
+    WORKSHOP_UPDATED = 9
+    # Someone joined or left a waitlist, or was promoted from it (obj is the WaitlistEntry)
+    WAITLIST_UPDATED = 10
+    # Everything was reloaded from disk: views should re-read all their data
+    RELOADED = 11
+
+
+class ChangeEvent:
+    """One committed change. `obj` is the live record (for deletions, the record as it was);
+    `remote` is True when the change was committed by another terminal."""
+    __slots__ = ("kind", "obj", "remote")
+
+    def __init__(self, kind: Change, obj=None, remote: bool = False):
+        self.kind = kind
+        self.obj = obj
+        self.remote = remote
+
+    def __repr__(self):
+        return f"ChangeEvent({self.kind.name}, {self.obj!r}, remote={self.remote})"
+
+
+class EventBus:
+    """Delivers ChangeEvents to subscribers, synchronously, on the thread that committed them."""
+
+    def __init__(self):
+        self._subs = defaultdict(list)
+        self._local = threading.local()
+
+    def subscribe(self, fn, *kinds):
+        """Calls fn(event) for the given kinds (every kind if none given). Returns an unsubscribe function."""
+        keys = kinds or (None,)
+        for k in keys: self._subs[k].append(fn)
+
+        def unsubscribe():
+            for k in keys:
+                if fn in self._subs[k]: self._subs[k].remove(fn)
+        return unsubscribe
+
+    @contextmanager
+    def deferred(self):
+        """Collects what the calling thread publishes into the yielded list instead of delivering it,
+        for code running off the UI thread to hand the events over later."""
+        held = self._local.held = []
+        try:
+            yield held
+        finally:
+            self._local.held = None
+
+    def publish(self, events):
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            held.extend(events)
+            return
+        for e in events:
+            for fn in self._subs.get(e.kind, []) + self._subs.get(None, []): fn(e)
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import datetime
+import json
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from aggregates import ticket_label
+from classes import TicketType, ALL_EXHIBITIONS, exhibition_bit
+from storage import data_store
+
+# ==========================================
+# STREAMING EXPORT (orders, payments and reservations for reporting)
+# ==========================================
+#
+#   python export.py orders|payments|reservations [-o FILE] [--format csv|jsonl|columns|parquet]
+#                    [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--exhibition NAME]
+#
+# Rows are generated one at a time and written as they come, so memory stays flat however many there are (the
+# columnar formats hold one chunk of CHUNK_ROWS rows). Each export reads a data_store.read_view() (see readview.py),
+# so it writes the records as they were when it started, however long it takes and whatever is bought or booked
+# meanwhile. Attendees kept on disk (STORAGE_CONFIG["attendee_cache"]) are read in one pass for the export, as one
+# lookup per row would read a chunk of the file each time. Filters:
+#
+#   orders         purchase date; tickets giving access to the exhibition (All-Access passes included)
+#   payments       payment date; payments of attendees whose tickets give access to the exhibition
+#   reservations   workshop date; workshops of the exhibition
+#
+# "columns" writes one JSON object per chunk ({"rows": n, "columns": {name: [values]}}); "parquet" writes a
+# Parquet file with one row group per chunk and needs pyarrow.
+
+FORMATS = ("csv", "jsonl", "columns", "parquet")
+CHUNK_ROWS = 65536
+
+COLUMNS = {
+    "orders": ("ticket_id", "purchase_date", "attendee_id", "email", "name", "ticket", "exhibitions", "price"),
+    "payments": ("payment_id", "paid_at", "attendee_id", "email", "amount", "method", "details"),
+    "reservations": ("reservation_id", "attendee_id", "email", "workshop_id", "topic", "exhibition", "date",
+                     "start_time", "end_time", "active"),
+}
+
+
+def _days(since, until):
+    return (since.toordinal() if since else None), (until.toordinal() if until else None)
+
+
+def _in(day, lo, hi):
+    return (lo is None or day >= lo) and (hi is None or day <= hi)
+
+
+def _iso(cache, day):
+    s = cache.get(day)
+    if s is None: s = cache[day] = datetime.date.fromordinal(day).isoformat()
+    return s
+
+
+def _entitlements(view):
+    """attendee_id -> exhibition bitmask of their tickets in `view`, as DataStore.entitlement() computes it."""
+    masks = defaultdict(int)
+    for t in view.records("tickets"):
+        if t.ticket_type == TicketType.AllAccessPass: masks[t.attendee_id] = ALL_EXHIBITIONS
+        else: masks[t.attendee_id] |= getattr(t, "selected_mask", 0)
+    return masks
+
+
+def _bit(exhibition):
+    if exhibition is None: return None
+    if not any(ex.name == exhibition for ex in data_store.exhibitions): raise ValueError(f"No exhibition {exhibition!r}")
+    return exhibition_bit(exhibition)
+
+
+def orders(since=None, until=None, exhibition=None):
+    lo, hi = _days(since, until)
+    bit, dates = _bit(exhibition), {}
+    with data_store.read_view() as view:
+        view.load_attendees()
+        for t in view.records("tickets"):
+            if not _in(t.purchase_day, lo, hi): continue
+            all_access = t.ticket_type == TicketType.AllAccessPass
+            if bit is not None and not all_access and not getattr(t, "selected_mask", 0) & bit: continue
+            a = view.attendee(t.attendee_id)
+            yield (t.ticket_id, _iso(dates, t.purchase_day), t.attendee_id, a.email if a else "", a.name if a else "",
+                   ticket_label(t), [] if all_access else list(getattr(t, "selected_exhibitions", None) or []),
+                   t.price)
+
+
+def payments(since=None, until=None, exhibition=None):
+    lo, hi = _days(since, until)
+    bit = _bit(exhibition)
+    with data_store.read_view() as view:
+        view.load_attendees()
+        masks = _entitlements(view) if bit is not None else None
+        for p in view.records("payments"):
+            paid = datetime.datetime.fromtimestamp(p.paid_at)
+            if not _in(paid.toordinal(), lo, hi): continue
+            a = view.attendee(p.attendee_id)
+            if bit is not None:
+                mask = masks.get(p.attendee_id, 0) if a else 0
+                if mask != ALL_EXHIBITIONS and not mask & bit: continue
+            yield (p.payment_id, paid.isoformat(timespec="seconds"), p.attendee_id, a.email if a else "", p.amount,
+                   p.method.name, p.details)
+
+
+def reservations(since=None, until=None, exhibition=None):
+    lo, hi = _days(since, until)
+    _bit(exhibition)
+    with data_store.read_view() as view:
+        view.load_attendees()
+        workshops = view.workshops()
+        # The filters only depend on the workshop: decide them once per workshop
+        wanted = {wid for wid, ws in workshops.items()
+                  if _in(ws.day, lo, hi) and exhibition in (None, ws.exhibition_name)}
+        for r in view.records("reservations"):
+            if r.workshop_id not in wanted: continue
+            ws, a = workshops[r.workshop_id], view.attendee(r.attendee_id)
+            yield (r.reservation_id, r.attendee_id, a.email if a else "", r.workshop_id, ws.topic, ws.exhibition_name,
+                   datetime.date.fromordinal(ws.day).isoformat(), ws.start_time, ws.end_time, bool(r.status))
+
+
+ROWS = {"orders": orders, "payments": payments, "reservations": reservations}
+
+
+# ---------- writers ----------
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+
+def write_csv(f, columns, rows):
+    w = csv.writer(f)
+    w.writerow(columns)
+    w.writerows([";".join(v) if isinstance(v, list) else v for v in row] for row in rows)
+
+
+def write_jsonl(f, columns, rows):
+    f.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def write_columns(f, columns, rows, chunk_size=CHUNK_ROWS):
+    for chunk in _chunks(rows, chunk_size):
+        f.write(json.dumps({"rows": len(chunk), "columns": dict(zip(columns, map(list, zip(*chunk))))}) + "\n")
+
+
+def write_parquet(path, columns, rows, chunk_size=CHUNK_ROWS):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("The parquet format needs pyarrow (pip install pyarrow); --format columns needs nothing")
+    writer = None
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            table = pa.Table.from_pydict(dict(zip(columns, map(list, zip(*chunk)))))
+            if writer is None: writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None: writer.close()
+
+
+def _counted(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+@contextmanager
+def _open(path):
+    if path in (None, "-"):
+        yield sys.stdout
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f: yield f
+
+
+def export(dataset, path=None, fmt="csv", since=None, until=None, exhibition=None, chunk_size=CHUNK_ROWS):
+    """Writes one dataset (orders, payments or reservations) to path (stdout if None) and returns the number of
+    rows written. since / until are datetime.dates, both included. Raises ValueError for bad arguments."""
+    if dataset not in ROWS: raise ValueError(f"Unknown dataset {dataset!r} (one of {', '.join(ROWS)})")
+    if fmt not in FORMATS: raise ValueError(f"Unknown format {fmt!r} (one of {', '.join(FORMATS)})")
+    _bit(exhibition)
+    count = [0]
+    rows = _counted(ROWS[dataset](since, until, exhibition), count)
+    columns = COLUMNS[dataset]
+    if fmt == "parquet":
+        if path in (None, "-"): raise ValueError("The parquet format needs an output file")
+        write_parquet(path, columns, rows, chunk_size)
+    else:
+        with _open(path) as f:
+            if fmt == "csv": write_csv(f, columns, rows)
+            elif fmt == "jsonl": write_jsonl(f, columns, rows)
+            else: write_columns(f, columns, rows, chunk_size)
+    return count[0]
+
+
+if __name__ == "__main__":
+    day = lambda s: datetime.date.fromisoformat(s)
+    ap = argparse.ArgumentParser(description="Streaming export of orders, payments and reservations")
+    ap.add_argument("dataset", choices=list(ROWS))
+    ap.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    ap.add_argument("--format", default="csv", choices=FORMATS)
+    ap.add_argument("--since", type=day, help="first day included (YYYY-MM-DD)")
+    ap.add_argument("--until", type=day, help="last day included (YYYY-MM-DD)")
+    ap.add_argument("--exhibition", help="only rows for this exhibition")
+    args = ap.parse_args()
+
+    data_store.load_all()
+    try:
+        n = export(args.dataset, args.output, args.format, args.since, args.until, args.exhibition)
+    except ValueError as e:
+        sys.exit(str(e))
+    if args.output != "-": print(f"{n} rows written to {args.output}")
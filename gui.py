@@ -1,9 +1,15 @@
+import datetime
+import threading
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-import re
-from collections import defaultdict
-from classes import TicketType, PaymentMethod, AppState, Attendee, ExhibitionPass, AllAccessPass
-from storage import data_store
+from collections import OrderedDict, deque
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from classes import (TicketType, PaymentMethod, AppState, Attendee, ExhibitionPass, AllAccessPass, DATE_FORMAT,
+                     workshop_day, BUNDLE_PRICES, ALL_ACCESS_PRICE, EXHIBITION_ADD_COST)
+from events import Change
+from storage import data_store, STORAGE_CONFIG
+from metrics import timed
+import export
 
 # ==========================================
 # ASSETS & CONFIGURATION
@@ -34,6 +40,16 @@ def add_bg(widget):
     widget.configure(bg=COLORS["secondary"])
 
 
+def listen(widget, fn, *kinds):
+    """Subscribes fn to data_store change events for as long as the widget exists."""
+    unsubscribe = data_store.events.subscribe(fn, *kinds)
+    widget.bind("<Destroy>", lambda e: unsubscribe() if e.widget is widget else None, add="+")
+
+
+TICKET_CHANGES = (Change.TICKET_PURCHASED, Change.TICKET_REFUNDED, Change.TICKET_UPGRADED)
+RESERVATION_CHANGES = (Change.RESERVATION_CREATED, Change.RESERVATION_CANCELLED)
+
+
 class GreenWaveApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -51,18 +67,98 @@ class GreenWaveApp(tk.Tk):
 
         self.container = tk.Frame(self, bg=COLORS["secondary"])
         self.container.pack(fill="both", expand=True)
+        # Screens kept alive between visits (least recently shown first), see switch_frame
+        self.frames = OrderedDict()
+        self.current = None
+        # (screen, "built" or "cached", seconds) for the last navigations
+        self.nav_times = deque(maxlen=500)
         self.switch_frame(WelcomeScreen)
 
+        # Background saves (GREENWAVE_ASYNC_SAVE=1) report back through here, on the Tk thread
+        data_store.on_saved(self.saved)
+        self.after(200, self.poll_saves)
+        # File-watch mode (GREENWAVE_WATCH=seconds): other terminals' commits show up without a Refresh
+        self.watch_ms = int(STORAGE_CONFIG["watch_interval"] * 1000)
+        if self.watch_ms: self.after(self.watch_ms, self.watch)
+
+    def poll_saves(self):
+        data_store.poll_saves()
+        self.after(200, self.poll_saves)
+
+    def watch(self):
+        try:
+            data_store.refresh()
+        finally:
+            self.after(self.watch_ms, self.watch)
+
+    def saved(self, err):
+        if err: messagebox.showerror("Save failed", f"Recent changes could not be written to disk:\n{err}")
+
+    # Most screens kept in the cache; heavy ones are also dropped once left alone for HEAVY_IDLE_MS
+    CACHE_SIZE = 8
+    HEAVY_IDLE_MS = 60_000
+
+    @timed("gui.switch_frame")
     def switch_frame(self, cls, context=None):
-        for c in self.container.winfo_children(): c.destroy()
-        f = cls(self.container, self, context) if context else cls(self.container, self)
+        """Shows a screen. Screen subclasses are built once and cached: later visits only call
+        refresh(). Other frames are rebuilt on every visit, as before."""
+        t0 = time.perf_counter()
+        cached = issubclass(cls, Screen)
+        key = (cls, context, AppState.current_user if cached and cls.per_user else None)
+        f = self.frames.pop(key, None) if cached else None
+        if self.current is not None and self.current is not f: self.hide(self.current)
+        if f is not None:
+            f.refresh()
+            how = "cached"
+        else:
+            f = cls(self.container, self, context) if context else cls(self.container, self)
+            how = "built"
+        if cached:
+            self.frames[key] = f
+            while len(self.frames) > self.CACHE_SIZE: self.evict(next(iter(self.frames)))
+        self.current = f
         f.pack(fill="both", expand=True)
+        self.update_idletasks()
+        if cached: data_store.prefetch(*cls.prefetch)
+        self.nav_times.append((cls.__name__, how, time.perf_counter() - t0))
+
+    def hide(self, f):
+        if f not in self.frames.values():
+            f.destroy()
+            return
+        f.pack_forget()
+        if f.heavy:
+            key = next(k for k, v in self.frames.items() if v is f)
+            self.after(self.HEAVY_IDLE_MS, lambda: self.current is not f and self.evict(key, f))
+
+    def evict(self, key, f=None):
+        """Drops a cached screen (only `f`, if given, so a later copy under the same key is kept)."""
+        if f is not None and self.frames.get(key) is not f: return
+        f = self.frames.pop(key, None)
+        if f is not None and f is not self.current: f.destroy()
+
+
+class Screen(tk.Frame):
+    """A screen kept in GreenWaveApp's cache: built once, then refresh() brings its data up to date
+    each time it is shown again."""
+    # Cached separately for every logged-in attendee
+    per_user = False
+    # Holds a lot of widgets or data: evicted soon after it is left
+    heavy = False
+    # Stores the next screens will probably need, loaded in the background once this one is shown (see
+    # DataStore.prefetch); those a screen needs itself are loaded when it first uses them
+    prefetch = ()
+
+    def refresh(self):
+        pass
 
 
 # ----------------------------------------------------
 # AUTH SCREENS
 # ----------------------------------------------------
-class WelcomeScreen(tk.Frame):
+class WelcomeScreen(Screen):
+    prefetch = ("attendees",)
+
     def __init__(self, parent, controller, context=None):
         super().__init__(parent);
         add_bg(self)
@@ -77,7 +173,9 @@ class WelcomeScreen(tk.Frame):
                   command=lambda: controller.switch_frame(RegistrationScreen)).pack(pady=10)
 
 
-class LoginScreen(tk.Frame):
+class LoginScreen(Screen):
+    prefetch = ("attendees", "tickets", "reservations", "waitlist")
+
     def __init__(self, parent, controller, context=None):
         super().__init__(parent);
         add_bg(self);
@@ -95,6 +193,9 @@ class LoginScreen(tk.Frame):
                   command=self.do_login).pack(pady=20)
         tk.Button(box, text="Back", bg="#eee", width=30, command=lambda: controller.switch_frame(WelcomeScreen)).pack()
 
+    def refresh(self):
+        for e in (self.e, self.p): e.delete(0, tk.END)
+
     def do_login(self):
         em, pw = self.e.get().strip(), self.p.get().strip()
         # Admin Login
@@ -109,7 +210,9 @@ class LoginScreen(tk.Frame):
             messagebox.showerror("Error", "Invalid credentials")
 
 
-class RegistrationScreen(tk.Frame):
+class RegistrationScreen(Screen):
+    prefetch = ("attendees",)
+
     def __init__(self, parent, controller, context=None):
         super().__init__(parent)
         add_bg(self)
@@ -128,6 +231,9 @@ class RegistrationScreen(tk.Frame):
                   command=self.reg).pack(pady=20)
         tk.Button(box, text="Back", bg="#eee", width=30, command=lambda: controller.switch_frame(WelcomeScreen)).pack()
 
+    def refresh(self):
+        for e in (self.n, self.e, self.ph, self.pw): e.delete(0, tk.END)
+
     def mk(self, p, txt, show=None):
         tk.Label(p, text=txt, bg="white", font=FONTS["small"]).pack(anchor="w")
         e = tk.Entry(p, width=35, font=FONTS["body"], show=show)
@@ -135,53 +241,34 @@ class RegistrationScreen(tk.Frame):
         return e
 
     def reg(self):
-        try:
-            # Get inputs
-            n = self.n.get().strip()
-            e = self.e.get().strip()
-            p = self.ph.get().strip()
-            pw = self.pw.get().strip()
-
-            # 1. Check Empty Fields
-            if not all([n, e, p, pw]):
-                raise ValueError("All fields required")
-
-            # 2. Validate Email
-            if not re.match(r"[^@]+@[^@]+\.[^@]+", e):
-                raise ValueError("Invalid Email")
-
-            # 3. Validate Phone (Must be 10 digits, start with 0)
-            if not (p.isdigit() and len(p) == 10 and p.startswith('0')):
-                raise ValueError("Phone must be 10 digits starting with 0")
-
-            # 4. Validate Password Length
-            if len(pw) < 8:
-                raise ValueError("Password min 8 chars")
-
-            # 5. Check Duplicate
-            if e in data_store.attendees:
-                raise ValueError("Email already exists")
-
-            # Save
-            data_store.attendees[e] = Attendee(f"U{len(data_store.attendees) + 1}", n, e, p, pw)
-            data_store.save_all()
-
-            messagebox.showinfo("Success", "Account created")
-            self.c.switch_frame(LoginScreen)
+        # Get inputs
+        n = self.n.get().strip()
+        e = self.e.get().strip()
+        p = self.ph.get().strip()
+        pw = self.pw.get().strip()
+
+        # Validation (fields, email, phone, password, duplicate) lives in Attendee.register
+        a, err = Attendee.register(n, e, p, pw)
+        if err:
+            messagebox.showerror("Error", err)
+            return
 
-        except ValueError as ex:
-            messagebox.showerror("Error", str(ex))
+        messagebox.showinfo("Success", "Account created")
+        self.c.switch_frame(LoginScreen)
 
 # --- USER SCREENS ---
-class ProfileScreen(tk.Frame):
+class ProfileScreen(Screen):
+    per_user = True
+    prefetch = ("tickets", "reservations", "waitlist", "payments")
+
     def __init__(self, parent, controller, context=None):
         super().__init__(parent);
         add_bg(self);
         u = AppState.current_user
         hdr = tk.Frame(self, bg=COLORS["header"], height=80);
         hdr.pack(fill="x")
-        tk.Label(hdr, text=f"Hello, {u.name}", font=FONTS["h1"], bg=COLORS["header"], fg="white").pack(side="left",
-                                                                                                       padx=20, pady=20)
+        self.hello = tk.Label(hdr, text=f"Hello, {u.name}", font=FONTS["h1"], bg=COLORS["header"], fg="white")
+        self.hello.pack(side="left", padx=20, pady=20)
         tk.Button(hdr, text="Logout", bg=COLORS["danger"], fg="white",
                   command=lambda: controller.switch_frame(LoginScreen)).pack(side="right", padx=20)
 
@@ -197,6 +284,9 @@ class ProfileScreen(tk.Frame):
         self.card(grid, 1, 1, "Account", "Manage profile, view pass,\nor delete account.", "Manage Profile",
                   lambda: EditProfileWindow(controller, u), "My Tickets", lambda: TicketManagerWindow(controller, u))
 
+    def refresh(self):
+        self.hello.config(text=f"Hello, {AppState.current_user.name}")
+
     def card(self, parent, r, c, title, desc, b1t, c1, b2t=None, c2=None):
         f = tk.Frame(parent, bg="white", width=300, height=220, relief="raised", borderwidth=1)
         f.grid(row=r, column=c, padx=15, pady=15);
@@ -220,10 +310,10 @@ class TicketPurchaseScreen(tk.Frame):
         # 1. Bundle Selection
         lf1 = tk.LabelFrame(main, text="1. Bundle", bg="white", font=FONTS["bold"], padx=10, pady=10)
         lf1.pack(fill="x", pady=5)
-        self.b_var = tk.StringVar(value="1 Exhibition (200 AED)")
-        cb = ttk.Combobox(lf1, textvariable=self.b_var,
-                          values=("1 Exhibition (200 AED)", "2 Exhibitions (400 AED)", "All-Access (500 AED)"),
-                          width=40, state="readonly")
+        bundles = (f"1 Exhibition ({BUNDLE_PRICES[1]:g} AED)", f"2 Exhibitions ({BUNDLE_PRICES[2]:g} AED)",
+                   f"All-Access ({ALL_ACCESS_PRICE:g} AED)")
+        self.b_var = tk.StringVar(value=bundles[0])
+        cb = ttk.Combobox(lf1, textvariable=self.b_var, values=bundles, width=40, state="readonly")
         cb.pack()
         cb.bind("<<ComboboxSelected>>", self.upd)
 
@@ -281,7 +371,7 @@ class TicketPurchaseScreen(tk.Frame):
         if "2 Ex" in b and len(idx) != 2: messagebox.showerror("Error", "Select exactly 2 exhibitions"); return
 
         sel = [self.lb.get(i) for i in idx]
-        pr = 500.0 if "All" in b else (400.0 if "2" in b else 200.0)
+        pr = ALL_ACCESS_PRICE if "All" in b else BUNDLE_PRICES[len(sel)]
         tt = TicketType.AllAccessPass if "All" in b else TicketType.ExhibitionPass
 
         # Collect Data correctly (get actual inputs)
@@ -299,22 +389,28 @@ class TicketPurchaseScreen(tk.Frame):
             self.controller.switch_frame(ExhibitionBrowserFrame)
 
 
-class ExhibitionBrowserFrame(tk.Frame):
+class ExhibitionBrowserFrame(Screen):
     def __init__(self, parent, controller, context=None):
         super().__init__(parent);
         add_bg(self)
         tk.Label(self, text="Exhibitions", font=FONTS["h1"], bg=COLORS["secondary"]).pack(pady=20)
-        lb = tk.Listbox(self, font=FONTS["body"], height=6);
+        self.lb = lb = tk.Listbox(self, font=FONTS["body"], height=6);
         lb.pack(padx=40, pady=10, fill="x")
-        for e in data_store.exhibitions: lb.insert(tk.END, e.name)
+        self.refresh()
 
         tk.Button(self, text="View Workshops", bg=COLORS["primary"], fg="white", font=FONTS["bold"],
                   command=lambda: [controller.switch_frame(WorkshopListFrame, context=data_store.exhibitions[
                       lb.curselection()[0]]) if lb.curselection() else None]).pack(pady=10)
         tk.Button(self, text="Back", command=lambda: controller.switch_frame(ProfileScreen)).pack()
 
+    def refresh(self):
+        self.lb.delete(0, tk.END)
+        for e in data_store.exhibitions: self.lb.insert(tk.END, e.name)
+
+
+class WorkshopListFrame(Screen):
+    per_user = True
 
-class WorkshopListFrame(tk.Frame):
     def __init__(self, parent, controller, context):
         super().__init__(parent);
         self.c = controller;
@@ -322,7 +418,7 @@ class WorkshopListFrame(tk.Frame):
         add_bg(self)
         tk.Label(self, text=context.name, font=FONTS["h1"], bg=COLORS["secondary"]).pack(pady=10)
 
-        d = sorted(list(set(w.date for w in context.workshops)))
+        d = sorted(set(w.date for w in context.workshops), key=workshop_day)
         cb = ttk.Combobox(self, values=d, state="readonly");
         cb.current(0);
         cb.pack();
@@ -333,6 +429,7 @@ class WorkshopListFrame(tk.Frame):
         self.tv.pack(padx=20, pady=10, fill="x")
         for c in ("ID", "Top", "Time", "St"): self.tv.heading(c, text=c)
         self.ref()
+        listen(self, self.changed, Change.WORKSHOP_UPDATED, Change.WAITLIST_UPDATED, Change.RELOADED)
 
         btn_frame = tk.Frame(self, bg=COLORS["secondary"]);
         btn_frame.pack(pady=10)
@@ -343,17 +440,49 @@ class WorkshopListFrame(tk.Frame):
         tk.Button(btn_frame, text="Back", command=lambda: controller.switch_frame(ExhibitionBrowserFrame)).pack(
             side="left", padx=5)
 
+    def refresh(self):
+        self.ref()
+
+    @timed("gui.workshop_list")
     def ref(self, e=None):
         for i in self.tv.get_children(): self.tv.delete(i)
-        for w in self.ex.workshops:
-            if w.date == self.cb_.get():
-                st = "Reserved" if AppState.current_user.attendee_id in w.attendees_ids else f"{w.get_seats_remaining()} left"
-                self.tv.insert("", "end", values=(w.workshop_id, w.topic, f"{w.start_time}-{w.end_time}", st))
+        for w in data_store.schedule.on_day(workshop_day(self.cb_.get())):
+            if w.exhibition_name == self.ex.name:
+                self.tv.insert("", "end", iid=w.workshop_id, values=self.row(w))
+
+    def row(self, w):
+        aid = AppState.current_user.attendee_id
+        pos = data_store.waitlist_position(w.workshop_id, aid)
+        if aid in w.attendees_ids: st = "Reserved"
+        elif pos: st = f"Waitlisted #{pos}"
+        elif w.is_full(): st = f"Full ({data_store.waiting(w.workshop_id)} waiting)"
+        else: st = f"{w.get_seats_remaining()} left"
+        return w.workshop_id, w.topic, f"{w.start_time}-{w.end_time}", st
+
+    def changed(self, e):
+        if e.kind == Change.RELOADED:
+            # The exhibitions were replaced by new objects
+            self.ex = next((x for x in data_store.exhibitions if x.name == self.ex.name), self.ex)
+            self.ref()
+        elif self.tv.exists(e.obj.workshop_id):
+            # Waitlist events carry the entry; other places in the queue move too
+            self.tv.item(e.obj.workshop_id, values=self.row(data_store.workshops[e.obj.workshop_id]))
 
     def res(self):
         sel = self.tv.selection()
         if sel:
-            r, err = AppState.current_user.reserve_workshop(self.tv.item(sel[0])['values'][0])
+            wid = self.tv.item(sel[0])['values'][0]
+            ws = data_store.workshops.get(wid)
+            u = AppState.current_user
+            if ws and ws.is_full() and u.attendee_id not in ws.attendees_ids:
+                if data_store.waitlist_entry(wid, u.attendee_id):
+                    messagebox.showinfo("Waitlist", f"You are #{data_store.waitlist_position(wid, u.attendee_id)} on the waitlist.")
+                elif messagebox.askyesno("Full", "This workshop is full. Join the waitlist? A freed seat is reserved for you automatically."):
+                    entry, err = u.join_waitlist(wid)
+                    if err: messagebox.showerror("Error", err)
+                    else: messagebox.showinfo("Waitlist", f"You are #{data_store.waitlist_position(wid, u.attendee_id)} on the waitlist.")
+                return
+            r, err = u.reserve_workshop(wid)
             if err:
                 messagebox.showerror("Error", err)
             else:
@@ -364,12 +493,14 @@ class WorkshopListFrame(tk.Frame):
         sel = self.tv.selection()
         if not sel: return
         wid = self.tv.item(sel[0])['values'][0]
-        res = next((r for r in data_store.reservations if
-                    r.workshop_id == wid and r.attendee_id == AppState.current_user.attendee_id and r.status), None)
+        res = data_store.active_reservation(wid, AppState.current_user.attendee_id)
         if res:
             AppState.current_user.cancel_reservation(res.reservation_id)
             messagebox.showinfo("Cancelled", "Reservation cancelled.")
             self.ref()
+        elif data_store.waitlist_entry(wid, AppState.current_user.attendee_id):
+            AppState.current_user.leave_waitlist(wid)
+            messagebox.showinfo("Cancelled", "You left the waitlist.")
         else:
             messagebox.showerror("Error", "You don't have a reservation for this workshop.")
 
@@ -400,8 +531,8 @@ class EditProfileWindow(tk.Toplevel):
 
     def del_acc(self, controller, u):
         if messagebox.askyesno("CONFIRM", "Are you sure? This cannot be undone."):
-            del data_store.attendees[u.email]
-            data_store.save_all()
+            with data_store.transaction():
+                data_store.remove_attendee(u)
             self.destroy()
             controller.switch_frame(LoginScreen)
             messagebox.showinfo("Bye", "Account deleted.")
@@ -416,7 +547,7 @@ class UpgradeTicketScreen(tk.Frame):
         self.tm = {};
         v = []
         for tid in AppState.current_user.tickets:
-            t = next((tk for tk in data_store.tickets if tk.ticket_id == tid), None)
+            t = data_store.get_ticket(tid)
             if t and isinstance(t, ExhibitionPass): v.append(f"ID {t.ticket_id}"); self.tm[f"ID {t.ticket_id}"] = t
         self.cb = ttk.Combobox(self, values=v, state="readonly", width=40);
         self.cb.pack();
@@ -433,13 +564,13 @@ class UpgradeTicketScreen(tk.Frame):
 
     def os(self, e):
         t = self.tm[self.cb.get()]
-        av = [e.name for e in data_store.exhibitions if e.name not in t.selected_exhibitions]
+        av = [e.name for e in data_store.exhibitions if not t.selected_mask >> e.ex_id & 1]
         self.ax['values'] = av
 
     def cp(self, e=None):
         if not self.cb.get(): return
         t = self.tm[self.cb.get()]
-        c = (500 - t.price) if self.va.get() else 200
+        c = (ALL_ACCESS_PRICE - t.price) if self.va.get() else EXHIBITION_ADD_COST
         self.cost = c;
         self.lp.config(text=f"Cost: AED {c}")
 
@@ -456,7 +587,84 @@ class UpgradeTicketScreen(tk.Frame):
 
 
 # --- ADMIN ---
-class AdminDashboard(tk.Frame):
+class OrderTable(tk.Frame):
+    """Order list that only ever holds the visible rows. The scrollbar drives an offset into
+    data_store.query_orders(), which also does the sorting and searching."""
+    COLS = (("id", "ID", 80), ("date", "Date", 160), ("customer", "Customer", 260), ("ticket", "Ticket", 140),
+            ("price", "Price", 100))
+
+    def __init__(self, parent, rows=20):
+        super().__init__(parent, bg="white")
+        self.rows, self.offset, self.total, self.page = rows, 0, 0, []
+        self.sort, self.desc = None, False
+        bar = tk.Frame(self, bg="white");
+        bar.pack(fill="x", pady=5)
+        tk.Label(bar, text="Search:", bg="white").pack(side="left")
+        self.search = tk.StringVar()
+        tk.Entry(bar, textvariable=self.search, width=30).pack(side="left", padx=5)
+        self.search.trace_add("write", self.searched)
+        self.pending = None
+        self.info = tk.Label(bar, bg="white", fg="gray");
+        self.info.pack(side="right")
+
+        body = tk.Frame(self, bg="white");
+        body.pack(fill="both", expand=True)
+        self.tv = ttk.Treeview(body, columns=[c for c, _, _ in self.COLS], show="headings", height=rows,
+                               selectmode="browse")
+        for c, text, w in self.COLS:
+            self.tv.heading(c, text=text, command=lambda c=c: self.sort_by(c))
+            self.tv.column(c, width=w, anchor="w")
+        self.sb = ttk.Scrollbar(body, orient="vertical", command=self.scroll)
+        self.sb.pack(side="right", fill="y")
+        self.tv.pack(side="left", fill="both", expand=True)
+        self.tv.bind("<MouseWheel>", lambda e: self.scroll("scroll", -3 if e.delta > 0 else 3, "units"))
+        self.tv.bind("<Button-4>", lambda e: self.scroll("scroll", -3, "units"))
+        self.tv.bind("<Button-5>", lambda e: self.scroll("scroll", 3, "units"))
+        self.show(0)
+
+    def scroll(self, *a):
+        if a[0] == "moveto":
+            self.show(int(float(a[1]) * self.total))
+        else:
+            self.show(self.offset + int(a[1]) * (self.rows if a[2] == "pages" else 1))
+
+    def searched(self, *a):
+        # Query once typing pauses, not on every keystroke
+        if self.pending: self.after_cancel(self.pending)
+        self.pending = self.after(300, lambda: self.show(0))
+
+    def sort_by(self, col):
+        self.desc = not self.desc if self.sort == col else False
+        self.sort = col
+        self.show(0)
+
+    @timed("gui.order_page")
+    def show(self, offset):
+        offset = max(0, min(offset, self.total - self.rows))
+        self.total, self.page = data_store.query_orders(self.sort, self.desc, self.search.get(), offset, self.rows)
+        if not self.page and offset:  # the list shrank since the last page
+            offset = max(0, self.total - self.rows)
+            self.total, self.page = data_store.query_orders(self.sort, self.desc, self.search.get(), offset,
+                                                            self.rows)
+        self.offset = offset
+        self.tv.delete(*self.tv.get_children())
+        for i, t in enumerate(self.page):
+            u = data_store.get_attendee_by_id(t.attendee_id)
+            desc = "All Access" if t.ticket_type == TicketType.AllAccessPass else "Exhibition Pass"
+            self.tv.insert("", "end", iid=str(i), values=(t.ticket_id, t.purchase_date, u.email if u else "Unknown",
+                                                          desc, t.price))
+        n = max(self.total, 1)
+        self.sb.set(offset / n, (offset + len(self.page)) / n)
+        self.info.config(text=f"{offset + 1 if self.page else 0}-{offset + len(self.page)} of {self.total} orders")
+
+    def selected(self):
+        s = self.tv.selection()
+        return self.page[int(s[0])] if s else None
+
+
+class AdminDashboard(Screen):
+    heavy = True
+
     def __init__(self, parent, controller, context=None):
         super().__init__(parent);
         self.controller = controller;
@@ -481,49 +689,79 @@ class AdminDashboard(tk.Frame):
         self.t3 = tk.Frame(tabs, bg="white");
         tabs.add(self.t3, text=" Capacity ");
         self.build_capacity()
+        self.pending = None
+        listen(self, self.changed, *TICKET_CHANGES, Change.WORKSHOP_UPDATED, Change.WAITLIST_UPDATED, Change.RELOADED)
+
+    def changed(self, e):
+        if e.kind == Change.WORKSHOP_UPDATED:
+            self.patch_cap(e.obj)
+        elif e.kind == Change.WAITLIST_UPDATED:
+            self.patch_cap(data_store.workshops.get(e.obj.workshop_id))
+        elif e.kind == Change.RELOADED:
+            self.refresh()
+        elif not self.pending:
+            # Ticket changes: redraw the visible order page and the totals once per batch of events
+            self.pending = self.after_idle(self.tickets_changed)
+
+    @timed("gui.tickets_changed")
+    def tickets_changed(self):
+        self.pending = None
+        self.orders.show(self.orders.offset)
+        self.total.config(text=f"Total Sales: AED {data_store.aggregates.revenue()}")
+        self.fill_analytics()
+
+    def refresh(self):
+        """Re-reads the data into the existing widgets (after a modify/delete or when shown again)."""
+        self.orders.show(self.orders.offset)
+        self.total.config(text=f"Total Sales: AED {data_store.aggregates.revenue()}")
+        self.fill_analytics()
+        self.cb.config(values=data_store.aggregates.dates())
+        self.ref_cap()
 
+    @timed("gui.build_orders")
     def build_orders(self):
-        head = tk.Frame(self.t1, bg="#ddd", pady=5);
-        head.pack(fill="x")
-        cols = ["ID", "Date", "Customer", "Ticket", "Price", "Actions"]
-        wds = [10, 15, 25, 20, 10, 30]
-        for i, t in enumerate(cols): tk.Label(head, text=t, width=wds[i], font=("Arial", 10, "bold"), bg="#ddd",
-                                              anchor="w").grid(row=0, column=i, padx=5)
-
-        can = tk.Canvas(self.t1, bg="white");
-        frm = tk.Frame(can, bg="white")
-        scr = tk.Scrollbar(self.t1, orient="vertical", command=can.yview);
-        can.configure(yscrollcommand=scr.set);
-        scr.pack(side="right", fill="y")
-        can.pack(side="left", fill="both", expand=True);
-        can.create_window((0, 0), window=frm, anchor="nw")
-        frm.bind("<Configure>", lambda e: can.configure(scrollregion=can.bbox("all")))
-
-        tot = 0
-        for t in data_store.tickets:
-            tot += t.price
-            u = next((u for u in data_store.attendees.values() if u.attendee_id == t.attendee_id), None)
-            em = u.email if u else "Unknown"
-            desc = "All Access" if t.ticket_type == TicketType.AllAccessPass else "Exhibition Pass"
-            r = tk.Frame(frm, bg="white", pady=5, borderwidth=1, relief="solid");
-            r.pack(fill="x", pady=2)
-            tk.Label(r, text=t.ticket_id, width=wds[0], anchor="w").grid(row=0, column=0, padx=5)
-            tk.Label(r, text=t.purchase_date, width=wds[1], anchor="w").grid(row=0, column=1, padx=5)
-            tk.Label(r, text=em, width=wds[2], anchor="w").grid(row=0, column=2, padx=5)
-            tk.Label(r, text=desc, width=wds[3], anchor="w").grid(row=0, column=3, padx=5)
-            tk.Label(r, text=f"{t.price}", width=wds[4], anchor="w").grid(row=0, column=4, padx=5)
-            af = tk.Frame(r);
-            af.grid(row=0, column=5, padx=5)
-
-            # --- RESTORED BUTTONS ---
-            tk.Button(af, text="Modify", font=("Arial", 8), command=lambda t=t: self.mod(t)).pack(side="left", padx=5)
-            tk.Button(af, text="Del", font=("Arial", 8), bg="#ffcccc", command=lambda t=t: self.dele(t)).pack(
-                side="left", padx=5)
-            tk.Button(af, text="View Pass", font=("Arial", 8),
-                      command=lambda t=t, u=u: ViewPassWindow(self.controller, t, u)).pack(side="left", padx=5)
-
-        tk.Label(self.t1, text=f"Total Sales: AED {tot}", font=FONTS["h2"], bg="#eee").pack(side="bottom", anchor="w",
-                                                                                            padx=20, pady=10)
+        self.total = tk.Label(self.t1, text=f"Total Sales: AED {data_store.aggregates.revenue()}", font=FONTS["h2"],
+                              bg="#eee")
+        self.total.pack(side="bottom", anchor="w", padx=20, pady=10)
+        # Actions apply to the selected row
+        af = tk.Frame(self.t1, bg="white");
+        af.pack(side="bottom", fill="x", padx=10, pady=5)
+        tk.Button(af, text="Modify", command=lambda: self.on_selected(self.mod)).pack(side="left", padx=5)
+        tk.Button(af, text="Del", bg="#ffcccc", command=lambda: self.on_selected(self.dele)).pack(side="left", padx=5)
+        tk.Button(af, text="View Pass", command=lambda: self.on_selected(
+            lambda t: ViewPassWindow(self.controller, t, data_store.get_attendee_by_id(t.attendee_id)))).pack(
+            side="left", padx=5)
+        self.export_btn = tk.Button(af, text="Export CSV...", command=self.export)
+        self.export_btn.pack(side="right", padx=5)
+        self.orders = OrderTable(self.t1)
+        self.orders.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+    def export(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".csv", initialfile="orders.csv",
+                                            filetypes=[("CSV", "*.csv")])
+        if not path: return
+        # Written on a worker thread (from a read view, so purchases go on meanwhile); polled from the Tk thread,
+        # which is the only one that may touch the widgets
+        done = []
+
+        def run():
+            try: done.append((export.export("orders", path), None))
+            except Exception as e: done.append((0, e))
+
+        def poll():
+            if not done: self.after(100, poll); return
+            if self.winfo_exists(): self.export_btn.config(state="normal", text="Export CSV...")
+            n, err = done[0]
+            if err: messagebox.showerror("Export", f"Export failed: {err}")
+            else: messagebox.showinfo("Export", f"{n} orders written to {path}")
+        self.export_btn.config(state="disabled", text="Exporting...")
+        threading.Thread(target=run, name="greenwave-export", daemon=True).start()
+        self.after(100, poll)
+
+    def on_selected(self, action):
+        t = self.orders.selected()
+        if t is None: messagebox.showerror("Error", "Select an order first"); return
+        action(t)
 
     def mod(self, ticket):
         top = tk.Toplevel(self);
@@ -544,12 +782,12 @@ class AdminDashboard(tk.Frame):
                 new_p = float(price_ent.get())
                 new_t_str = type_var.get()
                 new_t = TicketType[new_t_str]
-                ticket.price = new_p
-                ticket.ticket_type = new_t
-                if new_t == TicketType.ExhibitionPass and not hasattr(ticket, 'selected_exhibitions'):
-                    ticket.selected_exhibitions = [e.name for e in data_store.exhibitions]
-                data_store.save_all()
-                self.controller.switch_frame(AdminDashboard)
+                with data_store.transaction(), data_store.modifying(ticket):
+                    ticket.price = new_p
+                    ticket.ticket_type = new_t
+                    if new_t == TicketType.ExhibitionPass and not hasattr(ticket, 'selected_mask'):
+                        ticket.selected_mask = sum(1 << e.ex_id for e in data_store.exhibitions)
+                self.refresh()
                 top.destroy()
                 messagebox.showinfo("Success", "Ticket updated.")
             except ValueError:
@@ -559,46 +797,83 @@ class AdminDashboard(tk.Frame):
 
     def dele(self, t):
         if messagebox.askyesno("Confirm", "Delete this ticket?"):
-            u = next((u for u in data_store.attendees.values() if u.attendee_id == t.attendee_id), None)
+            u = data_store.get_attendee_by_id(t.attendee_id)
             if u: u.refund_ticket(t.ticket_id)
-            self.controller.switch_frame(AdminDashboard)
+            self.refresh()
 
+    @timed("gui.build_analytics")
     def build_analytics(self):
-        tv = ttk.Treeview(self.t2, columns=("Type", "Count", "Revenue"), show="headings")
-        for c in ("Type", "Count", "Revenue"): tv.heading(c, text=c)
+        self.an = tv = ttk.Treeview(self.t2, columns=("Count", "Revenue"), show="tree headings")
+        tv.heading("#0", text="Type")
+        for c in ("Count", "Revenue"): tv.heading(c, text=c)
         tv.pack(fill="both", expand=True, padx=20, pady=20)
-        c = defaultdict(int);
-        r = defaultdict(float)
-        for t in data_store.tickets:
-            k = "All Access" if t.ticket_type == TicketType.AllAccessPass else "Exhibition"
-            c[k] += 1;
-            r[k] += t.price
-        for k in c: tv.insert("", "end", values=(k, c[k], f"AED {r[k]}"))
+        self.fill_analytics()
+
+    def fill_analytics(self):
+        # Rendered from the running totals kept by data_store, no scan over the tickets
+        tv, agg = self.an, data_store.aggregates
+        tv.delete(*tv.get_children())
+        for k, (n, amt) in agg.by_type_totals().items(): tv.insert("", "end", text=k, values=(n, f"AED {amt}"))
+        ex = tv.insert("", "end", text="By exhibition")
+        for k, (n, amt) in agg.by_exhibition_totals([e.name for e in data_store.exhibitions]).items():
+            tv.insert(ex, "end", text=k, values=(n, f"AED {amt:.2f}"))
+        day = tv.insert("", "end", text="By purchase day")
+        for d, n, amt in agg.by_day_totals():
+            tv.insert(day, "end", text=datetime.date.fromordinal(d).strftime(DATE_FORMAT), values=(n, f"AED {amt}"))
 
     def build_capacity(self):
         top = tk.Frame(self.t3, bg="white");
         top.pack(pady=10)
-        d = sorted(list(set(w.date for w in data_store.workshops.values())))
+        d = data_store.aggregates.dates()
         self.cb = ttk.Combobox(top, values=d, state="readonly");
         self.cb.current(0);
         self.cb.pack(side="left")
         self.cb.bind("<<ComboboxSelected>>", self.ref_cap)
-        tk.Button(top, text="Refresh", command=lambda: [data_store.load_all(), self.ref_cap()]).pack(side="left",
-                                                                                                     padx=10)
+        # Applies other terminals' commits; the rows are patched through the change events
+        tk.Button(top, text="Refresh", command=data_store.refresh).pack(side="left", padx=10)
         self.cf = tk.Frame(self.t3, bg="white");
         self.cf.pack(fill="both", expand=True, padx=20)
         self.ref_cap()
 
+    @timed("gui.ref_cap")
     def ref_cap(self, e=None):
         for w in self.cf.winfo_children(): w.destroy()
         d = self.cb.get()
-        for w in [x for x in data_store.workshops.values() if x.date == d]:
+        self.day_lbl = tk.Label(self.cf, font=FONTS["bold"], bg="white")
+        self.day_lbl.pack(anchor="w", pady=5)
+        # workshop_id -> (progress bar, label), patched by patch_cap() when seats change
+        self.cap_rows = {}
+        for w in data_store.aggregates.workshops_on(d):
             r = tk.Frame(self.cf, pady=5, bg="white");
             r.pack(fill="x")
             tk.Label(r, text=f"{w.topic} ({w.start_time})", width=40, anchor="w", bg="white").pack(side="left")
-            p = (len(w.attendees_ids) / w.capacity) * 100
-            ttk.Progressbar(r, length=200, value=p).pack(side="left", padx=10)
-            tk.Label(r, text=f"{len(w.attendees_ids)}/{w.capacity} Booked", bg="white").pack(side="left")
+            pb = ttk.Progressbar(r, length=200)
+            pb.pack(side="left", padx=10)
+            lbl = tk.Label(r, bg="white")
+            lbl.pack(side="left")
+            tk.Button(r, text="Capacity...", command=lambda w=w: self.set_cap(w)).pack(side="right")
+            self.cap_rows[w.workshop_id] = (pb, lbl)
+            self.patch_cap(w)
+        self.patch_cap(None)
+
+    def patch_cap(self, w):
+        if w is not None:
+            if w.workshop_id not in self.cap_rows: return
+            pb, lbl = self.cap_rows[w.workshop_id]
+            pb.config(value=(len(w.attendees_ids) / w.capacity) * 100 if w.capacity else 100)
+            n = data_store.waiting(w.workshop_id)
+            lbl.config(text=f"{len(w.attendees_ids)}/{w.capacity} Booked" + (f", {n} waiting" if n else ""))
+        d = self.cb.get()
+        booked, cap = data_store.aggregates.seats_on(d)
+        self.day_lbl.config(text=f"{booked}/{cap} seats booked on {d}")
+
+    def set_cap(self, w):
+        cap = simpledialog.askinteger("Capacity", f"Seats for {w.topic}:", parent=self, initialvalue=w.capacity,
+                                      minvalue=0)
+        if cap is None: return
+        # Extra seats go to the waitlist straight away; the rows are patched through the change events
+        err = data_store.set_capacity(w.workshop_id, cap)
+        if err: messagebox.showerror("Error", err)
 
 
 # --- UTILS ---
@@ -607,13 +882,33 @@ class ScheduleWindow(tk.Toplevel):
         super().__init__();
         self.title("Schedule");
         self.geometry("700x400")
-        tv = ttk.Treeview(self, columns=("Topic", "Date", "Time", "Loc"), show="headings")
+        self.u = u
+        self.tv = tv = ttk.Treeview(self, columns=("Topic", "Date", "Time", "Loc"), show="headings")
         for x in ("Topic", "Date", "Time", "Loc"): tv.heading(x, text=x)
         tv.pack(fill="both", expand=True)
-        for r in data_store.reservations:
-            if r.attendee_id == u.attendee_id and r.status:
-                ws = data_store.workshops.get(r.workshop_id)
-                tv.insert("", "end", values=(ws.topic, ws.date, f"{ws.start_time}-{ws.end_time}", ws.exhibition_name))
+        self.fill()
+        listen(self, self.changed, *RESERVATION_CHANGES, Change.RELOADED)
+
+    def fill(self):
+        self.tv.delete(*self.tv.get_children())
+        for ws in data_store.schedule.booked(self.u.attendee_id):
+            self.add(data_store.active_reservation(ws.workshop_id, self.u.attendee_id))
+
+    def add(self, r):
+        ws = data_store.workshops.get(r.workshop_id) if r else None
+        if ws and not self.tv.exists(r.reservation_id):
+            # Rows stay in time order
+            at = [w.workshop_id for w in data_store.schedule.booked(self.u.attendee_id)].index(ws.workshop_id)
+            self.tv.insert("", at, iid=r.reservation_id,
+                           values=(ws.topic, ws.date, f"{ws.start_time}-{ws.end_time}", ws.exhibition_name))
+
+    def changed(self, e):
+        if e.kind == Change.RELOADED:
+            self.u = data_store.get_attendee_by_id(self.u.attendee_id) or self.u
+            self.fill()
+        elif e.obj.attendee_id == self.u.attendee_id:
+            if e.kind == Change.RESERVATION_CREATED: self.add(e.obj)
+            elif self.tv.exists(e.obj.reservation_id): self.tv.delete(e.obj.reservation_id)
 
 
 class TicketManagerWindow(tk.Toplevel):
@@ -621,10 +916,21 @@ class TicketManagerWindow(tk.Toplevel):
         super().__init__();
         self.title("My Tickets");
         self.geometry("500x500")
-        fr = tk.Frame(self);
-        fr.pack(fill="both", expand=True)
+        self.c, self.u = c, u
+        self.fr = tk.Frame(self);
+        self.fr.pack(fill="both", expand=True)
+        self.fill()
+        listen(self, self.changed, *TICKET_CHANGES, Change.RELOADED)
+
+    def changed(self, e):
+        if e.kind == Change.RELOADED: self.u = data_store.get_attendee_by_id(self.u.attendee_id) or self.u
+        if e.kind == Change.RELOADED or e.obj.attendee_id == self.u.attendee_id: self.fill()
+
+    def fill(self):
+        c, u, fr = self.c, self.u, self.fr
+        for w in fr.winfo_children(): w.destroy()
         for tid in u.tickets:
-            t = next((x for x in data_store.tickets if x.ticket_id == tid), None)
+            t = data_store.get_ticket(tid)
             if t:
                 cf = tk.Frame(fr, relief="groove", bd=2, pady=5);
                 cf.pack(fill="x", padx=10, pady=5)
@@ -667,10 +973,9 @@ class ViewPassWindow(tk.Toplevel):
         c.create_text(30, y, text="WORKSHOPS:", anchor="w", font=("Courier", 12, "bold"));
         y += 20
         has = False
-        for r in data_store.reservations:
-            if r.attendee_id == u.attendee_id and r.status:
-                ws = data_store.workshops.get(r.workshop_id)
-                if ws: c.create_text(50, y, text=f"- {ws.topic}", anchor="w", font=("Courier", 10)); y += 20; has = True
+        for r in data_store.reservations_for(u.attendee_id, active_only=True):
+            ws = data_store.workshops.get(r.workshop_id)
+            if ws: c.create_text(50, y, text=f"- {ws.topic}", anchor="w", font=("Courier", 10)); y += 20; has = True
         if not has: c.create_text(50, y, text="- None", anchor="w", font=("Courier", 10)); y += 20
         y += 10;
         c.create_line(30, y, 480, y);
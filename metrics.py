@@ -0,0 +1,209 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# ==========================================
+# HOT-PATH INSTRUMENTATION (opt-in)
+# ==========================================
+#
+# GREENWAVE_METRICS=1 turns it on (or metrics.enable() at runtime). Instrumented code then records:
+#
+#   timers     latency histograms (count, total, max, log2 buckets of microseconds) of @timed functions and
+#              `with timer(name):` blocks; an exception raised out of one counts as "<name>.errors", and an
+#              operation returning (result, error) with an error counts as "<name>.rejected"
+#   counters   count(name, n): bytes written per store, storage errors, ...
+#
+# Read them in-process with registry.snapshot() / registry.timer(name). GREENWAVE_METRICS_FILE=path also dumps the
+# snapshot to that JSON file every GREENWAVE_METRICS_INTERVAL seconds (default 60) and at exit; `python metrics.py
+# path` prints a dump as a table. Disabled, an instrumented call costs one extra call and a flag test (~0.3 us).
+
+METRICS_CONFIG = {
+    "enabled": os.environ.get("GREENWAVE_METRICS", "0") == "1",
+    "dump_file": os.environ.get("GREENWAVE_METRICS_FILE", ""),
+    "dump_interval": float(os.environ.get("GREENWAVE_METRICS_INTERVAL", "60")),
+}
+
+# Bucket i counts durations below 2**i microseconds (the last one everything above ~67 s)
+BUCKETS = 27
+
+
+class Timer:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        self.buckets[min(BUCKETS - 1, int(seconds * 1e6).bit_length())] += 1
+
+    def percentile(self, q):
+        """Upper bound (ms) of the bucket holding the q-th quantile."""
+        if not self.count: return 0.0
+        want, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= want: return min(2 ** i / 1000, self.max * 1000)
+        return self.max * 1000
+
+    def stats(self):
+        return {"count": self.count, "total_ms": self.total * 1000,
+                "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95), "p99_ms": self.percentile(0.99),
+                "max_ms": self.max * 1000, "buckets": list(self.buckets)}
+
+
+class Registry:
+    """Every timer and counter of this process, by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            t = self.timers.get(name)
+            if t is None: t = self.timers[name] = Timer()
+            t.add(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        """stats() of one timer, or None if it never ran."""
+        with self._lock:
+            t = self.timers.get(name)
+            return t.stats() if t else None
+
+    def snapshot(self, prefix=""):
+        """{"timers": {name: stats}, "counters": {name: value}}, optionally only the names starting with prefix."""
+        with self._lock:
+            return {"pid": os.getpid(), "started": self.started, "time": time.time(),
+                    "timers": {k: t.stats() for k, t in sorted(self.timers.items()) if k.startswith(prefix)},
+                    "counters": {k: v for k, v in sorted(self.counters.items()) if k.startswith(prefix)}}
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+
+registry = Registry()
+
+
+def enabled():
+    return METRICS_CONFIG["enabled"]
+
+
+def enable(on=True):
+    METRICS_CONFIG["enabled"] = on
+
+
+def count(name, n=1):
+    if METRICS_CONFIG["enabled"]: registry.count(name, n)
+
+
+def _rejected(result):
+    return type(result) is tuple and len(result) == 2 and result[1] is not None
+
+
+def timed(name):
+    """Decorator recording each call's latency under `name` (see the module header for errors/rejections)."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_CONFIG["enabled"]: return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                registry.count(f"{name}.errors")
+                raise
+            finally:
+                registry.observe(name, time.perf_counter() - t)
+            if _rejected(result): registry.count(f"{name}.rejected")
+            return result
+        return wrapper
+    return deco
+
+
+@contextmanager
+def _timing(name):
+    t = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.count(f"{name}.errors")
+        raise
+    finally:
+        registry.observe(name, time.perf_counter() - t)
+
+
+class _Off:
+    def __enter__(self): return self
+
+    def __exit__(self, *exc): return False
+
+
+_OFF = _Off()
+
+
+def timer(name):
+    """`with timer(name):` records the block's latency (a shared no-op when disabled)."""
+    return _timing(name) if METRICS_CONFIG["enabled"] else _OFF
+
+
+# ---------- dump file ----------
+
+def dump(path=None):
+    """Writes registry.snapshot() to path (METRICS_CONFIG["dump_file"] by default), replacing it atomically."""
+    path = path or METRICS_CONFIG["dump_file"]
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f: json.dump(registry.snapshot(), f, indent=1)
+    os.replace(tmp, path)
+
+
+def start_dumping(path=None, interval=None):
+    """Dumps every `interval` seconds from a daemon thread, and once more at exit."""
+    path = path or METRICS_CONFIG["dump_file"]
+    interval = interval or METRICS_CONFIG["dump_interval"]
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            dump(path)
+    threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+    atexit.register(dump, path)
+
+
+if METRICS_CONFIG["enabled"] and METRICS_CONFIG["dump_file"]: start_dumping()
+
+
+def report(snap, out=sys.stdout):
+    """Prints a snapshot as tables, slowest total time first."""
+    out.write(f"{'timer':<36}{'count':>9}{'total ms':>12}{'mean':>10}{'p95':>10}{'max':>10}{'errors':>8}\n")
+    for name, s in sorted(snap["timers"].items(), key=lambda kv: -kv[1]["total_ms"]):
+        errors = snap["counters"].get(f"{name}.errors", 0) + snap["counters"].get(f"{name}.rejected", 0)
+        out.write(f"{name:<36}{s['count']:>9}{s['total_ms']:>12.1f}{s['mean_ms']:>10.3f}{s['p95_ms']:>10.3f}"
+                  f"{s['max_ms']:>10.3f}{errors:>8}\n")
+    out.write(f"\n{'counter':<48}{'value':>16}\n")
+    for name, v in snap["counters"].items(): out.write(f"{name:<48}{v:>16}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2: sys.exit("usage: python metrics.py DUMP_FILE")
+    with open(sys.argv[1]) as f: report(json.load(f))
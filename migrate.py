@@ -0,0 +1,32 @@
+import argparse
+import sys
+from storage import DataStore, PickleBackend
+from sqlite_store import SQLiteBackend
+
+
+def migrate(db_path, force=False):
+    """Copies the .pkl snapshots (plus any pending journal records) into a SQLite database."""
+    target = SQLiteBackend(db_path)
+    try:
+        if not target.is_empty() and not force:
+            raise RuntimeError(f"{db_path} already contains data (use --force to overwrite)")
+        src = DataStore(PickleBackend())
+        src.load_all()
+        target.snapshot(src)
+        return {"attendees": len(src.attendees), "tickets": len(src.tickets), "reservations": len(src.reservations),
+                "payments": len(src.payments), "workshops": len(src.workshops)}
+    finally:
+        target.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="One-shot migration of the GreenWave .pkl files to SQLite")
+    ap.add_argument("--db", default="greenwave.db", help="SQLite file to create (default: greenwave.db)")
+    ap.add_argument("--force", action="store_true", help="overwrite a database that already has data")
+    args = ap.parse_args()
+    try:
+        counts = migrate(args.db, args.force)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    print(", ".join(f"{k}: {v}" for k, v in counts.items()))
+    print(f"Done. Run with GREENWAVE_BACKEND=sqlite GREENWAVE_DB={args.db} to use it.")
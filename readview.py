@@ -0,0 +1,107 @@
+import threading
+from classes import Attendee
+from repository import AttendeeRepository
+
+# ==========================================
+# READ VIEWS (point-in-time reads next to writers)
+# ==========================================
+#
+# data_store.read_view() opens a ReadView: the tickets, reservations, payments, waitlist, workshops and attendees
+# as they were at that moment, for reports and exports that run while other threads (the service's writer, a
+# background save) or the report itself keep changing the store. Opening one copies nothing and holds no lock
+# afterwards. Writers call DataStore._cow() before every change instead, and each open view keeps, once, what it is
+# about to lose:
+#
+#   stores    the list (waitlist: dict) of a store, copied before its first change after the view opened. Not
+#             for records appended to a list: a view reads it up to its length when it opened
+#   records   a record changed in place, copied before its first change; attendees by attendee_id, with None for
+#             those registered since
+#
+# So a view costs writers one copy of each store and record they change while it is open, and nothing once it is
+# closed. The DataStore holds its views weakly: a view that is closed, or no longer referenced, is dropped with
+# its copies. Attendees kept on disk (STORAGE_CONFIG["attendee_cache"]) are read from the repository's source as of
+# the view, which another terminal's snapshot replaces rather than changes; SQLite's table is read as it is.
+
+_MISSING = object()
+
+
+def _copy(obj):
+    """A detached copy of a record (lists copied too)."""
+    c = object.__new__(type(obj))
+    c.__setstate__({k: (list(v) if isinstance(v, list) else v) for k, v in obj.__getstate__().items()})
+    return c
+
+
+class ReadView:
+    """The records of a DataStore as of DataStore.read_view(), see records(), workshops() and attendee()."""
+    STORES = ("tickets", "reservations", "payments", "waitlist")
+
+    def __init__(self, ds):
+        self.version = ds.version
+        self._stores = {n: getattr(ds, n) for n in self.STORES}
+        self._lengths = {n: len(s) for n, s in self._stores.items()}
+        self._shared = set(self.STORES)
+        self._workshops = ds.workshops
+        attendees = ds.attendees
+        if isinstance(attendees, AttendeeRepository):
+            # The changes the source does not hold yet win over it, see attendee()
+            changes = attendees.changes()
+            self._source, self._hidden = attendees.source, {email for email, _ in changes}
+            self._by_id = {a.attendee_id: a for _, a in changes if a is not None}
+        else:
+            self._source, self._by_id = None, ds.attendee_by_id
+        # id(record) -> (record, its copy), and attendee_id -> copy (or None) of the attendees changed since
+        self._before = {}
+        self._people = {}
+        self._lock = threading.Lock()
+
+    def keep(self, store=None, obj=None, new=False):
+        """Called by DataStore._cow() before `store` or the record `obj` changes (new=True: `obj` is being added)."""
+        with self._lock:
+            if store in self._shared:
+                self._shared.discard(store)
+                self._stores[store] = self._stores[store].copy()
+            if obj is None: return
+            if isinstance(obj, Attendee):
+                if obj.attendee_id not in self._people: self._people[obj.attendee_id] = None if new else _copy(obj)
+            elif not new and id(obj) not in self._before:
+                self._before[id(obj)] = (obj, _copy(obj))
+
+    def _get(self, obj):
+        kept = self._before.get(id(obj))
+        return obj if kept is None or kept[0] is not obj else kept[1]
+
+    def records(self, store):
+        """The records of `store` (one of STORES) as of the view, in store order."""
+        lock, stores = self._lock, self._stores
+        if store == "waitlist":
+            with lock: entries = list(stores[store].values())
+            yield from map(self._get, entries)
+            return
+        # By position, looking the list up again each time: a writer may swap in the view's copy meanwhile, and the
+        # copy holds the same records at the same positions. The lookup and the read are one step under the view's
+        # lock, which keep() takes to swap: a list looked up before the swap is never read after the writer changed it
+        for i in range(self._lengths[store]):
+            with lock: obj = self._get(stores[store][i])
+            yield obj
+
+    def workshops(self):
+        """{workshop_id: workshop} as of the view."""
+        return {wid: self._get(ws) for wid, ws in list(self._workshops.items())}
+
+    def attendee(self, aid):
+        """The attendee with this id as of the view, or None."""
+        a = self._people.get(aid, _MISSING)
+        if a is not _MISSING: return a
+        a = self._by_id.get(aid)
+        if a is not None or self._source is None: return a
+        a = self._source.by_id(aid)
+        return None if a is None or a.email in self._hidden else a
+
+    def load_attendees(self):
+        """Reads the attendees kept on disk (see repository.py) in one pass, for a report about to look up many of
+        them with attendee(): one lookup each would read the file each time."""
+        if self._source is None: return
+        by_id = {a.attendee_id: a for a in self._source.records() if a.email not in self._hidden}
+        by_id.update(self._by_id)
+        self._source, self._by_id = None, by_id
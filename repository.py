@@ -0,0 +1,308 @@
+import threading
+import weakref
+from collections import OrderedDict
+from metrics import count
+
+# ==========================================
+# DISK-BACKED ATTENDEES (STORAGE_CONFIG["attendee_cache"] > 0)
+# ==========================================
+#
+# data_store.attendees (by email) and data_store.attendee_by_id without the whole registration base in memory. The
+# records stay in the backend's copy on disk, the source: the attendees table of the SQLite backend, or for the
+# pickle backend an attendees.col snapshot written with sorted indexes of both keys (see columnar.py). A lookup by
+# email tries, in order:
+#
+#   changes   attendees put or removed (None) since the source was written, by email. Kept until the backend
+#             settle()s them (the source holds them now), so a change cannot be evicted before it is saved
+#   live      every attendee object still referenced from anywhere (the logged-in user, an open screen), through
+#             weak references, so one attendee is only ever one object
+#   source    one indexed read; the record is then held by the LRU cache of the `size` most recently used
+#
+# hits counts the lookups answered from memory, misses those that read the source, evictions the records the cache
+# let go of (they stay live while referenced elsewhere). Iterating the repository streams the source once, without
+# caching what it reads.
+#
+# Memory is bounded by `size` cached records, the attendees referenced elsewhere, and the changes. SQLite holds every
+# change once its commit is written, so settles them after each commit. The pickle backend only holds them once a
+# snapshot rewrites attendees.col: a commit that leaves more than `size` changes in memory therefore compacts the
+# journal (PickleBackend._attendees_due), so at most `size` changes are kept beyond those of the commit in progress.
+
+
+def id_floor(ids):
+    """Lowest attendee number not taken by any of `ids` ("U<number>"), see DataStore.next_id()."""
+    return max((int(i[1:]) for i in ids if i[1:].isdigit()), default=0) + 1
+
+
+def _differs(live, obj):
+    return type(live) is not type(obj) or live.__getstate__() != obj.__getstate__()
+
+
+class TableSource:
+    """An attendees snapshot written with columnar.dump(index=True), as a repository source."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def _get(self, name, key):
+        row = self.table.find(name, key)
+        return None if row is None else self.table.get(row)
+
+    def by_email(self, email):
+        return self._get("email", email)
+
+    def by_id(self, aid):
+        return self._get("attendee_id", aid)
+
+    def contains(self, email):
+        return self.table.find("email", email) is not None
+
+    def count(self):
+        return self.table.rows
+
+    def records(self):
+        return self.table.scan()
+
+    def pairs(self):
+        """(attendee_id, email) of every record."""
+        return ((a.attendee_id, a.email) for a in self.table.scan(("attendee_id", "email")))
+
+    def id_floor(self):
+        return id_floor(self.table.keys("attendee_id"))
+
+
+class AttendeeRepository:
+    """The attendees of `source` as a dict by email (get, [], in, pop, len, iteration), keeping at most `size` of
+    them cached; .by_id is the same attendees by attendee_id."""
+
+    def __init__(self, source, size):
+        self.source = source
+        self.size = size
+        self.hits = self.misses = self.evictions = 0
+        self._changes = {}
+        # email -> attendee, and attendee_id -> attendee (set and deleted through by_id, like the dict it replaces)
+        self._live = weakref.WeakValueDictionary()
+        self._live_ids = weakref.WeakValueDictionary()
+        # attendee_id -> attendee, least recently used first
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self.by_id = AttendeesById(self)
+
+    def stats(self):
+        with self._lock:
+            looked = self.hits + self.misses
+            return {"size": self.size, "cached": len(self._cache), "changed": len(self._changes), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / looked if looked else 0.0}
+
+    def _keep(self, a):
+        """Makes `a` the most recently used record, evicting the least recently used beyond `size`."""
+        cache, key = self._cache, a.attendee_id
+        cache[key] = a
+        cache.move_to_end(key)
+        while len(cache) > self.size:
+            cache.popitem(last=False)
+            self.evictions += 1
+            count("attendees.cache_evictions")
+
+    def _adopt(self, a):
+        self._live[a.email] = a
+        self._live_ids[a.attendee_id] = a
+        self._keep(a)
+
+    def _find(self, email, stored=None):
+        """The attendee under `email`, or None; `stored` is its record in the source if the caller read it already."""
+        changed = email in self._changes
+        a = self._changes[email] if changed else self._live.get(email)
+        if changed or a is not None:
+            self.hits += 1
+            count("attendees.cache_hits")
+            if a is not None: self._keep(a)
+            return a
+        self.misses += 1
+        count("attendees.cache_misses")
+        a = stored or self.source.by_email(email)
+        if a is not None: self._adopt(a)
+        return a
+
+    # ---------- by email ----------
+
+    def get(self, email, default=None):
+        with self._lock:
+            a = self._find(email)
+        return default if a is None else a
+
+    def __getitem__(self, email):
+        a = self.get(email)
+        if a is None: raise KeyError(email)
+        return a
+
+    def __contains__(self, email):
+        return self.get(email) is not None
+
+    def __setitem__(self, email, a):
+        with self._lock:
+            self._changes[email] = a
+            self._live[email] = a
+            self._live_ids[a.attendee_id] = a
+            self._keep(a)
+
+    def pop(self, email, default=None):
+        with self._lock:
+            a = self._find(email)
+            if a is None: return default
+            self._changes[email] = None
+            self._live.pop(email, None)
+            return a
+
+    def __len__(self):
+        with self._lock:
+            changes = list(self._changes.items())
+        n = self.source.count()
+        for email, a in changes:
+            stored = self.source.contains(email)
+            if a is None and stored: n -= 1
+            elif a is not None and not stored: n += 1
+        return n
+
+    def items(self):
+        """(email, attendee) of every attendee: the source's records in its order, then those only in memory.
+        Records not in use are read without being cached, so one pass does not flush the cache."""
+        for stored in self.source.records():
+            email = stored.email
+            with self._lock:
+                if email in self._changes: a = self._changes[email]
+                else: a = self._live.get(email) or stored
+            if a is not None: yield email, a
+        with self._lock:
+            added = [(email, a) for email, a in self._changes.items() if a is not None]
+        for email, a in added:
+            if not self.source.contains(email): yield email, a
+
+    def keys(self):
+        return (email for email, _ in self.items())
+
+    __iter__ = keys
+
+    def values(self):
+        return (a for _, a in self.items())
+
+    def emails_by_id(self):
+        """{attendee_id: email} of every attendee, in one pass over the source (for searching or sorting every
+        order by customer)."""
+        with self._lock:
+            changes = dict(self._changes)
+        emails = {aid: email for aid, email in self.source.pairs() if email not in changes}
+        emails.update((a.attendee_id, email) for email, a in changes.items() if a is not None)
+        return emails
+
+    def id_floor(self):
+        with self._lock:
+            ids = [a.attendee_id for a in self._changes.values() if a is not None]
+        return max(self.source.id_floor(), id_floor(ids))
+
+    # ---------- by attendee_id (see AttendeesById) ----------
+
+    def _by_id(self, aid):
+        with self._lock:
+            a = self._live_ids.get(aid)
+            if a is not None:
+                self.hits += 1
+                count("attendees.cache_hits")
+                self._keep(a)
+                return a
+            stored = self.source.by_id(aid)
+            if stored is None:
+                self.misses += 1
+                count("attendees.cache_misses")
+                return None
+            a = self._find(stored.email, stored)
+            return a if a is not None and a.attendee_id == aid else None
+
+    def _set_id(self, aid, a):
+        with self._lock:
+            self._live_ids[aid] = a
+
+    def _del_id(self, aid):
+        with self._lock:
+            self._live_ids.pop(aid, None)
+
+    def reindex(self):
+        """Forgets the ids of attendees no longer stored under their email, as a rebuilt attendee_by_id would: changes
+        applied by email alone (a replayed journal) do not keep the ids up to date."""
+        with self._lock:
+            for aid, a in list(self._live_ids.items()):
+                email = a.email
+                if (self._changes[email] if email in self._changes else self._live.get(email)) is not a:
+                    del self._live_ids[aid]
+
+    # ---------- called by the backends ----------
+
+    def changes(self):
+        """[(email, attendee or None)] of the changes the source does not hold yet."""
+        with self._lock:
+            return list(self._changes.items())
+
+    def unsettled(self):
+        """Number of changes the source does not hold yet."""
+        return len(self._changes)
+
+    def settle(self, source=None, keep=()):
+        """The source (or `source`, which replaces it) now holds every change but those to the emails in `keep`: the
+        other changed records are cached like any other from now on."""
+        with self._lock:
+            if source is not None: self.source = source
+            self._changes = {email: self._changes[email] for email in keep if email in self._changes}
+
+    def adopt(self, other, keep=()):
+        """Switches to the source of `other`, a repository over a copy another process rewrote, and returns the
+        (store, op, key, record) changes that bring the attendees in use here up to date with it, for
+        DataStore.merge_changes(). The cache is emptied first: only the records referenced elsewhere are compared,
+        the others are read from the new copy when next needed."""
+        with self._lock:
+            self._cache.clear()
+            self.settle(other.source, keep)
+            source, dels, puts = self.source, [], {}
+            live = [(email, a) for email, a in self._live.items() if email not in keep]
+            for email, a in live:
+                stored = source.by_email(email)
+                if stored is None: dels.append(("attendees", "del", email, None))
+                elif _differs(a, stored): puts[email] = stored
+                if stored is None or stored.attendee_id != a.attendee_id:
+                    # Moved to another email: put there, so that merging finds this object again by its id
+                    moved = source.by_id(a.attendee_id)
+                    if moved is not None: puts.setdefault(moved.email, moved)
+            return dels + [("attendees", "put", email, stored) for email, stored in puts.items()]
+
+
+class AttendeesById:
+    """AttendeeRepository.by_id: the attendees by attendee_id, kept up to date like the dict it stands for (adding,
+    removing and merging attendees set and delete ids). Ids not in memory are looked up in the source, then by
+    email."""
+    __slots__ = ("repo",)
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def get(self, aid, default=None):
+        a = self.repo._by_id(aid)
+        return default if a is None else a
+
+    def __getitem__(self, aid):
+        a = self.repo._by_id(aid)
+        if a is None: raise KeyError(aid)
+        return a
+
+    def __contains__(self, aid):
+        return self.repo._by_id(aid) is not None
+
+    def __setitem__(self, aid, a):
+        self.repo._set_id(aid, a)
+
+    def __delitem__(self, aid):
+        self.repo._del_id(aid)
+
+    def __iter__(self):
+        return (a.attendee_id for a in self.repo.values())
+
+    def __len__(self):
+        return len(self.repo)
@@ -0,0 +1,71 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from classes import MINUTES_PER_DAY
+
+
+class Schedule:
+    """Interval index over workshop times, maintained by DataStore next to its other indexes.
+
+    Times are (start, end) minutes since day 1 (see Workshop.interval), so one sorted list covers every
+    day: a day, a date range or a time slot is a bisect over it. Each attendee's active bookings are
+    kept as a sorted list too, which makes a clash check O(log n).
+    """
+
+    def __init__(self, workshops):
+        self.workshops = workshops
+        # (start, end, workshop_id) of every workshop, by start time
+        self.slots = sorted(ws.interval + (wid,) for wid, ws in workshops.items())
+        # Longest workshop: an interval overlapping [begin, end) starts at or after begin - longest
+        self.longest = max((s[1] - s[0] for s in self.slots), default=0)
+        self._days = sorted({s[0] // MINUTES_PER_DAY for s in self.slots})
+        self.by_attendee = defaultdict(list)
+
+    def _overlapping(self, slots, begin, end):
+        lo = bisect_left(slots, (begin - self.longest,))
+        hi = bisect_left(slots, (end,))
+        return [s for s in slots[lo:hi] if s[1] > begin]
+
+    # ---------- bookings ----------
+
+    def book(self, aid, wid):
+        ws = self.workshops.get(wid)
+        if ws is None: return
+        slot = ws.interval + (wid,)
+        mine = self.by_attendee[aid]
+        i = bisect_left(mine, slot)
+        if i == len(mine) or mine[i] != slot: mine.insert(i, slot)
+
+    def unbook(self, aid, wid):
+        ws = self.workshops.get(wid)
+        mine = self.by_attendee.get(aid)
+        if ws is None or not mine: return
+        slot = ws.interval + (wid,)
+        i = bisect_left(mine, slot)
+        if i < len(mine) and mine[i] == slot: del mine[i]
+
+    def clash(self, aid, wid):
+        """The first workshop attendee `aid` has booked that overlaps workshop `wid` (other than wid), or None."""
+        ws = self.workshops[wid]
+        start, end = ws.interval
+        for s in self._overlapping(self.by_attendee.get(aid, []), start, end):
+            if s[2] != wid: return self.workshops[s[2]]
+        return None
+
+    def booked(self, aid):
+        """Workshops attendee `aid` has booked, in time order."""
+        return [self.workshops[s[2]] for s in self.by_attendee.get(aid, [])]
+
+    # ---------- queries ----------
+
+    def during(self, begin, end):
+        """Workshops overlapping [begin, end) minutes, in time order."""
+        return [self.workshops[s[2]] for s in self._overlapping(self.slots, begin, end)]
+
+    def on_day(self, day, last=None):
+        """Workshops on date ordinal `day` (through `last`, for a range), in time order."""
+        return self.during(day * MINUTES_PER_DAY, ((last or day) + 1) * MINUTES_PER_DAY)
+
+    def days(self):
+        """Date ordinals that have workshops, in order."""
+        return self._days
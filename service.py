@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import base64
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from classes import (TicketType, PaymentMethod, Attendee, ExhibitionPass, workshop_day, BUNDLE_PRICES,
+                     ALL_ACCESS_PRICE, EXHIBITION_ADD_COST)
+from storage import data_store
+
+# ==========================================
+# HEADLESS BOOKING SERVICE (HTTP/JSON over asyncio)
+# ==========================================
+#
+# Exposes the Attendee operations to web/mobile front ends sharing one store:
+#
+#   POST   /attendees                    register {name, email, phone, password}
+#   GET    /exhibitions                  exhibitions with their workshops and free seats
+#   GET    /workshops?date=&exhibition=  workshop list
+#   GET    /me                           profile, tickets and active reservations      (auth)
+#   POST   /tickets                      purchase {bundle, payment_method, ...}        (auth)
+#   DELETE /tickets/<id>                 refund                                        (auth)
+#   POST   /tickets/<id>/upgrade         {all_access: bool, add: [exhibition]}         (auth)
+#   POST   /reservations                 reserve {workshop_id}                         (auth)
+#   DELETE /reservations/<id>            cancel                                        (auth)
+#
+# (auth) = HTTP Basic with the attendee's email and password.
+# Writes go through one writer task (one at a time, run off the event loop so fsync never
+# blocks it); reads are answered straight from memory, concurrently with the writer.
+
+MAX_BODY = 1 << 20
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = {}
+
+    def json(self):
+        if not self.body: return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(data, dict): raise HTTPError(400, "Body must be a JSON object")
+        return data
+
+
+# ---------- JSON views of the model ----------
+
+def ticket_json(t):
+    return {"ticket_id": t.ticket_id, "type": t.ticket_type.name, "price": t.price, "purchase_date": t.purchase_date,
+            "exhibitions": list(getattr(t, "selected_exhibitions", [])) if t.ticket_type == TicketType.ExhibitionPass
+            else [e.name for e in data_store.exhibitions]}
+
+
+def reservation_json(r):
+    ws = data_store.workshops.get(r.workshop_id)
+    return {"reservation_id": r.reservation_id, "workshop_id": r.workshop_id, "active": r.status,
+            "topic": ws.topic if ws else None, "date": ws.date if ws else None}
+
+
+def workshop_json(ws):
+    return {"workshop_id": ws.workshop_id, "topic": ws.topic, "exhibition": ws.exhibition_name, "date": ws.date,
+            "start_time": ws.start_time, "end_time": ws.end_time, "capacity": ws.capacity,
+            "seats_remaining": ws.get_seats_remaining()}
+
+
+class BookingService:
+    """The routes above over the process's data_store (the Attendee operations it serves write to that store)."""
+
+    def __init__(self):
+        self.routes = []
+        self.queue = None
+        self._writer_task = None
+        # One thread: the writer task hands it one write at a time
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="greenwave-writer")
+
+        self.route("POST", r"/attendees", self.register, write=True)
+        self.route("GET", r"/exhibitions", self.exhibitions)
+        self.route("GET", r"/workshops", self.workshops)
+        self.route("GET", r"/me", self.me)
+        self.route("POST", r"/tickets", self.purchase, write=True)
+        self.route("DELETE", r"/tickets/(?P<ticket_id>\d+)", self.refund, write=True)
+        self.route("POST", r"/tickets/(?P<ticket_id>\d+)/upgrade", self.upgrade, write=True)
+        self.route("POST", r"/reservations", self.reserve, write=True)
+        self.route("DELETE", r"/reservations/(?P<reservation_id>\d+)", self.cancel, write=True)
+
+    def route(self, method, pattern, handler, write=False):
+        self.routes.append((method, re.compile(pattern + "$"), handler, write))
+
+    # ---------- server plumbing ----------
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """Starts listening; port 0 picks a free port (see server.sockets[0].getsockname())."""
+        self.queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+        return await asyncio.start_server(self._connection, host, port)
+
+    async def stop(self, server):
+        server.close()
+        await server.wait_closed()
+        if self._writer_task:
+            self._writer_task.cancel()
+        self._write_pool.shutdown(wait=True)
+        data_store.flush()
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, fut = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self._write_pool, fn)
+            except Exception as e:
+                if not fut.cancelled(): fut.set_exception(e)
+            else:
+                if not fut.cancelled(): fut.set_result(result)
+
+    async def _submit(self, fn):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((fn, fut))
+        return await fut
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {"error": str(e)}, close=True)
+                    return
+                if req is None: return
+                status, body = await self._dispatch(req)
+                close = req.headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, body, close)
+                if close: return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line.strip(): return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""): break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        try:
+            n = int(headers.get("content-length") or 0)
+        except ValueError:
+            n = -1
+        if n < 0: raise HTTPError(400, "Bad Content-Length")
+        if n > MAX_BODY: raise HTTPError(413, "Body too large")
+        body = await reader.readexactly(n) if n else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+
+    async def _respond(self, writer, status, body, close=False):
+        data = json.dumps(body).encode()
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def _dispatch(self, req):
+        allowed = False
+        for method, pattern, handler, write in self.routes:
+            m = pattern.match(req.path)
+            if not m: continue
+            allowed = True
+            if method != req.method: continue
+            req.params = m.groupdict()
+            try:
+                if write:
+                    return await self._submit(lambda: handler(req))
+                return handler(req)
+            except HTTPError as e:
+                return e.status, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+        return (405, {"error": "Method not allowed"}) if allowed else (404, {"error": "Not found"})
+
+    def _user(self, req):
+        auth = req.headers.get("authorization", "")
+        try:
+            email, _, pw = base64.b64decode(auth[6:]).decode().partition(":") if auth.startswith("Basic ") else ("", "", "")
+        except ValueError:
+            email, pw = "", ""
+        user = data_store.attendees.get(email)
+        if not user or user.password != pw: raise HTTPError(401, "Invalid credentials")
+        return user
+
+    # ---------- reads ----------
+
+    def exhibitions(self, req):
+        return 200, {"exhibitions": [{"name": ex.name, "location": ex.location,
+                                      "workshops": [workshop_json(ws) for ws in list(ex.workshops)]}
+                                     for ex in list(data_store.exhibitions)]}
+
+    def workshops(self, req):
+        date = req.query.get("date", [None])[0]
+        ex = req.query.get("exhibition", [None])[0]
+        try:
+            pool = data_store.schedule.on_day(workshop_day(date)) if date else list(data_store.workshops.values())
+        except ValueError:
+            raise HTTPError(400, "date must look like 'April 15, 2026'")
+        return 200, {"workshops": [workshop_json(ws) for ws in pool if not ex or ws.exhibition_name == ex]}
+
+    def me(self, req):
+        u = self._user(req)
+        tickets = [t for t in (data_store.get_ticket(tid) for tid in list(u.tickets)) if t]
+        return 200, {"attendee_id": u.attendee_id, "name": u.name, "email": u.email, "phone": u.phone,
+                     "tickets": [ticket_json(t) for t in tickets],
+                     "reservations": [reservation_json(r)
+                                      for r in data_store.reservations_for(u.attendee_id, active_only=True)]}
+
+    # ---------- writes (run on the writer thread, one at a time) ----------
+
+    def register(self, req):
+        d = req.json()
+        a, err = Attendee.register(*(str(d.get(k, "")).strip() for k in ("name", "email", "phone", "password")))
+        if err: raise HTTPError(409 if err == "Email already exists" else 400, err)
+        return 201, {"attendee_id": a.attendee_id, "email": a.email}
+
+    def purchase(self, req):
+        u, d = self._user(req), req.json()
+        sel = d.get("exhibitions") or []
+        if d.get("all_access"):
+            tt, price = TicketType.AllAccessPass, ALL_ACCESS_PRICE
+        elif len(sel) in BUNDLE_PRICES and all(any(e.name == x for e in data_store.exhibitions) for x in sel):
+            tt, price = TicketType.ExhibitionPass, BUNDLE_PRICES[len(sel)]
+        else:
+            raise HTTPError(400, "Select 1 or 2 valid exhibitions, or all_access")
+        try:
+            method = PaymentMethod[d.get("payment_method", "")]
+        except KeyError:
+            raise HTTPError(400, "payment_method must be one of " + ", ".join(m.name for m in PaymentMethod))
+        t, err = u.purchase_ticket(tt, price, method, d.get("payment_details") or {}, list(sel))
+        if err: raise HTTPError(400, err)
+        return 201, ticket_json(t)
+
+    def refund(self, req):
+        u = self._user(req)
+        tid = int(req.params["ticket_id"])
+        if tid not in u.tickets: raise HTTPError(404, "Not found")
+        err = u.refund_ticket(tid)
+        if err: raise HTTPError(404, err)
+        return 200, {"refunded": tid}
+
+    def upgrade(self, req):
+        u, d = self._user(req), req.json()
+        tid = int(req.params["ticket_id"])
+        t = data_store.get_ticket(tid)
+        if not t or tid not in u.tickets: raise HTTPError(404, "Not found")
+        if not isinstance(t, ExhibitionPass): raise HTTPError(400, "Only exhibition passes can be upgraded")
+        if d.get("all_access"):
+            t, err = u.upgrade_ticket(tid, TicketType.AllAccessPass, ALL_ACCESS_PRICE - t.price)
+        else:
+            t, err = u.upgrade_ticket(tid, TicketType.ExhibitionPass, EXHIBITION_ADD_COST, d.get("add") or None)
+        if err: raise HTTPError(400, err)
+        return 200, ticket_json(t)
+
+    def reserve(self, req):
+        u, d = self._user(req), req.json()
+        r, err = u.reserve_workshop(str(d.get("workshop_id", "")))
+        if err: raise HTTPError(404 if err == "Workshop not found" else 409, err)
+        return 201, reservation_json(r)
+
+    def cancel(self, req):
+        u = self._user(req)
+        r = data_store.get_reservation(int(req.params["reservation_id"]))
+        if not r or r.attendee_id != u.attendee_id: raise HTTPError(404, "Not found")
+        err = u.cancel_reservation(r.reservation_id)
+        if err: raise HTTPError(409, err)
+        return 200, {"cancelled": r.reservation_id}
+
+
+# ==========================================
+# LOCAL CLIENT
+# ==========================================
+
+class BookingClient:
+    """Small asyncio client for the service, for scripts and local testing."""
+
+    def __init__(self, host="127.0.0.1", port=8080, email=None, password=None):
+        self.host, self.port = host, port
+        self.auth = base64.b64encode(f"{email}:{password}".encode()).decode() if email else None
+
+    async def request(self, method, path, body=None):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            data = json.dumps(body).encode() if body is not None else b""
+            head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\nContent-Length: {len(data)}\r\n"
+            if data: head += "Content-Type: application/json\r\n"
+            if self.auth: head += f"Authorization: Basic {self.auth}\r\n"
+            writer.write(head.encode("latin-1") + b"\r\n" + data)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            n = 0
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b""): break
+                k, _, v = h.decode("latin-1").partition(":")
+                if k.strip().lower() == "content-length": n = int(v)
+            return status, json.loads(await reader.readexactly(n)) if n else None
+        finally:
+            writer.close()
+
+
+async def main(host, port):
+    data_store.load_all()
+    service = BookingService()
+    server = await service.start(host, port)
+    print(f"GreenWave booking service on http://{host}:{server.sockets[0].getsockname()[1]}")
+    try:
+        await server.serve_forever()
+    finally:
+        await service.stop(server)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Headless GreenWave booking service (HTTP/JSON)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    args = ap.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,427 @@
+import datetime
+import json
+import sqlite3
+from contextlib import contextmanager
+from metrics import count, enabled, timed, timer
+from repository import AttendeeRepository, id_floor
+from classes import (Workshop, Exhibition, Attendee, Ticket, ExhibitionPass, AllAccessPass, Reservation, Payment,
+                     WaitlistEntry, TicketType, PaymentMethod)
+
+# ==========================================
+# SCHEMA
+# ==========================================
+
+SCHEMA_VERSION = 4
+# Rows kept in the change feed; a process that falls further behind reloads everything
+CHANGE_HISTORY = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendees (
+    email TEXT PRIMARY KEY, attendee_id TEXT NOT NULL, name TEXT, phone TEXT, password TEXT,
+    tickets TEXT NOT NULL DEFAULT '[]', reservations TEXT NOT NULL DEFAULT '[]');
+CREATE INDEX IF NOT EXISTS ix_attendees_id ON attendees (attendee_id);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id INTEGER PRIMARY KEY, attendee_id TEXT NOT NULL, price REAL NOT NULL, ticket_type INTEGER NOT NULL,
+    kind TEXT NOT NULL, purchase_date TEXT, selected_exhibitions TEXT);
+CREATE INDEX IF NOT EXISTS ix_tickets_attendee ON tickets (attendee_id);
+
+CREATE TABLE IF NOT EXISTS reservations (
+    reservation_id INTEGER PRIMARY KEY, attendee_id TEXT NOT NULL, workshop_id TEXT NOT NULL, status INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_reservations_attendee ON reservations (attendee_id);
+CREATE INDEX IF NOT EXISTS ix_reservations_slot ON reservations (workshop_id, attendee_id);
+
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id INTEGER PRIMARY KEY, attendee_id TEXT NOT NULL, amount REAL NOT NULL, method INTEGER NOT NULL,
+    details TEXT, timestamp TEXT);
+CREATE INDEX IF NOT EXISTS ix_payments_attendee ON payments (attendee_id);
+
+CREATE TABLE IF NOT EXISTS exhibitions (name TEXT PRIMARY KEY, location TEXT, position INTEGER NOT NULL);
+
+CREATE TABLE IF NOT EXISTS workshops (
+    workshop_id TEXT PRIMARY KEY, exhibition_name TEXT NOT NULL, position INTEGER NOT NULL, topic TEXT, date TEXT,
+    start_time TEXT, end_time TEXT, capacity INTEGER NOT NULL, booked INTEGER NOT NULL DEFAULT 0,
+    attendees_ids TEXT NOT NULL DEFAULT '[]');
+CREATE INDEX IF NOT EXISTS ix_workshops_exhibition ON workshops (exhibition_name, position);
+CREATE INDEX IF NOT EXISTS ix_workshops_date ON workshops (date);
+
+CREATE TABLE IF NOT EXISTS waitlist (
+    entry_id INTEGER PRIMARY KEY, workshop_id TEXT NOT NULL, attendee_id TEXT NOT NULL, priority INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_waitlist_workshop ON waitlist (workshop_id, priority, entry_id);
+
+-- Next free id of each id sequence, see lease_ids
+CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, next INTEGER NOT NULL);
+
+-- One row per committed record change, read by other processes to catch up; ('*', table) marks a table
+-- rewritten in full
+CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, store TEXT NOT NULL, key NOT NULL);
+"""
+
+TICKET_CLASSES = {"Ticket": Ticket, "ExhibitionPass": ExhibitionPass, "AllAccessPass": AllAccessPass}
+
+
+def _new(cls, **attrs):
+    # Rebuild a stored object without running __init__ (which would reset purchase dates and timestamps)
+    o = cls.__new__(cls)
+    for k, v in attrs.items(): setattr(o, k, v)
+    return o
+
+
+# ==========================================
+# ROW MAPPING
+# ==========================================
+
+def attendee_row(a):
+    return (a.email, a.attendee_id, a.name, a.phone, a.password, json.dumps(a.tickets), json.dumps(a.reservations))
+
+
+def ticket_row(t):
+    sel = getattr(t, "selected_exhibitions", None)
+    return (t.ticket_id, t.attendee_id, t.price, t.ticket_type.value, type(t).__name__, t.purchase_date,
+            json.dumps(sel) if sel is not None else None)
+
+
+def reservation_row(r):
+    return r.reservation_id, r.attendee_id, r.workshop_id, int(r.status)
+
+
+def payment_row(p):
+    return p.payment_id, p.attendee_id, p.amount, p.method.value, p.details, p.timestamp.isoformat()
+
+
+def waitlist_row(e):
+    return e.entry_id, e.workshop_id, e.attendee_id, e.priority
+
+
+def workshop_row(ws, position):
+    return (ws.workshop_id, ws.exhibition_name, position, ws.topic, ws.date, ws.start_time, ws.end_time, ws.capacity,
+            len(ws.attendees_ids), json.dumps(ws.attendees_ids))
+
+
+def attendee_from_row(email, aid, name, phone, pw, tks, rss):
+    return _new(Attendee, attendee_id=aid, name=name, email=email, phone=phone, password=pw,
+                tickets=json.loads(tks), reservations=json.loads(rss))
+
+
+def ticket_from_row(tid, aid, price, tt, kind, pdate, sel):
+    t = _new(TICKET_CLASSES[kind], ticket_id=tid, attendee_id=aid, price=price, ticket_type=TicketType(tt),
+             purchase_date=pdate)
+    if sel is not None: t.selected_exhibitions = json.loads(sel)
+    return t
+
+
+def reservation_from_row(rid, aid, wid, st):
+    return _new(Reservation, reservation_id=rid, attendee_id=aid, workshop_id=wid, status=bool(st))
+
+
+def payment_from_row(pid, aid, amt, m, d, ts):
+    return _new(Payment, payment_id=pid, attendee_id=aid, amount=amt, method=PaymentMethod(m), details=d,
+                timestamp=datetime.datetime.fromisoformat(ts))
+
+
+def waitlist_from_row(eid, wid, aid, prio):
+    return WaitlistEntry(eid, wid, aid, prio)
+
+
+def workshop_from_row(wid, exn, _, topic, date, st, et, cap, booked, ids):
+    ws = Workshop(wid, topic, date, st, et, exn, capacity=cap)
+    ws.attendees_ids = json.loads(ids)
+    return ws
+
+
+class AttendeeTable:
+    """The attendees table as the source of an AttendeeRepository (see repository.py)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _one(self, column, key):
+        row = self.conn.execute(f"SELECT * FROM attendees WHERE {column}=? LIMIT 1", (key,)).fetchone()
+        return attendee_from_row(*row) if row else None
+
+    def by_email(self, email):
+        return self._one("email", email)
+
+    def by_id(self, aid):
+        return self._one("attendee_id", aid)
+
+    def contains(self, email):
+        return self.conn.execute("SELECT 1 FROM attendees WHERE email=?", (email,)).fetchone() is not None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM attendees").fetchone()[0]
+
+    def records(self):
+        return (attendee_from_row(*row) for row in self.conn.execute("SELECT * FROM attendees"))
+
+    def pairs(self):
+        return iter(self.conn.execute("SELECT attendee_id, email FROM attendees"))
+
+    def id_floor(self):
+        return id_floor(aid for aid, in self.conn.execute("SELECT attendee_id FROM attendees"))
+
+
+# (table, primary key, row builder, object builder)
+TABLES = {
+    "attendees": ("attendees", "email", attendee_row, attendee_from_row),
+    "tickets": ("tickets", "ticket_id", ticket_row, ticket_from_row),
+    "reservations": ("reservations", "reservation_id", reservation_row, reservation_from_row),
+    "payments": ("payments", "payment_id", payment_row, payment_from_row),
+    "workshops": ("workshops", "workshop_id", None, workshop_from_row),
+    "waitlist": ("waitlist", "entry_id", waitlist_row, waitlist_from_row),
+}
+
+
+class SQLiteBackend:
+    """Keeps every record as a row in a local SQLite database (WAL mode) and writes only changed rows. With
+    attendee_cache > 0 the attendees are read from their table as needed (see repository.py) rather than all loaded."""
+
+    def __init__(self, path, attendee_cache=0):
+        self.path = path
+        self.attendee_cache = attendee_cache
+        # Autocommit mode: transactions are opened explicitly (BEGIN / BEGIN IMMEDIATE) below
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        # Last change-feed row this process has applied
+        self.seq = 0
+        self._held = 0
+        self._sync_conn = None
+        # (sequence, end) of the ids leased inside the open write transaction
+        self._leases = []
+
+    @contextmanager
+    def _write(self):
+        # Inside lock() the caller's transaction is reused; otherwise each write is its own transaction
+        if self._held:
+            yield
+            return
+        with self.lock():
+            yield
+
+    @contextmanager
+    def lock(self):
+        """Takes SQLite's write lock (BEGIN IMMEDIATE); readers in other processes are not blocked."""
+        if self._held:
+            self._held += 1
+            try:
+                yield
+            finally:
+                self._held -= 1
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("SAVEPOINT work")
+        self._held = 1
+        self._leases = []
+        try:
+            yield
+        except BaseException:
+            self._held = 0
+            if self._leases:
+                # The leased ids may already be in use: roll back everything but the leases, without letting
+                # go of the write lock in between
+                self.conn.execute("ROLLBACK TO work")
+                for name, end in self._leases:
+                    self.conn.execute("INSERT INTO sequences VALUES (?, ?) "
+                                      "ON CONFLICT (name) DO UPDATE SET next=MAX(next, excluded.next)", (name, end))
+                self.conn.execute("COMMIT")
+            else:
+                self.conn.execute("ROLLBACK")
+            raise
+        self._held = 0
+        self.conn.execute("COMMIT")
+
+    def locked(self):
+        """Whether this process holds lock()."""
+        return self._held > 0
+
+    def lease_ids(self, name, count, floor=1):
+        """Reserves `count` consecutive ids of sequence `name` (at least `floor`) and returns the first. The
+        reservation survives a rollback of the surrounding write transaction, see lock()."""
+        with self._write():
+            row = self.conn.execute("SELECT next FROM sequences WHERE name=?", (name,)).fetchone()
+            first = max(row[0] if row else 1, floor)
+            self.conn.execute("INSERT OR REPLACE INTO sequences VALUES (?, ?)", (name, first + count))
+            self._leases.append((name, first + count))
+        return first
+
+    def close(self):
+        if self._sync_conn is not None: self._sync_conn.close()
+        self.conn.close()
+
+    def is_empty(self):
+        return not any(self.conn.execute(f"SELECT 1 FROM {t} LIMIT 1").fetchone()
+                       for t in ("attendees", "tickets", "reservations", "payments", "exhibitions"))
+
+    # ---------- reading ----------
+
+    def _read(self, n):
+        """Contents of a DataStore store (one of ds.files) as read from its table(s)."""
+        with timer(f"sqlite.load.{n}"):
+            return self._read_rows(n)
+
+    def _records(self, n):
+        """What DataStore keeps for store n: a repository over the table for the attendees with attendee_cache set,
+        otherwise everything _read() reads."""
+        if n == "attendees" and self.attendee_cache:
+            return AttendeeRepository(AttendeeTable(self.conn), self.attendee_cache)
+        return self._read(n)
+
+    def _settle(self, ds, skip=()):
+        # Every attendee change is in the table now but those still pending: the repository may evict the others
+        people = ds.__dict__.get("attendees")
+        if isinstance(people, AttendeeRepository): people.settle(keep={k for s, k in skip if s == "attendees"})
+
+    def _read_rows(self, n):
+        q = self.conn.execute
+        if n == "attendees":
+            return {row[0]: attendee_from_row(*row) for row in q("SELECT * FROM attendees")}
+        if n == "exhibitions":
+            exhibitions, by_name = [], {}
+            for name, loc, _ in q("SELECT * FROM exhibitions ORDER BY position"):
+                ex = by_name[name] = Exhibition(name, loc)
+                exhibitions.append(ex)
+            for row in q("SELECT * FROM workshops ORDER BY exhibition_name, position"):
+                ws = workshop_from_row(*row)
+                if ws.exhibition_name in by_name: by_name[ws.exhibition_name].add_workshop(ws)
+            return exhibitions
+        table, pk, _, build = TABLES[n]
+        if n == "waitlist": return {row[0]: build(*row) for row in q(f"SELECT * FROM {table}")}
+        return [build(*row) for row in q(f"SELECT * FROM {table} ORDER BY {pk}")]
+
+    def load(self, ds, lazy=()):
+        """Reads every table but those of the stores in `lazy`, which are read by load_store() when first used."""
+        q = self.conn.execute
+        # One read transaction, so every table comes from the same committed state
+        outer = not self.conn.in_transaction
+        if outer: q("BEGIN")
+        try:
+            self.seq = q("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            for n in ds.files:
+                if n not in lazy: setattr(ds, n, self._records(n))
+            ds._map_workshops()
+        finally:
+            if outer: q("COMMIT")
+
+    def load_store(self, ds, n):
+        """Store n as it is now. Must hold lock(), after a catch_up: the other stores are then at the same state,
+        which is why catch_up skips the changes to stores not loaded yet."""
+        return self._records(n)
+
+    def changed(self):
+        """Cheap check (one indexed query) for commits made by other processes since our last read."""
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0] != self.seq
+
+    @timed("sqlite.catch_up")
+    def catch_up(self, ds, skip=()):
+        """Applies rows other processes changed since our last read. Must hold lock().
+
+        Tables rewritten in full since then (every table, if we fell behind the change feed) are re-read
+        and merged into the live records; returns True in that case.
+        """
+        q = self.conn.execute
+        first = q("SELECT MIN(seq) FROM changes").fetchone()[0]
+        rows = q("SELECT seq, store, key FROM changes WHERE seq > ? ORDER BY seq DESC", (self.seq,)).fetchall()
+        if first is not None and first > self.seq + 1:
+            reread = set(ds.files)
+        else:
+            # Older versions marked a rewrite with ('*', '*')
+            reread = {n for _, store, key in rows if store == "*" for n in (ds.files if key == "*" else [key])}
+        ops, seen = [], set()
+        for seq, store, key in rows:
+            # Newest first: only the latest state of each record matters
+            if (store == "*" or (store, key) in seen or store in ds.unloaded
+                    or ("exhibitions" if store == "workshops" else store) in reread):
+                continue
+            seen.add((store, key))
+            table, pk, _, build = TABLES[store]
+            row = q(f"SELECT * FROM {table} WHERE {pk}=?", (key,)).fetchone()
+            ops.append((store, "put" if row else "del", key, build(*row) if row else None))
+        if rows: self.seq = rows[0][0]
+        if reread: ds.merge_stores({n: self._records(n) for n in reread if n not in ds.unloaded}, skip)
+        ops.reverse()
+        ds.merge_changes(ops, skip)
+        self._settle(ds, skip)
+        return bool(reread)
+
+    # ---------- writing ----------
+
+    def commit(self, ds, ops, sync=True):
+        """Writes the changed rows. There is never a snapshot left to do (returns False); with
+        synchronous=NORMAL the commit becomes durable when the WAL is checkpointed, see sync()."""
+        if not ops: return False
+        q = self.conn.execute
+        measure = enabled()
+        with self._write():
+            for store, op, key, obj in ops:
+                if measure: count(f"sqlite.rows_written.{store}")
+                if store == "workshops":
+                    q("UPDATE workshops SET capacity=?, booked=?, attendees_ids=? WHERE workshop_id=?",
+                      (obj.capacity, len(obj.attendees_ids), json.dumps(obj.attendees_ids), key))
+                else:
+                    table, pk, row, _ = TABLES[store]
+                    if op == "del":
+                        q(f"DELETE FROM {table} WHERE {pk}=?", (key,))
+                    else:
+                        values = row(obj)
+                        q(f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' * len(values))})", values)
+                seq = q("INSERT INTO changes (store, key) VALUES (?, ?)", (store, key)).lastrowid
+            # We hold the write lock, so nobody else committed in between
+            self.seq = seq
+            if seq % 1000 < len(ops):
+                q("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_HISTORY,))
+        self._settle(ds, ds._pending)
+        return False
+
+    def sync(self):
+        """Checkpoints the WAL (fsyncing it first). Called from the background writer, so it uses a
+        connection of its own."""
+        if self._sync_conn is None:
+            self._sync_conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        # Waits until a write transaction still open on self.conn has committed, so the checkpoint includes it
+        self._sync_conn.execute("BEGIN IMMEDIATE")
+        self._sync_conn.execute("COMMIT")
+        self._sync_conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def snapshot(self, ds, stores=None):
+        with self._write():
+            for n in ds.files if stores is None else [n for n in ds.files if n in stores]:
+                self.write_store(ds, n)
+
+    def write_store(self, ds, n):
+        with self._write(), timer(f"sqlite.save.{n}"):
+            if n == "exhibitions":
+                self._write_exhibitions(ds)
+            else:
+                self._write_table(ds, n)
+            # Other processes re-read just this table, see catch_up
+            self.seq = self.conn.execute("INSERT INTO changes (store, key) VALUES ('*', ?)", (n,)).lastrowid
+
+    def _write_table(self, ds, n):
+        table, pk, row, _ = TABLES[n]
+        records = getattr(ds, n)
+        if isinstance(records, AttendeeRepository) and getattr(records.source, "conn", None) is self.conn:
+            # The table is the repository's source already: only the changes it keeps are missing
+            for key, a in records.changes():
+                if a is None: self.conn.execute(f"DELETE FROM {table} WHERE {pk}=?", (key,))
+                else: self.conn.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)", row(a))
+            records.settle()
+            return
+        self.conn.execute(f"DELETE FROM {table}")
+        self._insert_many(table, map(row, records.values() if isinstance(records, dict) else records))
+
+    def _write_exhibitions(self, ds):
+        self.conn.execute("DELETE FROM workshops")
+        self.conn.execute("DELETE FROM exhibitions")
+        self._insert_many("exhibitions", ((ex.name, ex.location, i) for i, ex in enumerate(ds.exhibitions)))
+        self._insert_many("workshops", (workshop_row(ws, i) for ex in ds.exhibitions for i, ws in enumerate(ex.workshops)))
+
+    def _insert_many(self, table, rows):
+        it = iter(rows)
+        first = next(it, None)
+        if first is None: return
+        sql = f"INSERT INTO {table} VALUES ({','.join('?' * len(first))})"
+        self.conn.execute(sql, first)
+        self.conn.executemany(sql, it)
@@ -1,50 +1,1484 @@
+import gc
+import heapq
 import pickle
 import os
+import struct
+import threading
+import weakref
+import zlib
+from collections import defaultdict, deque
+from contextlib import contextmanager
 # Import classes so that Pickle knows how to reconstruct objects
-from classes import Workshop, Exhibition, Attendee, Ticket, Reservation, Payment
+from classes import (Workshop, Exhibition, Attendee, Ticket, Reservation, Payment, TicketType,
+                     ALL_EXHIBITIONS, register_exhibitions)
+from aggregates import Aggregates, ticket_label
+import columnar
+from events import Change, ChangeEvent, EventBus
+from metrics import count, timed, timer
+from readview import ReadView
+from repository import AttendeeRepository, TableSource, id_floor
+from schedule import Schedule
 
+# ==========================================
+# CONFIGURATION
+# ==========================================
+
+STORAGE_CONFIG = {
+    # "pickle": .pkl snapshots (+ journal), "sqlite": row-level writes to a local SQLite file
+    "backend": os.environ.get("GREENWAVE_BACKEND", "pickle"),
+    "sqlite_file": os.environ.get("GREENWAVE_DB", "greenwave.db"),
+    # Pickle backend only. "journal": append one small record per commit, "snapshot": rewrite the changed .pkl files
+    # on save_all()
+    "mode": os.environ.get("GREENWAVE_STORAGE_MODE", "journal"),
+    # Pickle backend only. "pickle": one .pkl file per store, "columnar": attendees, tickets, payments, reservations
+    # and the waitlist as compressed typed columns (.col files, see columnar.py), loaded lazily. Either format reads
+    # the other's files, so switching takes effect as each store is next written
+    "snapshot_format": os.environ.get("GREENWAVE_SNAPSHOT_FORMAT", "pickle"),
+    # "1": the GUI reads only the exhibitions before its first frame, and every other store on first use or in the
+    # background, see DataStore.load_all(lazy=True)
+    "lazy_load": os.environ.get("GREENWAVE_LAZY_LOAD", "1") == "1",
+    # Attendees kept in memory (most recently used) when > 0: the others stay on disk, looked up by email or id
+    # (see repository.py). 0 keeps every attendee in memory. With the pickle backend the attendees are then always
+    # written as an indexed columnar file, whatever snapshot_format says
+    "attendee_cache": int(os.environ.get("GREENWAVE_ATTENDEE_CACHE", "0")),
+    "journal_file": "journal.log",
+    # Number of journal records after which the .pkl snapshots are rewritten and the journal emptied
+    "snapshot_every": 500,
+    # Taken by every process around a commit, so several terminals can share one data directory
+    "lock_file": "greenwave.lock",
+    # "1": commits are written when the transaction ends but fsynced (and snapshots rewritten) by a background
+    # thread, see PersistenceWriter
+    "async_save": os.environ.get("GREENWAVE_ASYNC_SAVE", "0") == "1",
+    # Seconds between the GUI's checks for other terminals' commits (0: only when a transaction starts or on
+    # Refresh), see DataStore.refresh()
+    "watch_interval": float(os.environ.get("GREENWAVE_WATCH", "0")),
+    # Ids a process reserves at a time from each persisted sequence, see DataStore.next_id(); the block doubles with
+    # every lease up to id_block_max, so busy writers rarely go to the backend and idle terminals waste few ids
+    "id_block": 16,
+    "id_block_max": 4096,
+}
+
+
+def _capture(obj):
+    """Copy of a record's fields (lists copied too), to be put back with _restore()."""
+    return {k: (list(v) if isinstance(v, list) else v) for k, v in obj.__getstate__().items()}
+
+
+def _store_file(store):
+    """Snapshot file of a journaled store: workshops are saved inside the exhibitions."""
+    return "exhibitions" if store == "workshops" else store
+
+
+def _differs(live, obj):
+    return live is None or type(live) is not type(obj) or live.__getstate__() != obj.__getstate__()
+
+
+def _reservation_change(r):
+    return Change.RESERVATION_CREATED if r.status else Change.RESERVATION_CANCELLED
+
+
+def _restore(obj, state):
+    for k in obj._fields:
+        if hasattr(obj, k): delattr(obj, k)
+    obj.__setstate__(state)
+
+
+# ==========================================
+# CROSS-PROCESS LOCK
+# ==========================================
+
+try:
+    import fcntl
+
+    def _lock_file(f): fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f): fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass  # LK_LOCK gives up after ~10s; keep waiting like flock does
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock shared by every process (and thread) opening the same lock file."""
+    with open(path, "a+b") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+# ==========================================
+# WRITE-AHEAD JOURNAL
+# ==========================================
+
+class Journal:
+    """Append-only log of committed changes, replayed on top of the .pkl snapshots.
+
+    The file starts with a magic + random epoch that changes on every compaction, so
+    another process can tell whether its read offset is still valid. Each record is
+    framed as <length><crc32><pickled list of ops> so that a torn write at the end of
+    the file (crash mid-append) is detected and dropped.
+    """
+    MAGIC = b"GWJ1"
+    HEADER = struct.Struct("<II")
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        # Epoch and byte offset of what this process has already applied
+        self.epoch = None
+        self.offset = 0
+
+    def _read_epoch(self, f):
+        head = f.read(len(self.MAGIC) + 16)
+        if head[:len(self.MAGIC)] == self.MAGIC and len(head) == len(self.MAGIC) + 16:
+            return head[len(self.MAGIC):], f.tell()
+        f.seek(0)
+        return b"", 0  # empty file or a journal written before epochs existed
+
+    def _frames(self, f):
+        while True:
+            head = f.read(self.HEADER.size)
+            if len(head) < self.HEADER.size: return
+            size, crc = self.HEADER.unpack(head)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc: return
+            self.offset = f.tell()
+            self.records += 1
+            yield pickle.loads(payload)
+
+    def append(self, ops, sync=True):
+        payload = pickle.dumps(ops, protocol=pickle.HIGHEST_PROTOCOL)
+        count("pickle.bytes_written.journal", self.HEADER.size + len(payload))
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                self.epoch = os.urandom(16)
+                f.write(self.MAGIC + self.epoch)
+            f.write(self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            f.flush()
+            if sync: os.fsync(f.fileno())
+            self.offset = f.tell()
+        self.records += 1
+
+    def sync(self):
+        """Makes the records appended with sync=False durable."""
+        if not os.path.exists(self.path): return
+        with open(self.path, "ab") as f:
+            os.fsync(f.fileno())
+
+    def replay(self):
+        """Yields the op list of every intact record, truncating a torn tail."""
+        self.records = 0
+        self.epoch, self.offset = None, 0
+        if not os.path.exists(self.path): return
+        with open(self.path, "rb") as f:
+            self.epoch, self.offset = self._read_epoch(f)
+            yield from self._frames(f)
+        if self.offset != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f: f.truncate(self.offset)
+
+    def read_new(self):
+        """Returns the records appended by other processes since our last read, or None if the
+        journal was compacted in the meantime (the snapshots must then be reloaded)."""
+        if not os.path.exists(self.path):
+            return [] if self.epoch is None else None
+        with open(self.path, "rb") as f:
+            epoch, start = self._read_epoch(f)
+            if epoch != self.epoch and not (self.epoch is None and start == 0 and f.read(1) == b""):
+                return None
+            f.seek(max(self.offset, start))
+            return list(self._frames(f))
+
+    def reset(self):
+        self.epoch = os.urandom(16)
+        with open(self.path, "wb") as f:
+            f.write(self.MAGIC + self.epoch)
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        self.records = 0
+
+
+# ==========================================
+# BACKENDS
+# ==========================================
+
+class PickleBackend:
+    """One .pkl snapshot per store, with committed changes appended to the journal in between.
+
+    generations.pkl counts how many times each store's snapshot was rewritten. Compaction rewrites
+    only the stores the journal touched, so a process that missed a compaction re-reads just the
+    stores whose generation moved (see catch_up).
+    """
+    GENERATIONS = "generations"
+    SEQUENCES = "sequences"
 
-class DataStore:
     def __init__(self):
-        self.files = ["attendees", "tickets", "reservations", "payments", "exhibitions"]
+        self.journal = Journal(STORAGE_CONFIG["journal_file"])
+        self._held = 0
+        # Generations of the snapshots our records are based on, and the stores journaled since
+        self.generations = {}
+        self.dirty = set()
+        self.deferred = {}
+        # Journal and generations file as of our last read or write, see changed()
+        self._seen = None
+
+    @contextmanager
+    def lock(self):
+        """Serializes commits of every process sharing these files (re-entrant within one process)."""
+        if self._held:
+            self._held += 1
+            try:
+                yield
+            finally:
+                self._held -= 1
+            return
+        with file_lock(STORAGE_CONFIG["lock_file"]):
+            self._held = 1
+            try:
+                yield
+            finally:
+                self._held = 0
+
+    def locked(self):
+        """Whether this process holds lock()."""
+        return self._held > 0
+
+    def _paths(self, n):
+        """Snapshot files store n may be in, the configured format's first."""
+        if n not in columnar.SCHEMAS: return (f"{n}.pkl",)
+        pkl, col = f"{n}.pkl", f"{n}{columnar.SUFFIX}"
+        return (col, pkl) if STORAGE_CONFIG["snapshot_format"] == "columnar" or self._on_disk(n) else (pkl, col)
+
+    @staticmethod
+    def _on_disk(n):
+        """Whether store n is an AttendeeRepository reading an indexed file (STORAGE_CONFIG["attendee_cache"])."""
+        return n == "attendees" and STORAGE_CONFIG["attendee_cache"] > 0
+
+    def _load(self, n):
+        """What store n's snapshot holds, or None if it does not exist yet. A file that cannot be read is an error,
+        not an empty store: the next snapshot would otherwise overwrite it."""
+        for path in self._paths(n):
+            try:
+                with timer(f"pickle.load.{n}"):
+                    if path.endswith(columnar.SUFFIX): return columnar.load(path)
+                    with open(path, "rb") as f: return pickle.load(f)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                count(f"pickle.load_errors.{n}")
+                raise RuntimeError(f"Could not read {path}: {e!r}") from e
+        return None
+
+    def _save(self, n, o):
+        path, *others = self._paths(n)
+        # Write to a temp file and swap it in, so a crash never leaves a half-written snapshot
+        tmp = f"{path}.tmp"
+        with timer(f"pickle.save.{n}"), open(tmp, "wb") as f:
+            if self._on_disk(n): columnar.dump(n, o, f, columnar.INDEXED_CHUNK_ROWS, index=True)
+            elif path.endswith(columnar.SUFFIX): columnar.dump(n, o, f)
+            else: pickle.dump(o, f)
+            f.flush()
+            os.fsync(f.fileno())
+            count(f"pickle.bytes_written.{n}", f.tell())
+        os.replace(tmp, path)
+        # The other format's file is now stale, and would be read if the format were switched back
+        for other in others:
+            if os.path.exists(other): os.remove(other)
+
+    def _signature(self):
+        sig = []
+        for path in (self.journal.path, f"{self.GENERATIONS}.pkl"):
+            try:
+                st = os.stat(path)
+                sig.append((st.st_size, st.st_mtime_ns, st.st_ino))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def changed(self):
+        """Cheap check (two stat calls) for commits made by other processes since our last read."""
+        return self._signature() != self._seen
+
+    def _records(self, n):
+        if self._on_disk(n): return AttendeeRepository(self._attendee_source(), STORAGE_CONFIG["attendee_cache"])
+        return self._load(n) or ({} if n in ("attendees", "waitlist") else [])
+
+    def _attendee_source(self):
+        """The attendees file as a repository source, rewritten with its indexes first if it has none (written by a
+        process that kept the attendees in memory, or still a .pkl). Same records, so same generation. Must hold
+        lock()."""
+        path = f"attendees{columnar.SUFFIX}"
+        table = self._table(path) if os.path.exists(path) else None
+        if table is None or not table.indexes:
+            self._save("attendees", self._load("attendees") or {})
+            table = self._table(path)
+        return TableSource(table)
+
+    @staticmethod
+    def _table(path):
+        try:
+            return columnar.Table(path)
+        except Exception as e:
+            count("pickle.load_errors.attendees")
+            raise RuntimeError(f"Could not read {path}: {e!r}") from e
+
+    def load(self, ds, lazy=()):
+        """Reads the snapshots and replays the journal. The stores in `lazy` are left for load_store(): the
+        journaled changes to them are kept until then."""
+        with self.lock():
+            self.generations = self._load(self.GENERATIONS) or {}
+            # Exhibitions first: their ids decode the tickets' selections
+            ds.exhibitions = self._load("exhibitions") or []
+            legacy = register_exhibitions(ds.exhibitions)
+            for n in ds.files:
+                if n != "exhibitions" and n not in lazy: setattr(ds, n, self._records(n))
+            ds._map_workshops()
+
+            self._replay(ds)
+            if legacy:
+                # Files from before exhibition ids: rewrite them all once, so every process decodes the same bits
+                self.snapshot(ds)
+            elif self.journal.records >= STORAGE_CONFIG["snapshot_every"]:
+                self.compact(ds)
+            self._seen = self._signature()
+
+    def load_store(self, ds, n):
+        """Store n as of our last read: its snapshot plus the journaled changes kept for it. Must hold lock()."""
+        records = self._records(n)
+        self._apply(ds, self.deferred.pop(n, ()), {n: records})
+        return records
+
+    def _defer(self, ds, ops):
+        """Keeps the changes to stores not loaded yet for load_store(), and returns the others."""
+        live = []
+        for op in ops:
+            if op[0] in ds.unloaded: self.deferred[op[0]].append(op)
+            else: live.append(op)
+        return live
+
+    @timed("pickle.catch_up")
+    def catch_up(self, ds, skip=()):
+        """Applies what other processes committed since our last read. Must hold lock().
+
+        If the journal was compacted in the meantime, the stores whose generation changed are re-read
+        and merged into the live records, then the new journal is applied; returns True in that case.
+        """
+        frames = self.journal.read_new()
+        reread = frames is None
+        if reread:
+            gens = self._load(self.GENERATIONS) or {}
+            fresh = {}
+            for n in ds.files:
+                if gens.get(n) == self.generations.get(n): continue
+                if n in ds.unloaded:
+                    # Read at its new generation when first used
+                    self.deferred.pop(n, None)
+                    continue
+                # A repository opens the new file instead, see DataStore.merge_stores
+                o = self._records(n) if self._on_disk(n) else self._load(n)
+                if o is not None: fresh[n] = o
+            ds.merge_stores(fresh, skip)
+            self.generations = gens
+            self.dirty = set()
+            frames = self.journal.replay()
+        for ops in frames:
+            self.dirty.update(_store_file(store) for store, _, _, _ in ops)
+            ds.merge_changes(self._defer(ds, ops), skip)
+        self._seen = self._signature()
+        return reread
+
+    def commit(self, ds, ops, sync=True):
+        """Writes a commit. With sync=False the journal record is not fsynced and a due snapshot is
+        not written but reported (True) for the caller to do later, see PersistenceWriter."""
+        full = STORAGE_CONFIG["mode"] != "journal"
+        self.dirty.update(_store_file(store) for store, _, _, _ in ops)
+        # Deferred snapshots still journal the commit, so other terminals see it right away
+        if ops and not (full and sync): self.journal.append(ops, sync)
+        due = full or self.journal.records >= STORAGE_CONFIG["snapshot_every"] or self._attendees_due(ds)
+        if due and sync: self.compact(ds)
+        self._seen = self._signature()
+        return due
+
+    @staticmethod
+    def _attendees_due(ds):
+        """True when attendees kept on disk hold more changes in memory than their cache size: the changes are only
+        let go once a snapshot writes them to attendees.col, so this bounds them."""
+        records = ds.__dict__.get("attendees")
+        return isinstance(records, AttendeeRepository) and records.unsettled() > records.size
+
+    def sync(self):
+        self.journal.sync()
+
+    def snapshot(self, ds, stores=None):
+        """Rewrites the given stores (every store by default) and empties the journal."""
+        self._write(ds, ds.files if stores is None else [n for n in ds.files if n in stores])
+        self.journal.reset()
+        self.dirty = set()
+        self._seen = self._signature()
+
+    def compact(self, ds):
+        """Snapshots the stores the journal touched and empties it."""
+        self.snapshot(ds, self.dirty)
+
+    def write_store(self, ds, n):
+        self._write(ds, [n])
+
+    def lease_ids(self, name, count, floor=1):
+        """Reserves `count` consecutive ids of sequence `name` (at least `floor`) and returns the first. The
+        reservation is durable once this returns, whatever happens to the surrounding transaction."""
+        with self.lock():
+            seqs = self._load(self.SEQUENCES) or {}
+            first = max(seqs.get(name, 1), floor)
+            seqs[name] = first + count
+            self._save(self.SEQUENCES, seqs)
+        return first
+
+    def _write(self, ds, stores):
+        if not stores: return
+        gens = self._load(self.GENERATIONS) or {}
+        for n in stores:
+            records = getattr(ds, n)
+            self._save(n, records)
+            gens[n] = gens.get(n, 0) + 1
+            if isinstance(records, AttendeeRepository):
+                # The new file holds every change but those made since the last commit
+                records.settle(self._attendee_source(), {k for s, k in ds._pending if s == "attendees"})
+        # Written last: a crash before this point leaves the journal, which is replayed anyway
+        self._save(self.GENERATIONS, gens)
+        self.generations = gens
+
+    def _replay(self, ds):
+        self.dirty = set()
+        # Store -> journaled changes to it, while it is not loaded (see load_store)
+        self.deferred = defaultdict(list)
+        live = []
+        for ops in self.journal.replay():
+            self.dirty.update(_store_file(store) for store, _, _, _ in ops)
+            live += self._defer(ds, ops)
+        self._apply(ds, live, {n: getattr(ds, n) for n in ds.files if n != "exhibitions" and n not in ds.unloaded})
+
+    def _apply(self, ds, ops, stores):
+        """Applies journaled changes to freshly read stores ({name: records}) and to the workshops."""
+        keys = {"tickets": "ticket_id", "reservations": "reservation_id", "payments": "payment_id"}
+        pos = {}
+        for store, op, key, obj in ops:
+            if store == "workshops":
+                # Update in place: the exhibitions hold references to these objects
+                ws = ds.workshops.get(key)
+                if ws: _restore(ws, obj.__getstate__())
+                continue
+            records = stores[store]
+            if store in ("attendees", "waitlist"):
+                if op == "put": records[key] = obj
+                else: records.pop(key, None)
+                continue
+            if store not in pos: pos[store] = {getattr(o, keys[store]): i for i, o in enumerate(records)}
+            i = pos[store].get(key)
+            if op == "put":
+                if i is None:
+                    pos[store][key] = len(records)
+                    records.append(obj)
+                else:
+                    records[i] = obj
+            elif i is not None:
+                records[i] = None
+                del pos[store][key]
+
+        for store in pos:
+            stores[store][:] = [o for o in stores[store] if o is not None]
+
+
+# ==========================================
+# BACKGROUND WRITER
+# ==========================================
+
+class PersistenceWriter:
+    """Thread that does the slow part of saving off the caller's thread (STORAGE_CONFIG["async_save"]).
+
+    A commit is still written when its transaction ends, so other terminals see it (and seat checks
+    stay safe across terminals); what is queued here is making it durable: the fsync, and the full
+    snapshot rewrite when one is due. Everything queued while a pass runs is coalesced into the next
+    pass. Each finished pass is reported to the listeners as None (durable) or the exception, from
+    poll() so that the GUI receives it on its own thread; so are the change events of what the
+    snapshot pass picked up from other terminals.
+    """
+
+    def __init__(self, ds):
+        self.ds = ds
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._snapshot = False
+        self._busy = False
+        self._stop = False
+        self._done = deque()
+        self._events = deque()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="greenwave-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot=False):
+        with self._cond:
+            self._queued += 1
+            self._snapshot = self._snapshot or snapshot
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queued or self._stop)
+                if not self._queued: return
+                snapshot = self._snapshot
+                self._queued, self._snapshot, self._busy = 0, False, True
+            err = None
+            try:
+                if snapshot:
+                    self._write_snapshot()
+                else:
+                    self.ds.backend.sync()
+            except Exception as e:
+                err = e
+            with self._cond:
+                self._busy = False
+                if err: self.error = err
+                self._done.append(err)
+                self._cond.notify_all()
+
+    def _write_snapshot(self):
+        ds = self.ds
+        # Waits for a running transaction; the snapshot must include what other terminals journaled
+        with ds._lock, ds.backend.lock(), ds.events.deferred() as held:
+            ds.backend.catch_up(ds, skip=set(ds._pending))
+            ds.backend.compact(ds)
+        self._events.append(held)
+
+    def poll(self):
+        """Reports finished passes to the listeners, on the calling thread."""
+        while self._events: self.ds.events.publish(self._events.popleft())
+        while self._done:
+            err = self._done.popleft()
+            for fn in self.ds._save_listeners: fn(err)
+
+    def flush(self, timeout=None):
+        """Waits until everything queued is durable, then stops the thread. Raises the last write error."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+            if not self._cond.wait_for(lambda: not self._queued and not self._busy, timeout):
+                raise TimeoutError("the storage writer did not finish in time")
+            err, self.error = self.error, None
+        self._thread.join(timeout)
+        self.poll()
+        if err: raise err
+
+
+def make_backend():
+    if STORAGE_CONFIG["backend"] == "sqlite":
+        from sqlite_store import SQLiteBackend
+        return SQLiteBackend(STORAGE_CONFIG["sqlite_file"], STORAGE_CONFIG["attendee_cache"])
+    return PickleBackend()
+
+
+class DataStore:
+    # Persisted id sequences (one per kind of record that is created with a new id)
+    SEQUENCES = ("attendees", "tickets", "payments", "reservations")
+    # Stores load_all(lazy=True) leaves on disk, with the attributes built from them: the first use of any of these
+    # loads the store (see __getattr__)
+    LAZY = {
+        "attendees": ("attendees", "attendee_by_id"),
+        "tickets": ("tickets", "ticket_index", "aggregates"),
+        "reservations": ("reservations", "reservation_index", "reservations_by_attendee", "reservation_by_slot",
+                         "schedule"),
+        "payments": ("payments", "payment_index"),
+        "waitlist": ("waitlist", "waitlists", "waitlist_counts", "waitlist_by_slot", "_waitlist_seq"),
+    }
+    _LAZY_ATTRS = {attr: n for n, attrs in LAZY.items() for attr in attrs}
+
+    def __init__(self, backend=None):
+        # Exhibitions come first: backends read the stores in this order
+        self.files = ["exhibitions", "attendees", "tickets", "reservations", "payments", "waitlist"]
         self.attendees = {}
         self.tickets = []
         self.reservations = []
         self.payments = []
+        # entry_id -> WaitlistEntry, see the WAITLISTS section
+        self.waitlist = {}
         self.exhibitions = []
         self.workshops = {}
+        self.backend = backend or make_backend()
+        # Stores left on disk by load_all(lazy=True) and not used yet, and those queued for prefetch()
+        self.unloaded = set()
+        self._prefetch = deque()
+        self._prefetcher = None
+        self._prefetch_lock = threading.Lock()
+        # Change events picked up while loading a store off the UI thread, delivered by poll_saves()
+        self._loaded_events = deque()
+        # (store, key) -> (store, op, key, obj); later changes to the same record overwrite earlier ones
+        self._pending = {}
+        # Held by the outermost transaction; threads of this process queue on it
+        self._lock = threading.RLock()
+        # Savepoint stack of the open transaction (empty when none is open)
+        self._tx = []
+        self._tx_save = False
+        # Started by the first commit when STORAGE_CONFIG["async_save"] is on
+        self._writer = None
+        self._save_listeners = []
+        # Bumped on every change to the records, so cached query results can tell they are stale
+        self.version = 0
+        self._order_query = None
+        # Typed change events for open views; published once the changes are committed
+        self.events = EventBus()
+        self._events = []
+        # attendee_id -> bitmask of the exhibitions their tickets give access to, see entitlement()
+        self._entitlements = {}
+        # Sequence -> [next id, end of the leased block, size of the next block], see next_id()
+        self._ids = {n: [0, 0, STORAGE_CONFIG["id_block"]] for n in self.SEQUENCES}
+        self._id_locks = {n: threading.Lock() for n in self.SEQUENCES}
+        # Open read views, held weakly: writers keep for them what they are about to change, see read_view()
+        self._views = weakref.WeakSet()
+        self._reindex()
 
-    def _load(self, n):
+    @timed("storage.load_all")
+    def load_all(self, lazy=False):
+        """Reads every store from the backend and rebuilds the indexes. With lazy=True only the exhibitions are
+        read now; each other store is read when one of its attributes (see LAZY) is first used, or by prefetch()."""
+        # Loading only builds records and indexes, no reference cycles: without this the collector walks the
+        # growing heap again and again, which makes loading a million records about twice as slow
+        collecting = gc.isenabled()
+        gc.disable()
         try:
-            with open(f"{n}.pkl", "rb") as f:
-                return pickle.load(f)
-        except:
-            return None
+            with self._lock:
+                self.unloaded = set(self.LAZY) if lazy else set()
+                for n in self.unloaded:
+                    for attr in self.LAZY[n]: self.__dict__.pop(attr, None)
+                self.backend.load(self, self.unloaded)
+                self._pending = {}
 
-    def _save(self, n, o):
-        with open(f"{n}.pkl", "wb") as f: pickle.dump(o, f)
+                if not self.exhibitions:
+                    self._gen_data()
+
+                self._reindex()
+        finally:
+            if collecting: gc.enable()
 
-    def load_all(self):
-        self.attendees = self._load("attendees") or {}
-        self.tickets = self._load("tickets") or []
-        self.reservations = self._load("reservations") or []
-        self.payments = self._load("payments") or []
-        self.exhibitions = self._load("exhibitions") or []
+    def __getattr__(self, name):
+        # Only reached for attributes that are not set, such as those of a store load_all(lazy=True) left on disk
+        n = DataStore._LAZY_ATTRS.get(name)
+        if n is not None and "unloaded" in self.__dict__:
+            self._load_store(n)
+            if name in self.__dict__: return self.__dict__[name]
+        raise AttributeError(f"'DataStore' object has no attribute '{name}'")
 
-        if not self.exhibitions:
-            self._gen_data()
+    def _load_store(self, n):
+        """Reads store n, if it is still on disk, and builds its indexes."""
+        with self._lock:
+            if n not in self.unloaded: return
+            # Inside a transaction, commit or catch-up the loaded stores are up to date already
+            behind = not self.backend.locked()
+            with self.backend.lock():
+                if behind: self.backend.catch_up(self, skip=set(self._pending))
+                if n not in self.unloaded: return
+                collecting = gc.isenabled()
+                gc.disable()
+                try:
+                    with timer(f"storage.load_store.{n}"):
+                        # Built on a bare store and swapped in at once: other threads read without the lock
+                        loaded = object.__new__(DataStore)
+                        loaded.__dict__.update(workshops=self.workshops, _id_floors={})
+                        setattr(loaded, n, self.backend.load_store(self, n))
+                        loaded._index(n)
+                        attrs = {attr: loaded.__dict__[attr] for attr in self.LAZY[n]}
+                finally:
+                    if collecting: gc.enable()
+                self._id_floors.update(loaded._id_floors)
+                self.__dict__.update(attrs)
+                self.unloaded.discard(n)
+                self.version += 1
 
+    def prefetch(self, *stores):
+        """Loads the given stores, those still on disk, one after another on a background thread. A store that fails
+        to load stays on disk, so that its first use raises the error."""
+        with self._prefetch_lock:
+            self._prefetch.extend(n for n in stores if n in self.unloaded and n not in self._prefetch)
+            if self._prefetch and self._prefetcher is None:
+                self._prefetcher = threading.Thread(target=self._prefetch_run, name="greenwave-prefetch", daemon=True)
+                self._prefetcher.start()
+
+    def _prefetch_run(self):
+        while True:
+            with self._prefetch_lock:
+                if not self._prefetch:
+                    self._prefetcher = None
+                    return
+                n = self._prefetch.popleft()
+            with self.events.deferred() as held:
+                try:
+                    self._load_store(n)
+                except Exception:
+                    count("storage.prefetch_errors")
+            self._loaded_events.append(held)
+
+    def _map_workshops(self):
         self.workshops = {}
         for ex in self.exhibitions:
             for ws in ex.workshops:
                 self.workshops[ws.workshop_id] = ws
 
+    @timed("storage.save_all")
     def save_all(self):
-        self._save("attendees", self.attendees)
-        self._save("tickets", self.tickets)
-        self._save("reservations", self.reservations)
-        self._save("payments", self.payments)
-        self._save("exhibitions", self.exhibitions)
+        if self._tx:
+            # Deferred: the outermost transaction commits once on exit
+            self._tx_save = True
+            return
+        with self._lock, self.backend.lock():
+            # Pick up other terminals' commits first, keeping our own version of the records we changed
+            self.backend.catch_up(self, skip=set(self._pending))
+            self._commit()
+
+    @timed("storage.refresh")
+    def refresh(self):
+        """Applies what other terminals committed since our last read, in place (see merge_changes), and
+        returns whether anything was read. Only checks the backend's change counters when nothing
+        changed, so it is cheap enough to call on a timer (STORAGE_CONFIG["watch_interval"])."""
+        if self._tx or not self.backend.changed(): return False
+        with self._lock, self.backend.lock():
+            self.backend.catch_up(self, skip=set(self._pending))
+        return True
+
+    @timed("storage.commit")
+    def _commit(self):
+        ops = list(self._pending.values())
+        self._pending = {}
+        if not STORAGE_CONFIG["async_save"]:
+            self.backend.commit(self, ops)
+        else:
+            if self._writer is None: self._writer = PersistenceWriter(self)
+            self._writer.submit(self.backend.commit(self, ops, sync=False))
+        self._publish()
+
+    def _publish(self):
+        # One event per (kind, record) even if the record changed several times in the commit
+        events = {(e.kind, id(e.obj)): e for e in self._events}
+        self._events = []
+        self.events.publish(list(events.values()))
+
+    def on_saved(self, fn):
+        """Registers fn(error) to be told when background saves become durable (error None) or fail."""
+        self._save_listeners.append(fn)
+
+    def poll_saves(self):
+        """Delivers finished background saves to the on_saved() listeners, and the change events picked up by
+        background loads to the subscribers (call it from the UI thread)."""
+        while self._loaded_events: self.events.publish(self._loaded_events.popleft())
+        if self._writer: self._writer.poll()
+
+    def flush(self, timeout=None):
+        """Blocks until every background save is durable and stops the writer (for a clean shutdown)."""
+        writer, self._writer = self._writer, None
+        if writer: writer.flush(timeout)
+
+    @timed("storage.snapshot")
+    def snapshot(self):
+        """Writes every store in full (for the pickle backend this also empties the journal)."""
+        with self._lock, self.backend.lock():
+            self._pending = {}
+            self.backend.snapshot(self)
+            self._publish()
+
+    # ==========================================
+    # TRANSACTIONS
+    # ==========================================
+
+    @contextmanager
+    def transaction(self):
+        """Groups mutations into one durable commit, rolled back in memory if the block raises.
+
+        The outermost transaction holds the store lock (this process and every other process
+        using the same files) for its whole duration and starts by applying everything other
+        terminals have committed, so read-check-write steps such as taking a seat cannot race.
+        Nested transactions act as savepoints of the outermost one; save_all() calls made
+        inside are coalesced into the single commit made when the outermost block exits.
+        Savepoints are cheap (they log what they overwrite in the pending changes rather than
+        copying them), so batch jobs can wrap every item in one, see bulk_import.py.
+        """
+        if self._tx:
+            undo = self._tx[-1][0]
+            sp = (len(undo), None, len(self._events))
+            self._tx.append((undo, sp))
+            try:
+                yield self
+            except BaseException:
+                self._rollback(undo, *sp)
+                raise
+            finally:
+                self._tx.pop()
+            return
+
+        with self._lock, self.backend.lock():
+            self.backend.catch_up(self)
+            undo = []
+            sp = (0, dict(self._pending), len(self._events))
+            self._tx = [(undo, sp)]
+            try:
+                yield self
+                # Seats freed in this transaction go to the waitlists, in the same commit
+                self._promote()
+                self._tx = []
+                if self._pending or self._tx_save: self._commit()
+            except BaseException:
+                self._rollback(undo, *sp)
+                raise
+            finally:
+                self._tx = []
+                self._tx_save = False
+
+    def _rollback(self, undo, mark, pending, events):
+        self.version += 1
+        # Undo steps reuse the mutation methods; hide the savepoints so they are not logged again
+        tx, self._tx = self._tx, []
+        try:
+            while len(undo) > mark:
+                undo.pop()()
+        finally:
+            self._tx = tx
+        # Savepoints restored their pending changes through the undo steps, see _record
+        if pending is not None: self._pending = pending
+        del self._events[events:]
+
+    def _on_undo(self, fn):
+        if self._tx: self._tx[-1][0].append(fn)
+
+    @contextmanager
+    def modifying(self, obj):
+        """Wraps an in-place change to a stored record so it is journaled (and undone on rollback)."""
+        self._cow(None, obj)
+        if self._tx:
+            state = _capture(obj)
+
+            def restore():
+                self._cow(None, obj)
+                self._count(obj, -1)
+                _restore(obj, state)
+                self._count(obj, 1)
+                if isinstance(obj, Reservation): self._index_reservation(obj)
+                self._forget(obj)
+            self._on_undo(restore)
+        self._count(obj, -1)
+        try:
+            yield obj
+        finally:
+            self._count(obj, 1)
+        self.touch(obj)
+
+    # ==========================================
+    # READ VIEWS (see readview.py)
+    # ==========================================
+
+    @contextmanager
+    def read_view(self):
+        """A ReadView of the records as they are now, for reports and exports that must not see the changes made
+        while they run; closed when the block ends. Opening it waits for a transaction running on another thread
+        to end, but writers are not blocked while it is open."""
+        with self._lock:
+            for n in self.LAZY:
+                if n in self.unloaded: self._load_store(n)
+            view = ReadView(self)
+            self._views.add(view)
+        try:
+            yield view
+        finally:
+            self._views.discard(view)
+
+    def _cow(self, store=None, obj=None, new=False):
+        """Called before `store` (its list or dict) or the record `obj` changes, so the open read views keep them
+        as they are; new=True when `obj` is being added. Appending to a list needs no call."""
+        if not self._views: return
+        for view in list(self._views): view.keep(store, obj, new)
+
+    # ==========================================
+    # SEATS
+    # ==========================================
+
+    def reserve_seat(self, workshop_id, attendee_id):
+        """Takes a seat atomically across terminals. False if the workshop is full or already booked."""
+        with self.transaction():
+            ws = self.workshops.get(workshop_id)
+            if not ws or ws.is_full() or attendee_id in ws.attendees_ids: return False
+            with self.modifying(ws):
+                ws.add_attendee(attendee_id)
+        return True
+
+    def release_seat(self, workshop_id, attendee_id):
+        with self.transaction():
+            ws = self.workshops.get(workshop_id)
+            if not ws or attendee_id not in ws.attendees_ids: return False
+            with self.modifying(ws):
+                ws.remove_attendee(attendee_id)
+        return True
+
+    # ==========================================
+    # MERGING CHANGES FROM OTHER PROCESSES
+    # ==========================================
+
+    def merge_changes(self, ops, skip=()):
+        """Applies committed (store, op, key, obj) changes to the live records and indexes.
+
+        Records that already exist are updated in place so references held elsewhere
+        (the logged-in attendee, open screens) stay valid.
+        """
+        self.version += 1
+        detached = {}
+        events = []
+        for store, op, key, obj in ops:
+            if (store, key) in skip: continue
+            if store == "attendees":
+                live = self.attendees.pop(key, None)
+                if op == "del":
+                    if live is not None:
+                        self._cow(None, live)
+                        detached[live.attendee_id] = live
+                    continue
+                # The object removed from its old email keeps its identity (a repository may have read `live` anew)
+                live = detached.pop(obj.attendee_id, None) or live or self.attendee_by_id.get(obj.attendee_id)
+                if live is not None and live.email != key: self.attendees.pop(live.email, None)
+                self._cow(None, live or obj, live is None)
+                if live is not None:
+                    _restore(live, obj.__getstate__())
+                    obj = live
+                events.append(ChangeEvent(Change.ATTENDEE_UPDATED if live else Change.ATTENDEE_REGISTERED, obj, True))
+                self._forget(obj)
+                self.attendees[key] = obj
+                self.attendee_by_id[obj.attendee_id] = obj
+            elif store == "workshops":
+                ws = self.workshops.get(key)
+                if ws:
+                    self._cow(None, ws)
+                    self.aggregates.workshop(ws, -1)
+                    _restore(ws, obj.__getstate__())
+                    self.aggregates.workshop(ws, 1)
+                    events.append(ChangeEvent(Change.WORKSHOP_UPDATED, ws, True))
+            elif store == "tickets":
+                live = self.ticket_index.get(key)
+                if live is not None:
+                    # Deleted or replaced by another pass class: the list changes, not only the record
+                    self._cow(None if type(live) is type(obj) else "tickets", live)
+                    self.aggregates.ticket(live, -1)
+                    self._forget(live)
+                if op == "del":
+                    if live is not None:
+                        self.tickets.remove(live)
+                        del self.ticket_index[key]
+                        events.append(ChangeEvent(Change.TICKET_REFUNDED, live, True))
+                    continue
+                if live is None:
+                    self.tickets.append(obj)
+                    self.ticket_index[key] = obj
+                elif type(live) is type(obj):
+                    _restore(live, obj.__getstate__())
+                    obj = live
+                else:  # upgraded to another pass class
+                    self.tickets[self.tickets.index(live)] = obj
+                    self.ticket_index[key] = obj
+                self.aggregates.ticket(obj, 1)
+                self._forget(obj)
+                events.append(ChangeEvent(Change.TICKET_UPGRADED if live else Change.TICKET_PURCHASED, obj, True))
+            elif store == "reservations":
+                live = self.reservation_index.get(key)
+                if live is None:
+                    self.reservations.append(obj)
+                    self._index_reservation(obj)
+                else:
+                    self._cow(None, live)
+                    _restore(live, obj.__getstate__())
+                    self._index_reservation(live)
+                    obj = live
+                events.append(ChangeEvent(Change.RESERVATION_CREATED if obj.status else Change.RESERVATION_CANCELLED,
+                                          obj, True))
+            elif store == "payments":
+                live = self.payment_index.get(key)
+                if live is None:
+                    self.payments.append(obj)
+                    self.payment_index[key] = obj
+                else:
+                    self._cow(None, live)
+                    _restore(live, obj.__getstate__())
+            elif store == "waitlist":
+                self._cow("waitlist", self.waitlist.get(key))
+                live = self.waitlist.pop(key, None)
+                if live is not None: self._unindex_waitlist(live)
+                if op == "put":
+                    if live is not None:
+                        _restore(live, obj.__getstate__())
+                        obj = live
+                    self.waitlist[key] = obj
+                    self._index_waitlist(obj)
+                if live is not None or op == "put":
+                    events.append(ChangeEvent(Change.WAITLIST_UPDATED, live or obj, True))
+        for a in detached.values():
+            if self.attendee_by_id.get(a.attendee_id) is a:
+                del self.attendee_by_id[a.attendee_id]
+                events.append(ChangeEvent(Change.ATTENDEE_DELETED, a, True))
+        self.events.publish(events)
+
+    def merge_stores(self, fresh, skip=()):
+        """Merges whole stores read back from disk ({name in self.files: contents}) into the live records.
+
+        Only records that differ from the live ones are applied, through merge_changes(); if the
+        exhibitions or their workshops themselves changed, they are swapped in and everything reindexed.
+        """
+        ops = []
+        for n in ("attendees", "waitlist"):
+            if n not in fresh: continue
+            new, live = fresh[n], getattr(self, n)
+            if isinstance(live, AttendeeRepository):
+                # Only the attendees in memory can be out of date: the others are read from the new copy
+                ops += live.adopt(new, {k for s, k in skip if s == n})
+                continue
+            ops += [(n, "del", k, None) for k in live.keys() - new.keys()]
+            ops += [(n, "put", k, o) for k, o in new.items() if _differs(live.get(k), o)]
+        for n, index, pk in (("tickets", "ticket_index", "ticket_id"),
+                             ("reservations", "reservation_index", "reservation_id"),
+                             ("payments", "payment_index", "payment_id")):
+            if n not in fresh: continue
+            index = getattr(self, index)
+            new = {getattr(o, pk): o for o in fresh[n]}
+            # Only tickets are ever deleted (refunds); reservations and payments are kept for the history
+            if n == "tickets": ops += [(n, "del", k, None) for k in index.keys() - new.keys()]
+            ops += [(n, "put", k, o) for k, o in new.items() if _differs(index.get(k), o)]
+        layout = None
+        if "exhibitions" in fresh:
+            register_exhibitions(fresh["exhibitions"])
+            shape = lambda exs: [(ex.name, ex.location, [ws.workshop_id for ws in ex.workshops]) for ex in exs]
+            if shape(fresh["exhibitions"]) != shape(self.exhibitions):
+                layout = fresh["exhibitions"]
+            else:
+                ops += [("workshops", "put", ws.workshop_id, ws) for ex in fresh["exhibitions"] for ws in ex.workshops
+                        if _differs(self.workshops[ws.workshop_id], ws)]
+        self.merge_changes(ops, skip)
+        if layout is not None:
+            self.exhibitions = layout
+            self._map_workshops()
+            self._reindex()
+
+    # ==========================================
+    # INDEXES (kept in step with every mutation below)
+    # ==========================================
+
+    def _reindex(self):
+        self.version += 1
+        # Lowest id each sequence may hand out, for records written before sequences existed
+        self._id_floors = {}
+        self._entitlements = {}
+        for n in self.LAZY:
+            if n not in self.unloaded: self._index(n)
+        # Called after every full (re)load: views holding records must re-read everything
+        self.events.publish([ChangeEvent(Change.RELOADED)])
+
+    def _index(self, n):
+        """Builds the attributes of store n listed in LAZY, and its id floor."""
+        if n == "attendees":
+            if isinstance(self.attendees, AttendeeRepository):
+                # Kept on disk: the repository looks ids up itself, and its id floor is read when first needed
+                self.attendees.reindex()
+                self.attendee_by_id = self.attendees.by_id
+                return
+            self.attendee_by_id = {a.attendee_id: a for a in self.attendees.values()}
+            self._id_floors[n] = id_floor(self.attendee_by_id)
+        elif n == "tickets":
+            self.ticket_index = {t.ticket_id: t for t in self.tickets}
+            self._id_floors[n] = max(self.ticket_index, default=0) + 1
+            self.aggregates = Aggregates.build(self)
+        elif n == "payments":
+            self.payment_index = {p.payment_id: p for p in self.payments}
+            self._id_floors[n] = max(self.payment_index, default=0) + 1
+        elif n == "reservations":
+            self.reservation_index = {}
+            self.reservations_by_attendee = defaultdict(list)
+            self.reservation_by_slot = {}
+            # Workshop times, and each attendee's booked times, for clash checks and day/slot queries
+            self.schedule = Schedule(self.workshops)
+            for r in self.reservations: self._index_reservation(r)
+            self._id_floors[n] = max(self.reservation_index, default=0) + 1
+        else:
+            # workshop_id -> heap of (priority, entry_id); entries that left stay in it until popped or rebuilt
+            self.waitlists = defaultdict(list)
+            self.waitlist_counts = defaultdict(int)
+            self.waitlist_by_slot = {}
+            self._waitlist_seq = 0
+            for e in self.waitlist.values(): self._index_waitlist(e)
+
+    def verify_aggregates(self, repair=False):
+        """Recomputes the dashboard aggregates from scratch and returns where the running ones drifted
+        (empty if they match). With repair=True the recomputed ones replace them."""
+        fresh = Aggregates.build(self)
+        drift = self.aggregates.diff(fresh)
+        if repair: self.aggregates = fresh
+        return drift
+
+    def entitlement(self, a):
+        """Bitmask of the exhibitions attendee `a`'s tickets give access to (ALL_EXHIBITIONS with an All-Access
+        pass). Computed once and kept until one of their tickets, or their ticket list, changes."""
+        mask = self._entitlements.get(a.attendee_id)
+        if mask is None:
+            mask = 0
+            for tid in a.tickets:
+                t = self.ticket_index.get(tid)
+                if t is None: continue
+                if t.ticket_type == TicketType.AllAccessPass:
+                    mask = ALL_EXHIBITIONS
+                    break
+                mask |= getattr(t, "selected_mask", 0)
+            self._entitlements[a.attendee_id] = mask
+        return mask
+
+    def _forget(self, obj):
+        if isinstance(obj, (Attendee, Ticket)): self._entitlements.pop(obj.attendee_id, None)
+
+    def _count(self, obj, sign):
+        if isinstance(obj, Ticket): self.aggregates.ticket(obj, sign)
+        elif isinstance(obj, Workshop): self.aggregates.workshop(obj, sign)
+
+    def _index_reservation(self, r):
+        old = self.reservation_index.get(r.reservation_id)
+        if old is not r:
+            if old is not None: self.reservations_by_attendee[old.attendee_id].remove(old)
+            self.reservation_index[r.reservation_id] = r
+            self.reservations_by_attendee[r.attendee_id].append(r)
+        slot = (r.workshop_id, r.attendee_id)
+        if r.status:
+            self.reservation_by_slot[slot] = r
+            self.schedule.book(r.attendee_id, r.workshop_id)
+        elif self.reservation_by_slot.get(slot) is r:
+            del self.reservation_by_slot[slot]
+            self.schedule.unbook(r.attendee_id, r.workshop_id)
+
+    def _index_waitlist(self, e):
+        heapq.heappush(self.waitlists[e.workshop_id], (e.priority, e.entry_id))
+        self.waitlist_counts[e.workshop_id] += 1
+        self.waitlist_by_slot[(e.workshop_id, e.attendee_id)] = e
+        self._waitlist_seq = max(self._waitlist_seq, e.entry_id)
+
+    def _unindex_waitlist(self, e):
+        wid = e.workshop_id
+        self.waitlist_counts[wid] -= 1
+        if self.waitlist_by_slot.get((wid, e.attendee_id)) is e: del self.waitlist_by_slot[(wid, e.attendee_id)]
+        heap = self.waitlists[wid]
+        # Drop the stale heap items once they outnumber the live ones
+        if len(heap) > 2 * self.waitlist_counts[wid] + 32:
+            heap[:] = [(p, i) for p, i in heap if i in self.waitlist and i != e.entry_id]
+            heapq.heapify(heap)
+
+    def get_ticket(self, tid):
+        return self.ticket_index.get(tid)
+
+    def get_reservation(self, rid):
+        return self.reservation_index.get(rid)
+
+    def get_attendee_by_id(self, aid):
+        return self.attendee_by_id.get(aid)
+
+    def reservations_for(self, aid, active_only=False):
+        rs = self.reservations_by_attendee.get(aid, [])
+        return [r for r in rs if r.status] if active_only else list(rs)
+
+    def active_reservation(self, wid, aid):
+        return self.reservation_by_slot.get((wid, aid))
+
+    # ==========================================
+    # WAITLISTS
+    # ==========================================
+
+    def waitlist_entry(self, wid, aid):
+        return self.waitlist_by_slot.get((wid, aid))
+
+    def waiting(self, wid):
+        """Number of attendees waiting for workshop `wid`."""
+        return self.waitlist_counts.get(wid, 0)
+
+    def waitlist_position(self, wid, aid):
+        """1-based place of attendee `aid` in workshop `wid`'s queue, or None if they are not on it."""
+        e = self.waitlist_by_slot.get((wid, aid))
+        if e is None: return None
+        mine = (e.priority, e.entry_id)
+        return 1 + len({i for p, i in self.waitlists[wid] if (p, i) < mine and i in self.waitlist})
+
+    def next_waitlist_id(self):
+        # Entry ids also order the queue, so they are not leased in blocks (see next_id) but follow the store-wide
+        # maximum; the caller's transaction holds the store lock and has caught up with every terminal
+        self._waitlist_seq += 1
+        return self._waitlist_seq
+
+    def _next_waiter(self, wid):
+        """The entry first in line for workshop `wid`, or None. Pops stale heap items on the way."""
+        heap = self.waitlists.get(wid)
+        while heap:
+            e = self.waitlist.get(heap[0][1])
+            if e is not None and e.workshop_id == wid: return e
+            heapq.heappop(heap)
+        return None
+
+    def set_capacity(self, wid, capacity):
+        """Admin capacity change; seats it frees are handed to the waitlist in the same commit."""
+        with self.transaction():
+            ws = self.workshops.get(wid)
+            if not ws: return "Workshop not found"
+            if capacity < len(ws.attendees_ids): return f"{len(ws.attendees_ids)} seats are already booked"
+            with self.modifying(ws):
+                ws.capacity = capacity
+        return None
+
+    def _promote(self):
+        """Gives the free seats of every workshop changed in this transaction to their waitlists, first in line
+        first. A waiter who can no longer take the seat (no ticket left, a clash) loses their place."""
+        wids = [k for store, k in self._pending if store == "workshops" and self.waiting(k)]
+        for wid in wids:
+            ws = self.workshops[wid]
+            while not ws.is_full():
+                e = self._next_waiter(wid)
+                if e is None: break
+                self.remove_waitlist_entry(e)
+                a = self.attendee_by_id.get(e.attendee_id)
+                if a is not None: a.reserve_workshop(wid)
+
+    # ==========================================
+    # IDS
+    # ==========================================
+
+    def next_id(self, name):
+        """A new id from sequence `name` (one of SEQUENCES), never handed out before by any terminal.
+
+        Each process leases blocks of ids from the backend (backend.lease_ids) and hands them out from memory, so
+        threads only contend on the sequence's own lock, and the store lock is taken once per block. Ids increase
+        within a process; ids of different terminals interleave by block, and a block's unused ids are skipped.
+        """
+        block, lock = self._ids[name], self._id_locks[name]
+        with lock:
+            if block[0] < block[1]:
+                block[0] += 1
+                return block[0] - 1
+        # Store lock before the sequence lock, the order a transaction calling next_id() takes them in
+        with self._lock:
+            # Its id floor comes from its records
+            self._load_store(name)
+            with lock:
+                if block[0] >= block[1]:
+                    n = block[2]
+                    floor = self._id_floors.get(name)
+                    if floor is None: floor = self._id_floors[name] = self.attendees.id_floor()
+                    first = self.backend.lease_ids(name, n, floor)
+                    block[:] = [first, first + n, min(2 * n, STORAGE_CONFIG["id_block_max"])]
+                block[0] += 1
+                return block[0] - 1
+
+    # ==========================================
+    # QUERIES
+    # ==========================================
+
+    ORDER_SORT_KEYS = {
+        "id": lambda ds, t: t.ticket_id,
+        "date": lambda ds, t: t.purchase_day,
+        "customer": lambda ds, t: ds._customer(t),
+        "ticket": lambda ds, t: ticket_label(t),
+        "price": lambda ds, t: t.price,
+    }
+
+    def _customer(self, t):
+        a = self.attendee_by_id.get(t.attendee_id)
+        return a.email if a else ""
+
+    def _customers(self):
+        """_customer for a pass over every ticket: a disk-backed repository reads all the emails at once rather
+        than one attendee per ticket."""
+        if not isinstance(self.attendees, AttendeeRepository): return self._customer
+        emails = self.attendees.emails_by_id()
+        return lambda t: emails.get(t.attendee_id, "")
+
+    def query_orders(self, sort=None, descending=False, search="", offset=0, limit=50):
+        """One page of the order list: (number of matching tickets, the tickets at offset..offset+limit).
+
+        sort is a key of ORDER_SORT_KEYS, or None for purchase order, which needs no work at all.
+        search matches ticket id, customer email, ticket type and purchase date. Sorted or searched
+        results are computed once and kept until the records change, so paging through them is a slice.
+        """
+        search = search.strip().lower()
+        if sort is None and not search:
+            rows, n = self.tickets, len(self.tickets)
+            if not descending: return n, rows[offset:offset + limit]
+            return n, [rows[n - 1 - i] for i in range(offset, min(n, offset + limit))]
+        key = (sort, descending, search)
+        if self._order_query is None or self._order_query[:2] != (key, self.version):
+            rows = self.tickets
+            customer = self._customers() if search or sort == "customer" else self._customer
+            if search:
+                rows = [t for t in rows if search in f"{t.ticket_id} {customer(t)} {ticket_label(t)} "
+                                                     f"{t.purchase_date}".lower()]
+            if sort is not None:
+                fn = self.ORDER_SORT_KEYS[sort]
+                rows = sorted(rows, key=customer if sort == "customer" else lambda t: fn(self, t), reverse=descending)
+            elif descending:
+                rows = rows[::-1]
+            self._order_query = (key, self.version, rows)
+        rows = self._order_query[2]
+        return len(rows), rows[offset:offset + limit]
+
+    # ==========================================
+    # MUTATIONS (persisted by the backend on the next save_all)
+    # ==========================================
+
+    def _record(self, store, op, key, obj=None, change=None):
+        self.version += 1
+        k = (store, key)
+        if len(self._tx) > 1:
+            # Inside a savepoint: remember what this overwrites so rolling the savepoint back can put it back
+            prev = self._pending.get(k)
+
+            def unrecord():
+                if prev is None: self._pending.pop(k, None)
+                else: self._pending[k] = prev
+            self._on_undo(unrecord)
+        self._pending[k] = (store, op, key, obj)
+        if change: self._events.append(ChangeEvent(change, obj))
+
+    def add_attendee(self, a):
+        self._cow(None, a, True)
+        self.attendees[a.email] = a
+        self.attendee_by_id[a.attendee_id] = a
+        self._record("attendees", "put", a.email, a, Change.ATTENDEE_REGISTERED)
+        self._on_undo(lambda: self.remove_attendee(a))
+
+    def remove_attendee(self, a):
+        self._cow(None, a)
+        self._forget(a)
+        self.attendees.pop(a.email, None)
+        if self.attendee_by_id.get(a.attendee_id) is a: del self.attendee_by_id[a.attendee_id]
+        self._record("attendees", "del", a.email)
+        self._events.append(ChangeEvent(Change.ATTENDEE_DELETED, a))
+        self._on_undo(lambda: self.add_attendee(a))
+
+    def rekey_attendee(self, a, old_email):
+        new_email = a.email
+        self.attendees.pop(old_email, None)
+        self.attendees[new_email] = a
+        self._record("attendees", "del", old_email)
+        self._record("attendees", "put", new_email, a, Change.ATTENDEE_UPDATED)
+
+        def undo():
+            self.attendees.pop(new_email, None)
+            self.attendees[old_email] = a
+        self._on_undo(undo)
+
+    def add_ticket(self, t):
+        self.tickets.append(t)
+        self.ticket_index[t.ticket_id] = t
+        self.aggregates.ticket(t, 1)
+        self._forget(t)
+        self._record("tickets", "put", t.ticket_id, t, Change.TICKET_PURCHASED)
+        self._on_undo(lambda: self.remove_ticket(t))
+
+    def replace_ticket(self, old, new):
+        self._cow("tickets")
+        self.tickets[self.tickets.index(old)] = new
+        self.ticket_index[new.ticket_id] = new
+        self.aggregates.ticket(old, -1)
+        self.aggregates.ticket(new, 1)
+        self._forget(old)
+        self._forget(new)
+        self._record("tickets", "put", new.ticket_id, new, Change.TICKET_UPGRADED)
+        self._on_undo(lambda: self.replace_ticket(new, old))
+
+    def remove_ticket(self, t):
+        if t not in self.tickets: return
+        self._cow("tickets")
+        i = self.tickets.index(t)
+        del self.tickets[i]
+        if self.ticket_index.get(t.ticket_id) is t: del self.ticket_index[t.ticket_id]
+        self.aggregates.ticket(t, -1)
+        self._forget(t)
+        self._record("tickets", "del", t.ticket_id)
+        self._events.append(ChangeEvent(Change.TICKET_REFUNDED, t))
+
+        def undo():
+            self._cow("tickets")
+            self.tickets.insert(i, t)
+            self.ticket_index[t.ticket_id] = t
+            self.aggregates.ticket(t, 1)
+            self._forget(t)
+        self._on_undo(undo)
+
+    def add_payment(self, p):
+        self.payments.append(p)
+        self.payment_index[p.payment_id] = p
+        self._record("payments", "put", p.payment_id, p)
+
+        def undo():
+            self._cow("payments")
+            self.payments.remove(p)
+            self.payment_index.pop(p.payment_id, None)
+        self._on_undo(undo)
+
+    def add_reservation(self, r):
+        self.reservations.append(r)
+        self._index_reservation(r)
+        self._record("reservations", "put", r.reservation_id, r, _reservation_change(r))
+
+        def undo():
+            self._cow("reservations")
+            self.reservations.remove(r)
+            self.reservation_index.pop(r.reservation_id, None)
+            self.reservations_by_attendee[r.attendee_id].remove(r)
+            if self.reservation_by_slot.get((r.workshop_id, r.attendee_id)) is r:
+                del self.reservation_by_slot[(r.workshop_id, r.attendee_id)]
+                self.schedule.unbook(r.attendee_id, r.workshop_id)
+        self._on_undo(undo)
+
+    def add_waitlist_entry(self, e):
+        self._cow("waitlist")
+        self.waitlist[e.entry_id] = e
+        self._index_waitlist(e)
+        self._record("waitlist", "put", e.entry_id, e, Change.WAITLIST_UPDATED)
+        self._on_undo(lambda: self.remove_waitlist_entry(e))
+
+    def remove_waitlist_entry(self, e):
+        if self.waitlist.get(e.entry_id) is not e: return
+        self._cow("waitlist")
+        del self.waitlist[e.entry_id]
+        self._unindex_waitlist(e)
+        self._record("waitlist", "del", e.entry_id)
+        self._events.append(ChangeEvent(Change.WAITLIST_UPDATED, e))
+        self._on_undo(lambda: self.add_waitlist_entry(e))
+
+    def touch(self, obj):
+        """Records an in-place change to an attendee, ticket, reservation, payment or workshop.
+
+        Prefer `with data_store.modifying(obj):` so the change can also be rolled back, and is not seen by the
+        open read views.
+        """
+        self._forget(obj)
+        if isinstance(obj, Attendee):
+            # A repository keeps a changed attendee in memory until it is saved
+            if self.attendees.get(obj.email) is obj: self.attendees[obj.email] = obj
+            self._record("attendees", "put", obj.email, obj, Change.ATTENDEE_UPDATED)
+        elif isinstance(obj, Ticket): self._record("tickets", "put", obj.ticket_id, obj, Change.TICKET_UPGRADED)
+        elif isinstance(obj, Reservation):
+            self._index_reservation(obj)
+            self._record("reservations", "put", obj.reservation_id, obj, _reservation_change(obj))
+        elif isinstance(obj, Payment): self._record("payments", "put", obj.payment_id, obj)
+        elif isinstance(obj, Workshop):
+            self._record("workshops", "put", obj.workshop_id, obj, Change.WORKSHOP_UPDATED)
 
     def _gen_data(self):
         # 3 DISTINCT WORKSHOPS PER EXHIBITION, REPEATED OVER 4 DAYS
@@ -78,8 +1512,8 @@ class DataStore:
         add_ws(e1, ex1_sessions)
         add_ws(e2, ex2_sessions)
         add_ws(e3, ex3_sessions)
-        self.save_all()
+        self.backend.write_store(self, "exhibitions")
 
 
 # Create the global instance here
-data_store = DataStore()
\ No newline at end of file
+data_store = DataStore()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """The process's data_store, reset onto a fresh data directory (tmp_path) with the generated sample conference.
+    The pickle backend in journal mode, saving synchronously, with every attendee in memory."""
+    monkeypatch.chdir(tmp_path)
+    for k, v in (("backend", "pickle"), ("mode", "journal"), ("snapshot_format", "pickle"), ("async_save", False),
+                 ("attendee_cache", 0), ("lazy_load", False)):
+        monkeypatch.setitem(storage.STORAGE_CONFIG, k, v)
+    ds = storage.data_store
+    ds.__init__(storage.PickleBackend())
+    ds.load_all()
+    yield ds
+    ds.flush()
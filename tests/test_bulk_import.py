@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bulk_import
+import storage
+from classes import ALL_ACCESS_PRICE, BUNDLE_PRICES, TicketType
+from storage import Journal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _person(i, **cols):
+    """A row registering p<i>@example.com, with `cols` added or replaced."""
+    return {"name": f"Person {i}", "email": f"p{i}@example.com", "phone": "0501234567", "password": "password1", **cols}
+
+
+def _import(rows, **kwargs):
+    errors = []
+    stats = bulk_import.import_rows(enumerate(rows, 1), on_error=lambda line, msg: errors.append((line, msg)), **kwargs)
+    return stats, errors
+
+
+def test_rejected_rows_roll_back_alone_inside_their_batch(store):
+    wid = store.exhibitions[0].workshops[0].workshop_id
+    ws = store.workshops[wid]
+    tickets, payments, commits = len(store.tickets), len(store.payments), len(list(Journal("journal.log").replay()))
+    rows = [
+        _person(1, all_access="yes", payment_method="Wallet", wallet_id="w1", workshops=wid),
+        # Registered and paid, then the second workshop fails: the whole row goes
+        _person(2, all_access="yes", payment_method="Wallet", wallet_id="w2", workshops=f"{wid};no_such_workshop"),
+        _person(3, exhibitions=store.exhibitions[1].name, payment_method="Wallet", wallet_id="w3"),
+        _person(4, exhibitions="Nowhere", payment_method="Wallet", wallet_id="w4"),
+    ]
+    stats, errors = _import(rows, batch_size=10)
+
+    assert (stats["rows"], stats["imported"], stats["failed"]) == (4, 2, 2)
+    assert errors == [(2, "no_such_workshop: Workshop not found"),
+                      (4, "Select 1 or 2 valid exhibitions, or all_access")]
+    assert "p1@example.com" in store.attendees and "p3@example.com" in store.attendees
+    assert "p2@example.com" not in store.attendees and "p4@example.com" not in store.attendees
+    assert [t.price for t in store.tickets[tickets:]] == [ALL_ACCESS_PRICE, BUNDLE_PRICES[1]]
+    assert len(store.payments) == payments + 2
+    assert ws.attendees_ids == [store.attendees["p1@example.com"].attendee_id]
+    # The batch, good rows only, is one commit
+    assert len(list(Journal("journal.log").replay())) == commits + 1
+    assert store.verify_aggregates() == []
+
+
+def test_batches_commit_separately(store):
+    commits = len(list(Journal("journal.log").replay()))
+    stats, errors = _import([_person(i) for i in range(5)], batch_size=2)
+    assert stats["imported"] == 5 and errors == []
+    assert len(list(Journal("journal.log").replay())) == commits + 3
+
+
+def test_card_numbers_are_masked(store):
+    stats, errors = _import([_person(1, all_access="1", payment_method="CreditCard", card_number="4111111111111234"),
+                             _person(2, all_access="1", payment_method="DebitCard", card_number="4111")])
+    assert errors == [(2, "Card must be 16 digits")]
+    assert store.payments[-1].details == "Card **1234"
+    store.flush()
+    with open("journal.log", "rb") as f: assert b"4111111111111234" not in f.read()
+
+
+@pytest.mark.parametrize("cols, error", [
+    ({"name": ["x"]}, "name must be a single value"),
+    ({"phone": {"n": 1}}, "phone must be a single value"),
+    ({"workshops": {"x": 1}}, 'workshops must be a list or an "A;B" string'),
+    ({"exhibitions": [1]}, "exhibitions must be a list of strings"),
+    ({"all_access": True, "payment_method": "Wallet", "payment_details": {"wallet_id": 5}},
+     "payment_details must be an object of strings"),
+])
+def test_json_values_of_the_wrong_shape_are_rejected(store, cols, error):
+    stats, errors = _import([_person(1, **cols)])
+    assert errors == [(1, error)] and "p1@example.com" not in store.attendees
+
+
+def test_jsonl_lists_and_scalars(store):
+    names = [e.name for e in store.exhibitions[:2]]
+    stats, errors = _import([_person(1, exhibitions=names, payment_method="Wallet", wallet_id=7)])
+    assert errors == []
+    t = store.get_ticket(store.attendees["p1@example.com"].tickets[0])
+    assert t.ticket_type == TicketType.ExhibitionPass and t.selected_exhibitions == names
+    assert t.price == BUNDLE_PRICES[2] and store.payments[-1].details == "Wallet: 7"
+
+
+def test_command_line_writes_the_line_error_report(store):
+    store.flush()
+    wid = store.exhibitions[0].workshops[0].workshop_id
+    with open("people.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps(_person(1, all_access=True, payment_method="Wallet", wallet_id="w", workshops=[wid])) + "\n")
+        f.write("not json\n")
+        f.write("\n")
+        f.write(json.dumps(_person(2, name=["x"])) + "\n")
+        f.write(json.dumps(_person(3, password="short")) + "\n")
+    env = dict(os.environ, PYTHONPATH=ROOT, GREENWAVE_BACKEND="pickle", GREENWAVE_STORAGE_MODE="journal",
+               GREENWAVE_ASYNC_SAVE="0", GREENWAVE_ATTENDEE_CACHE="0")
+    out = subprocess.run([sys.executable, os.path.join(ROOT, "bulk_import.py"), "people.jsonl", "--errors",
+                          "rejected.csv"], capture_output=True, text=True, timeout=120, env=env)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.startswith("1 imported, 3 rejected")
+
+    with open("rejected.csv", newline="", encoding="utf-8") as f:
+        report = list(csv.reader(f))
+    # Line numbers are the file's, blank lines included
+    assert report == [["line", "error"], ["2", "Not a JSON object"], ["4", "name must be a single value"],
+                      ["5", "Password min 8 chars"]]
+
+    store.__init__(storage.PickleBackend())
+    store.load_all()
+    a = store.attendees["p1@example.com"]
+    assert store.active_reservation(wid, a.attendee_id) is not None
+    assert "p2@example.com" not in store.attendees and "p3@example.com" not in store.attendees
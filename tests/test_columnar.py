@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+import columnar
+import storage
+from classes import (ALL_ACCESS_PRICE, BUNDLE_PRICES, AllAccessPass, Attendee, ExhibitionPass, Payment, PaymentMethod,
+                     Reservation, Ticket, TicketType, WaitlistEntry, _shell_source)
+
+
+def _state(o):
+    """What a record holds, its class included; reading the fields fills a shell."""
+    return type(o), o.__getstate__()
+
+
+def _states(records):
+    return [_state(o) for o in (records.values() if isinstance(records, dict) else records)]
+
+
+def _round_trip(tmp_path, store, records, **kwargs):
+    path = str(tmp_path / f"{store}{columnar.SUFFIX}")
+    with open(path, "wb") as f: columnar.dump(store, records, f, **kwargs)
+    return path, columnar.load(path)
+
+
+@pytest.fixture
+def records(store):
+    """Records of every columnar store whose fields between them use every column type: several classes in one
+    store, unset fields, a string holding "\\0", repeated strings, empty and long int lists, and a value that does
+    not fit its column (stored pickled)."""
+    names = [e.name for e in store.exhibitions]
+    people = []
+    for i, name in enumerate(["Plain", "Null \0 byte", "Ünïcode ☂", ""]):
+        a = Attendee(f"A{i}", name, f"p{i}@example.com", "0501234567", "same-hash" if i % 2 else f"hash {i}")
+        a.tickets, a.reservations = [i] * i, list(range(i * 1000, i * 1000 + 3 * i))
+        people.append(a)
+    legacy = Ticket(4, "A3", BUNDLE_PRICES[1], TicketType.ExhibitionPass)
+    legacy.price = "200"
+    tickets = [ExhibitionPass(1, "A0", BUNDLE_PRICES[2], names[:2]), AllAccessPass(2, "A1", ALL_ACCESS_PRICE),
+               ExhibitionPass(3, "A2", BUNDLE_PRICES[1], names[2:3]), legacy]
+    return {
+        "attendees": {a.email: a for a in people},
+        "tickets": tickets,
+        "payments": [Payment(i, f"A{i % 2}", 100.5 * i, m, f"Wallet: {i % 2}")
+                     for i, m in enumerate([*PaymentMethod, PaymentMethod.Wallet])],
+        "reservations": [Reservation(i, "A0", f"W{i % 3}", bool(i % 2)) for i in range(5)],
+        "waitlist": {i: WaitlistEntry(i, "W1", f"A{i}", i % 2) for i in range(3)},
+    }
+
+
+@pytest.mark.parametrize("chunk_rows", [columnar.CHUNK_ROWS, 2])
+def test_every_column_type_round_trips(tmp_path, records, chunk_rows):
+    for store, recs in records.items():
+        path, loaded = _round_trip(tmp_path, store, recs, chunk_rows=chunk_rows)
+        assert type(loaded) is type(recs), store
+        if isinstance(recs, dict): assert list(loaded) == list(recs), store
+        assert _states(loaded) == _states(recs), store
+    # The All-Access pass has no selection, rather than an empty one
+    assert not hasattr(_round_trip(tmp_path, "tickets", records["tickets"])[1][1], "selected_mask")
+
+
+def test_indexed_file_finds_and_builds_single_rows(tmp_path, records):
+    people = records["attendees"]
+    path = str(tmp_path / "indexed.col")
+    with open(path, "wb") as f: columnar.dump("attendees", people, f, 2, index=True)
+    table = columnar.Table(path)
+    try:
+        assert list(table.keys("email")) == sorted(people)
+        for i, a in enumerate(people.values()):
+            assert table.find("email", a.email) == table.find("attendee_id", a.attendee_id) == i
+            assert _state(table.get(i)) == _state(a)
+        assert table.find("email", "nobody@example.com") is None
+    finally:
+        table.close()
+
+
+@pytest.mark.parametrize("where", ["chunk", "footer"])
+def test_flipped_byte_is_an_error_not_a_load(tmp_path, records, where):
+    path, _ = _round_trip(tmp_path, "tickets", records["tickets"])
+    table = columnar.Table(path)
+    at = table.columns[1]["chunks"][0][1] if where == "chunk" else os.path.getsize(path) - len(columnar.MAGIC) - 20
+    table.close()
+    with open(path, "r+b") as f:
+        f.seek(at)
+        b = f.read(1)
+        f.seek(at)
+        f.write(bytes([b[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError, match=f"{where} checksum mismatch" if where == "footer" else "checksum mismatch"):
+        columnar.load(path)
+    # The backend refuses to start on it rather than take the store for empty
+    with pytest.raises(RuntimeError, match="Could not read"):
+        storage.PickleBackend()._load("tickets")
+
+
+def test_shells_decode_on_first_read_and_keep_fields_set_before(tmp_path, records):
+    _, payments = _round_trip(tmp_path, "payments", records["payments"], chunk_rows=2)
+    assert all(_shell_source(p, None) is not None for p in payments)
+    table = _shell_source(payments[0], None)[0]
+    assert table._decoded == {} and set(table._left) == {0, 1}
+
+    first, second = payments[:2]
+    first.details = "Card **0000"
+    assert first.amount == records["payments"][0].amount
+    assert _shell_source(first, None) is None
+    assert first.details == "Card **0000"
+    # Only the first chunk was decoded, and kept for the rest of its shells
+    assert set(table._decoded) == {0} and _shell_source(second, None) is not None
+    assert _state(second) == _state(records["payments"][1])
+    assert table._decoded == {} and set(table._left) == {1}
+    assert _states(payments[2:]) == _states(records["payments"][2:])
+    assert table._buf is None
+
+
+def _contents(ds):
+    return {n: _states(getattr(ds, n)) for n in columnar.SCHEMAS}
+
+
+def _load(fmt, monkeypatch):
+    monkeypatch.setitem(storage.STORAGE_CONFIG, "snapshot_format", fmt)
+    ds = storage.DataStore(storage.PickleBackend())
+    ds.load_all()
+    return ds
+
+
+@pytest.mark.parametrize("first, then", [("pickle", "columnar"), ("columnar", "pickle")])
+def test_either_format_reads_the_others_files(store, monkeypatch, first, then):
+    a, err = Attendee.register("Format", "format@example.com", "0501234567", "password1")
+    assert err is None, err
+    assert a.purchase_ticket(TicketType.AllAccessPass, ALL_ACCESS_PRICE, PaymentMethod.Wallet, {"wallet_id": "w"})[1] \
+        is None
+    assert a.reserve_workshop(store.exhibitions[0].workshops[0].workshop_id)[1] is None
+    monkeypatch.setitem(storage.STORAGE_CONFIG, "snapshot_format", first)
+    store.snapshot()
+    expected = _contents(store)
+    suffix = {"pickle": ".pkl", "columnar": columnar.SUFFIX}
+    assert all(os.path.exists(n + suffix[first]) for n in columnar.SCHEMAS)
+
+    other = _load(then, monkeypatch)
+    assert _contents(other) == expected
+    # Its next snapshot writes its own format and drops the other one's stale files
+    other.snapshot()
+    assert all(os.path.exists(n + suffix[then]) and not os.path.exists(n + suffix[first]) for n in columnar.SCHEMAS)
+    assert _contents(_load(first, monkeypatch)) == expected
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+import storage
+from classes import Attendee, PaymentMethod, TicketType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Registers `n` attendees with an All-Access pass each and has them all try to take a seat in WORKSHOP; prints the
+# seats taken. Run by several processes at once on the same data directory.
+BOOKER = """
+import sys
+from classes import Attendee, PaymentMethod, TicketType
+from storage import data_store
+data_store.load_all()
+me, n, wid = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+seats = 0
+for i in range(n):
+    a, err = Attendee.register("Worker", f"w{me}_{i}@example.com", "0501234567", "password1")
+    assert err is None, err
+    assert a.purchase_ticket(TicketType.AllAccessPass, 500.0, PaymentMethod.Wallet, {"wallet_id": "w"})[1] is None
+    seats += a.reserve_workshop(wid)[0] is not None
+data_store.flush()
+print(seats)
+"""
+
+# Prints `n` ids taken from the tickets sequence
+LEASER = """
+import sys
+from storage import data_store
+data_store.load_all()
+print(" ".join(str(data_store.next_id("tickets")) for _ in range(int(sys.argv[1]))))
+"""
+
+
+def _run_all(script, *argvs):
+    env = dict(os.environ, PYTHONPATH=ROOT, GREENWAVE_BACKEND="pickle", GREENWAVE_STORAGE_MODE="journal",
+               GREENWAVE_ASYNC_SAVE="0", GREENWAVE_ATTENDEE_CACHE="0")
+    procs = [subprocess.Popen([sys.executable, "-c", script, *map(str, argv)], env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True) for argv in argvs]
+    outs = []
+    for p in procs:
+        out, err = p.communicate(timeout=120)
+        assert p.returncode == 0, err
+        outs.append(out)
+    return outs
+
+
+def test_seats_are_never_oversold_across_processes(store):
+    ws = store.exhibitions[0].workshops[0]
+    assert store.set_capacity(ws.workshop_id, 10) is None
+    store.flush()
+
+    seats = _run_all(BOOKER, *((w, 8, ws.workshop_id) for w in range(4)))
+    assert sum(int(s) for s in seats) == 10
+
+    fresh = storage.DataStore(storage.PickleBackend())
+    fresh.load_all()
+    booked = fresh.workshops[ws.workshop_id].attendees_ids
+    assert len(booked) == len(set(booked)) == 10
+    assert len(fresh.attendees) == 32
+    for name, key in (("attendees", "attendee_id"), ("tickets", "ticket_id"), ("payments", "payment_id"),
+                      ("reservations", "reservation_id")):
+        records = fresh.attendees.values() if name == "attendees" else getattr(fresh, name)
+        ids = [getattr(o, key) for o in records]
+        assert len(ids) == len(set(ids)), name
+    active = [r for r in fresh.reservations if r.workshop_id == ws.workshop_id and r.status]
+    assert sorted(r.attendee_id for r in active) == sorted(booked)
+    assert fresh.verify_aggregates() == []
+
+
+def test_id_leases_never_overlap_across_processes(store):
+    # Taken here too, so this process holds a lease while the others take theirs
+    mine = [store.next_id("tickets") for _ in range(5)]
+    outs = _run_all(LEASER, *((100,) for _ in range(4)))
+    ids = mine + [int(i) for out in outs for i in out.split()]
+    assert len(ids) == 405 and len(ids) == len(set(ids))
+    # Tickets bought here take the rest of this process's block, which no other process was given
+    a, err = Attendee.register("After", "after@example.com", "0501234567", "password1")
+    assert err is None, err
+    t, err = a.purchase_ticket(TicketType.AllAccessPass, 500.0, PaymentMethod.Wallet, {"wallet_id": "w"})
+    assert err is None and t.ticket_id not in ids
@@ -0,0 +1,104 @@
+import datetime
+import os
+import pickle
+
+import pytest
+
+import storage
+from classes import (ALL_ACCESS_PRICE, BUNDLE_PRICES, EXHIBITION_ADD_COST, AllAccessPass, Attendee, Exhibition,
+                     ExhibitionPass, PaymentMethod, TicketType, exhibition_bit)
+
+
+class _Old:
+    """Pickles as a `cls` whose state is `state`: a record as versions before exhibition ids wrote it."""
+
+    def __init__(self, cls, **state):
+        self.cls, self.state = cls, state
+
+    def __reduce__(self):
+        return object.__new__, (self.cls,), self.state
+
+
+def _person(i, tickets):
+    return _Old(Attendee, attendee_id=f"A{i}", name=f"Old {i}", email=f"old{i}@example.com", phone="0501234567",
+                password="password1", tickets=tickets, reservations=[])
+
+
+def _pass(tid, aid, names):
+    return _Old(ExhibitionPass, ticket_id=tid, attendee_id=aid, price=BUNDLE_PRICES[len(names)],
+                ticket_type=TicketType.ExhibitionPass, purchase_date="01 / March / 2026", selected_exhibitions=names)
+
+
+@pytest.fixture
+def legacy(store):
+    """The sample conference's exhibitions and three attendees, written as .pkl files from before exhibition ids
+    (no ex_id, tickets holding a list of names and a purchase date string), loaded into store."""
+    names = [e.name for e in store.exhibitions]
+    files = {
+        "exhibitions": [_Old(Exhibition, name=e.name, location=e.location, workshops=e.workshops)
+                        for e in store.exhibitions],
+        "attendees": {p.state["email"]: p for p in (_person(1, [1]), _person(2, [2]), _person(3, [3]))},
+        "tickets": [_pass(1, "A1", names[:1]), _pass(2, "A2", names[:2]),
+                    _Old(AllAccessPass, ticket_id=3, attendee_id="A3", price=ALL_ACCESS_PRICE,
+                         ticket_type=TicketType.AllAccessPass, purchase_date="02 / March / 2026")],
+    }
+    store.flush()
+    for f in os.listdir("."): os.remove(f)
+    for n, o in files.items():
+        with open(f"{n}.pkl", "wb") as f: pickle.dump(o, f)
+    store.__init__(storage.PickleBackend())
+    store.load_all()
+    return store, names
+
+
+def _snapshot(n):
+    with open(f"{n}.pkl", "rb") as f: return pickle.load(f)
+
+
+def test_legacy_files_are_rewritten_with_ids_and_masks(legacy):
+    ds, names = legacy
+    assert [e.ex_id for e in _snapshot("exhibitions")] == [e.ex_id for e in ds.exhibitions]
+    saved = {t.ticket_id: t.__getstate__() for t in _snapshot("tickets")}
+    assert saved[1]["selected_mask"] == exhibition_bit(names[0])
+    assert saved[2]["selected_mask"] == exhibition_bit(names[0]) | exhibition_bit(names[1])
+    assert "selected_mask" not in saved[3]
+    assert saved[1]["purchase_day"] == datetime.date(2026, 3, 1).toordinal()
+    assert not any("selected_exhibitions" in s or "purchase_date" in s for s in saved.values())
+
+    one, two, vip = (ds.attendees[f"old{i}@example.com"] for i in (1, 2, 3))
+    assert ds.get_ticket(2).selected_exhibitions == names[:2]
+    assert [one.can_access(n) for n in names] == [True] + [False] * (len(names) - 1)
+    assert all(vip.can_access(n) for n in names)
+
+
+def test_legacy_tickets_upgrade(legacy):
+    ds, names = legacy
+    one, two = ds.attendees["old1@example.com"], ds.attendees["old2@example.com"]
+    t, err = one.upgrade_ticket(1, TicketType.ExhibitionPass, EXHIBITION_ADD_COST, names[1:2])
+    assert err is None, err
+    assert t.selected_exhibitions == names[:2] and t.price == BUNDLE_PRICES[1] + EXHIBITION_ADD_COST
+    assert one.can_access(names[1])
+    assert one.reserve_workshop(ds.exhibitions[1].workshops[0].workshop_id)[1] is None
+    t, err = two.upgrade_ticket(2, TicketType.AllAccessPass, ALL_ACCESS_PRICE - BUNDLE_PRICES[2])
+    assert err is None, err
+    assert isinstance(t, AllAccessPass) and two.can_access(names[-1])
+
+    fresh = storage.DataStore(storage.PickleBackend())
+    fresh.load_all()
+    assert fresh.get_ticket(1).selected_exhibitions == names[:2]
+    assert isinstance(fresh.get_ticket(2), AllAccessPass)
+    assert fresh.verify_aggregates() == []
+
+
+def test_unknown_exhibition_names_are_errors_not_new_ids(legacy):
+    ds, names = legacy
+    one = ds.attendees["old1@example.com"]
+    payments = len(ds.payments)
+
+    assert one.upgrade_ticket(1, TicketType.ExhibitionPass, EXHIBITION_ADD_COST, ["Nowhere"]) == (
+        None, "Unknown exhibition 'Nowhere'")
+    assert ds.get_ticket(1).selected_exhibitions == names[:1] and ds.get_ticket(1).price == BUNDLE_PRICES[1]
+    assert one.purchase_ticket(TicketType.ExhibitionPass, BUNDLE_PRICES[1], PaymentMethod.Wallet, {"wallet_id": "w"},
+                               ["Nowhere"]) == (None, "Unknown exhibition 'Nowhere'")
+    assert len(ds.payments) == payments and one.tickets == [1]
+    assert exhibition_bit("Nowhere") == 0
@@ -0,0 +1,99 @@
+import csv
+import datetime
+import json
+
+import pytest
+
+import export
+from classes import ALL_ACCESS_PRICE, BUNDLE_PRICES, Attendee, PaymentMethod, TicketType
+
+DAYS = [datetime.date(2026, 3, d) for d in (1, 2, 3)]
+
+
+@pytest.fixture
+def sales(store):
+    """An All-Access holder, then an Exhibition Pass holder for each of the first two exhibitions, buying on DAYS
+    one after another; each books a workshop of the exhibition of their pass, the second's for the All-Access holder."""
+    ex = store.exhibitions
+    out = []
+    for i, sel in enumerate([None, [ex[0].name], [ex[1].name]]):
+        a, err = Attendee.register(f"Buyer {i}", f"buyer{i}@example.com", "0501234567", "password1")
+        assert err is None, err
+        tt = TicketType.AllAccessPass if sel is None else TicketType.ExhibitionPass
+        t, err = a.purchase_ticket(tt, ALL_ACCESS_PRICE if sel is None else BUNDLE_PRICES[1], PaymentMethod.Wallet,
+                                   {"wallet_id": f"w{i}"}, sel)
+        assert err is None, err
+        p = store.payments[-1]
+        noon = datetime.datetime.combine(DAYS[i], datetime.time(12))
+        with store.transaction(), store.modifying(t), store.modifying(p):
+            t.purchase_date, p.timestamp = DAYS[i], noon
+        assert a.reserve_workshop(ex[1 if sel is None else i - 1].workshops[i].workshop_id)[1] is None
+        out.append((a, t, p))
+    return store, out
+
+
+def _export(dataset, fmt="csv", **kwargs):
+    path = f"{dataset}.{fmt}"
+    n = export.export(dataset, path, fmt, **kwargs)
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv": rows = list(csv.DictReader(f))
+        elif fmt == "jsonl": rows = [json.loads(line) for line in f]
+        else:
+            rows = []
+            for chunk in map(json.loads, f):
+                cols = chunk["columns"]
+                rows += [dict(zip(cols, values)) for values in zip(*cols.values())]
+    assert n == len(rows)
+    return rows
+
+
+def test_csv_jsonl_and_columns_write_the_same_orders(sales):
+    ds, people = sales
+    names = [e.name for e in ds.exhibitions[:2]]
+    rows = {fmt: _export("orders", fmt, chunk_size=2) for fmt in ("csv", "jsonl", "columns")}
+    assert rows["jsonl"] == rows["columns"]
+    assert list(rows["csv"][0]) == list(export.COLUMNS["orders"])
+
+    mine = [r for r in rows["jsonl"] if r["email"].startswith("buyer")]
+    assert [(r["ticket_id"], r["purchase_date"], r["email"], r["exhibitions"], r["price"]) for r in mine] == [
+        (t.ticket_id, d.isoformat(), a.email, sel, t.price)
+        for (a, t, _), d, sel in zip(people, DAYS, [[], names[:1], names[1:]])]
+    # The same rows in CSV, as text and with the exhibitions joined by ";"
+    assert [r for r in rows["csv"] if r["email"].startswith("buyer")] == [
+        {k: ";".join(v) if isinstance(v, list) else str(v) for k, v in r.items()} for r in mine]
+
+
+@pytest.mark.parametrize("dataset, key", [("orders", "ticket_id"), ("payments", "payment_id")])
+@pytest.mark.parametrize("since, until, expected", [
+    (DAYS[1], None, [1, 2]), (None, DAYS[1], [0, 1]), (DAYS[1], DAYS[1], [1]), (DAYS[2], DAYS[0], []),
+])
+def test_since_and_until_are_both_included(sales, dataset, key, since, until, expected):
+    ids = [getattr(t if dataset == "orders" else p, key) for _, t, p in sales[1]]
+    rows = _export(dataset, "jsonl", since=since, until=until)
+    assert [r[key] for r in rows if r[key] in ids] == [ids[i] for i in expected]
+
+
+def test_reservations_are_filtered_by_workshop_date(sales):
+    rows = _export("reservations", "jsonl")
+    days = sorted({r["date"] for r in rows})
+    only = _export("reservations", "jsonl", since=datetime.date.fromisoformat(days[0]),
+                   until=datetime.date.fromisoformat(days[0]))
+    assert only and {r["date"] for r in only} == {days[0]}
+    assert [r for r in rows if r["date"] == days[0]] == only
+
+
+def test_exhibition_filter_counts_all_access_tickets(sales):
+    ds, people = sales
+    (vip, vip_t, vip_p), (first, first_t, first_p), (second, second_t, second_p) = people
+    name = ds.exhibitions[1].name
+
+    assert [r["ticket_id"] for r in _export("orders", exhibition=name)] == [str(vip_t.ticket_id),
+                                                                             str(second_t.ticket_id)]
+    assert [r["payment_id"] for r in _export("payments", exhibition=name)] == [str(vip_p.payment_id),
+                                                                               str(second_p.payment_id)]
+    rows = _export("reservations", "jsonl", exhibition=name)
+    assert {r["exhibition"] for r in rows} == {name}
+    assert {r["email"] for r in rows} == {vip.email, second.email}
+
+    with pytest.raises(ValueError, match="No exhibition"):
+        export.export("orders", "none.csv", exhibition="Nowhere")
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import storage
+from classes import BUNDLE_PRICES, EXHIBITION_ADD_COST, Attendee, PaymentMethod, TicketType
+from storage import Journal
+
+
+def _register(email):
+    a, err = Attendee.register("Journal Test", email, "0501234567", "password1")
+    assert err is None, err
+    return a
+
+
+def _fresh():
+    ds = storage.DataStore(storage.PickleBackend())
+    ds.load_all()
+    return ds
+
+
+def test_commits_are_journaled_and_replayed(store):
+    a = _register("j1@example.com")
+    t, err = a.purchase_ticket(TicketType.AllAccessPass, 500.0, PaymentMethod.Wallet, {"wallet_id": "w1"})
+    assert err is None, err
+    # Only the journal holds the commits until the next compaction
+    assert os.path.getsize("journal.log") > 0
+    assert "j1@example.com" not in (storage.PickleBackend()._load("attendees") or {})
+
+    other = _fresh()
+    assert other.attendees["j1@example.com"].tickets == [t.ticket_id]
+    assert other.get_ticket(t.ticket_id).price == 500.0
+    assert [p.attendee_id for p in other.payments] == [a.attendee_id]
+    assert other.verify_aggregates() == []
+
+
+def test_torn_tail_is_dropped_and_truncated(store):
+    _register("j1@example.com")
+    intact = os.path.getsize("journal.log")
+    _register("j2@example.com")
+    # A crash in the middle of the second append: its frame is cut short
+    with open("journal.log", "r+b") as f: f.truncate(intact + 5)
+
+    other = _fresh()
+    assert "j1@example.com" in other.attendees and "j2@example.com" not in other.attendees
+    assert os.path.getsize("journal.log") == intact
+
+    # Later commits append after the intact records and replay with them
+    storage.data_store.__init__(storage.PickleBackend())
+    storage.data_store.load_all()
+    _register("j3@example.com")
+    emails = set(_fresh().attendees)
+    assert {"j1@example.com", "j3@example.com"} <= emails and "j2@example.com" not in emails
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_refresh_updates_the_other_terminals_records_in_place(store, monkeypatch, compacted):
+    names = [e.name for e in store.exhibitions]
+    wid = store.exhibitions[0].workshops[0].workshop_id
+    a = _register("j1@example.com")
+    t, err = a.purchase_ticket(TicketType.ExhibitionPass, BUNDLE_PRICES[1], PaymentMethod.Wallet, {"wallet_id": "w1"},
+                               names[:1])
+    assert err is None, err
+    other = _fresh()
+    theirs, ws, ticket = other.attendees["j1@example.com"], other.workshops[wid], other.get_ticket(t.ticket_id)
+    generations = dict(other.backend.generations)
+    assert not other.refresh()
+
+    # Every commit from here on compacts the journal: the other terminal re-reads the stores whose generation moved
+    if compacted: monkeypatch.setitem(storage.STORAGE_CONFIG, "snapshot_every", 1)
+    r, err = a.reserve_workshop(wid)
+    assert err is None, err
+    assert a.upgrade_ticket(t.ticket_id, TicketType.ExhibitionPass, EXHIBITION_ADD_COST, names[1:2])[1] is None
+    with store.transaction(), store.modifying(a): a.name = "Renamed"
+    assert (list(Journal("journal.log").replay()) == []) == compacted
+
+    assert other.refresh()
+    assert other.attendees["j1@example.com"] is theirs and other.attendee_by_id[a.attendee_id] is theirs
+    assert theirs.name == "Renamed" and theirs.tickets == [t.ticket_id]
+    assert other.workshops[wid] is ws and a.attendee_id in ws.attendees_ids
+    assert other.get_ticket(t.ticket_id) is ticket
+    assert ticket.price == BUNDLE_PRICES[1] + EXHIBITION_ADD_COST and ticket.selected_exhibitions == names[:2]
+    assert other.active_reservation(wid, a.attendee_id).reservation_id == r.reservation_id
+    assert (other.backend.generations != generations) == compacted
+    assert other.verify_aggregates() == []
+
+
+def test_corrupted_record_stops_replay(tmp_path):
+    path = str(tmp_path / "journal.log")
+    j = Journal(path)
+    for i in range(3): j.append([("tickets", "put", i, None)])
+    size = os.path.getsize(path)
+    # Flip the last byte of the last record's payload: its crc32 no longer matches
+    with open(path, "r+b") as f:
+        f.seek(size - 1)
+        last = f.read(1)
+        f.seek(size - 1)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    replayed = list(Journal(path).replay())
+    assert replayed == [[("tickets", "put", 0, None)], [("tickets", "put", 1, None)]]
+    assert os.path.getsize(path) < size
@@ -0,0 +1,14 @@
+import pytest
+
+import bench
+
+
+@pytest.fixture(scope="module")
+def sizes():
+    # 5,000 attendees: large enough for the per-record figures to settle (see bench.py memory)
+    return bench.footprint(5000)
+
+
+@pytest.mark.parametrize("name", sorted(bench.MEMORY_BUDGET))
+def test_footprint_within_budget(sizes, name):
+    assert sizes[name] <= bench.MEMORY_BUDGET[name], f"{name}: {sizes[name]:.0f} B/record"
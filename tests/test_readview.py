@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from classes import ALL_ACCESS_PRICE, BUNDLE_PRICES, EXHIBITION_ADD_COST, Attendee, PaymentMethod, TicketType
+
+STORES = ("tickets", "payments", "reservations", "waitlist")
+
+
+def _contents(records):
+    return [(type(o), o.__getstate__()) for o in records]
+
+
+@pytest.fixture
+def owners(store):
+    """Forty attendees with an Exhibition Pass each, the first exhibition's."""
+    out = []
+    for i in range(40):
+        a, err = Attendee.register(f"Owner {i}", f"o{i}@example.com", "0501234567", "password1")
+        assert err is None, err
+        assert a.purchase_ticket(TicketType.ExhibitionPass, BUNDLE_PRICES[1], PaymentMethod.Wallet, {"wallet_id": "w"},
+                                 [store.exhibitions[0].name])[1] is None
+        out.append(a)
+    return store, out
+
+
+class _SlowLookups(dict):
+    """A view's stores that let other threads run between looking a store up and reading from it."""
+
+    def __getitem__(self, store):
+        s = super().__getitem__(store)
+        time.sleep(0.0001)
+        return s
+
+
+def test_view_keeps_its_records_while_another_thread_writes(owners):
+    ds, people = owners
+    for n in range(len(people) // 4):
+        expected = {s: _contents(getattr(ds, s).values() if s == "waitlist" else getattr(ds, s)) for s in STORES}
+        ids = [t.ticket_id for t in ds.tickets]
+        results = []
+
+        def write():
+            # A refund near the front of the list, an upgrade in place, a replaced ticket and a purchase
+            refunded, added, replaced = people[2 * n], people[2 * n + 1], people[-1 - n]
+            results.append(refunded.refund_ticket(refunded.tickets[0]))
+            results.append(added.upgrade_ticket(added.tickets[0], TicketType.ExhibitionPass, EXHIBITION_ADD_COST,
+                                                [ds.exhibitions[1].name])[1])
+            results.append(replaced.upgrade_ticket(replaced.tickets[0], TicketType.AllAccessPass, 0)[1])
+            results.append(added.purchase_ticket(TicketType.AllAccessPass, ALL_ACCESS_PRICE, PaymentMethod.Wallet,
+                                                 {"wallet_id": "w"})[1])
+
+        with ds.read_view() as view:
+            view._stores = _SlowLookups(view._stores)
+            writer = threading.Thread(target=write)
+            writer.start()
+            while writer.is_alive():
+                assert [t.ticket_id for t in view.records("tickets")] == ids
+            writer.join()
+            for s in STORES: assert _contents(view.records(s)) == expected[s], s
+        assert results == [None] * 4 and len(ds.tickets) == len(ids)
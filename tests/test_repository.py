@@ -0,0 +1,30 @@
+import storage
+from classes import Attendee
+from repository import AttendeeRepository
+
+
+def _register(i):
+    a, err = Attendee.register("Cached Person", f"c{i}@example.com", "0501234567", "password1")
+    assert err is None, err
+    return a
+
+
+def test_changes_kept_in_memory_stay_bounded(store, monkeypatch):
+    monkeypatch.setitem(storage.STORAGE_CONFIG, "attendee_cache", 20)
+    store.load_all()
+    repo = store.attendees
+    assert isinstance(repo, AttendeeRepository)
+
+    for i in range(150):
+        _register(i)
+        assert repo.unsettled() <= repo.size
+    # One commit of many changes: let go of once it is written
+    with store.transaction():
+        for i in range(150, 250): _register(i)
+    assert repo.unsettled() <= repo.size
+    assert repo.stats()["cached"] <= repo.size
+
+    fresh = storage.DataStore(storage.PickleBackend())
+    fresh.load_all()
+    assert all(f"c{i}@example.com" in fresh.attendees for i in range(250))
+    assert store.attendees["c7@example.com"].attendee_id == fresh.attendees["c7@example.com"].attendee_id
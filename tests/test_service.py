@@ -0,0 +1,74 @@
+import asyncio
+
+from service import BookingClient, BookingService
+
+
+async def _session():
+    service = BookingService()
+    server = await service.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        anon = BookingClient("127.0.0.1", port)
+        status, body = await anon.request("POST", "/attendees", {"name": "Test Person", "email": "tp@example.com",
+                                                                 "phone": "0501234567", "password": "password1"})
+        assert status == 201, body
+        assert (await anon.request("POST", "/attendees", {"name": "Test Person", "email": "tp@example.com",
+                                                          "phone": "0501234567", "password": "password1"}))[0] == 409
+
+        status, body = await anon.request("GET", "/exhibitions")
+        assert status == 200 and body["exhibitions"]
+        exhibition = body["exhibitions"][0]
+        wid = exhibition["workshops"][0]["workshop_id"]
+
+        assert (await anon.request("GET", "/me"))[0] == 401
+        me = BookingClient("127.0.0.1", port, "tp@example.com", "password1")
+        status, ticket = await me.request("POST", "/tickets", {"exhibitions": [exhibition["name"]],
+                                                               "payment_method": "Wallet",
+                                                               "payment_details": {"wallet_id": "w1"}})
+        assert status == 201, ticket
+        assert ticket["price"] == 200.0 and ticket["exhibitions"] == [exhibition["name"]]
+        status, res = await me.request("POST", "/reservations", {"workshop_id": wid})
+        assert status == 201, res
+
+        status, body = await me.request("GET", "/me")
+        assert status == 200
+        assert [t["ticket_id"] for t in body["tickets"]] == [ticket["ticket_id"]]
+        assert [r["workshop_id"] for r in body["reservations"]] == [wid]
+
+        status, _ = await me.request("DELETE", f"/reservations/{res['reservation_id']}")
+        assert status == 200
+        assert (await me.request("GET", "/me"))[1]["reservations"] == []
+        assert (await me.request("GET", "/nowhere"))[0] == 404
+        return port
+    finally:
+        await service.stop(server)
+
+
+async def _raw(port, head):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(head)
+        await writer.drain()
+        return await reader.read()
+    finally:
+        writer.close()
+
+
+def test_client_against_running_service(store):
+    asyncio.run(_session())
+    assert "tp@example.com" in store.attendees
+
+
+def test_bad_content_length_is_rejected(store):
+    async def run():
+        service = BookingService()
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await _raw(port, f"POST /attendees HTTP/1.1\r\nContent-Length: {n}\r\n\r\n".encode())
+                    for n in ("abc", "-5")]
+        finally:
+            await service.stop(server)
+
+    for reply in asyncio.run(run()):
+        assert reply.startswith(b"HTTP/1.1 400 ") and b"Bad Content-Length" in reply
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import storage
+from classes import ALL_ACCESS_PRICE, Attendee, PaymentMethod, TicketType
+from sqlite_store import TABLES, SQLiteBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env(**extra):
+    return dict(os.environ, PYTHONPATH=ROOT, GREENWAVE_ASYNC_SAVE="0", GREENWAVE_ATTENDEE_CACHE="0", **extra)
+
+
+@pytest.fixture
+def sqlite_store(store, monkeypatch):
+    """The store fixture's data_store on the SQLite backend instead, with a new greenwave.db in tmp_path."""
+    monkeypatch.setitem(storage.STORAGE_CONFIG, "backend", "sqlite")
+    monkeypatch.setitem(storage.STORAGE_CONFIG, "sqlite_file", "greenwave.db")
+    store.__init__(storage.make_backend())
+    store.load_all()
+    yield store
+    store.flush()
+    store.backend.close()
+
+
+def _rows(conn):
+    """{(store, key): row} of every record table."""
+    out = {}
+    for store, (table, pk, _, _) in TABLES.items():
+        for row in conn.execute(f"SELECT {pk}, * FROM {table}"): out[(store, row[0])] = row[1:]
+    return out
+
+
+def _feed(conn, after):
+    return {(s, k) for s, k in conn.execute("SELECT store, key FROM changes WHERE seq > ?", (after,))}
+
+
+def test_backend_is_chosen_by_environment_and_opens_in_wal_mode(tmp_path):
+    db = str(tmp_path / "chosen.db")
+    script = ("from classes import Attendee\nfrom storage import data_store\ndata_store.load_all()\n"
+              "assert Attendee.register('Env', 'env@example.com', '0501234567', 'password1')[1] is None\n"
+              "data_store.flush()\nprint(type(data_store.backend).__name__)")
+    out = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True, timeout=120,
+                         env=_env(GREENWAVE_BACKEND="sqlite", GREENWAVE_DB=db))
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.split() == ["SQLiteBackend"]
+    # Nothing went to the pickle backend's files
+    assert not os.path.exists(tmp_path / "journal.log") and not os.path.exists(tmp_path / "attendees.pkl")
+
+    conn = sqlite3.connect(db)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM attendees WHERE email = 'env@example.com'").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_commits_write_only_the_changed_rows(sqlite_store):
+    ds = sqlite_store
+    conn = sqlite3.connect("greenwave.db")
+    seq = [conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]]
+    wid = ds.exhibitions[0].workshops[0].workshop_id
+
+    def check(expected):
+        """The rows this commit changed are exactly `expected`, and the change feed lists those and no others."""
+        rows = _rows(conn)
+        changed = {k for k in before.keys() | rows.keys() if before.get(k) != rows.get(k)}
+        assert changed == expected
+        assert _feed(conn, seq[0]) == expected
+        seq[0] = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+        return rows
+
+    try:
+        before = _rows(conn)
+        a, err = Attendee.register("Row Test", "rows@example.com", "0501234567", "password1")
+        assert err is None, err
+        before = check({("attendees", a.email)})
+
+        t, err = a.purchase_ticket(TicketType.AllAccessPass, ALL_ACCESS_PRICE, PaymentMethod.Wallet, {"wallet_id": "w"})
+        assert err is None, err
+        p = ds.payments[-1]
+        before = check({("attendees", a.email), ("tickets", t.ticket_id), ("payments", p.payment_id)})
+
+        r, err = a.reserve_workshop(wid)
+        assert err is None, err
+        before = check({("reservations", r.reservation_id), ("workshops", wid)})
+
+        assert a.refund_ticket(t.ticket_id) is None
+        check({("attendees", a.email), ("tickets", t.ticket_id), ("reservations", r.reservation_id),
+               ("workshops", wid)})
+    finally:
+        conn.close()
+
+    fresh = storage.DataStore(SQLiteBackend("greenwave.db"))
+    fresh.load_all()
+    assert fresh.attendees["rows@example.com"].tickets == [] and fresh.get_ticket(t.ticket_id) is None
+    assert fresh.get_reservation(r.reservation_id).status is False
+    assert a.attendee_id not in fresh.workshops[wid].attendees_ids
+    assert fresh.verify_aggregates() == []
+    fresh.backend.close()
+
+
+def test_migrate_copies_the_pickle_files(store):
+    for i in range(3):
+        a, err = Attendee.register(f"Migrated {i}", f"m{i}@example.com", "0501234567", "password1")
+        assert err is None, err
+        t, err = a.purchase_ticket(TicketType.AllAccessPass, ALL_ACCESS_PRICE, PaymentMethod.Wallet, {"wallet_id": "w"})
+        assert err is None, err
+        assert a.reserve_workshop(store.exhibitions[i].workshops[0].workshop_id)[1] is None
+    assert store.attendees["m0@example.com"].refund_ticket(store.attendees["m0@example.com"].tickets[0]) is None
+    # Half in the snapshots, half still in the journal: migrate reads both
+    store.snapshot()
+    assert Attendee.register("Journaled", "j@example.com", "0501234567", "password1")[1] is None
+    store.flush()
+
+    cmd = [sys.executable, os.path.join(ROOT, "migrate.py"), "--db", "migrated.db"]
+    out = subprocess.run(cmd, capture_output=True, text=True, timeout=120, env=_env())
+    assert out.returncode == 0, out.stderr
+    # A second run refuses to overwrite the data
+    again = subprocess.run(cmd, capture_output=True, text=True, timeout=120, env=_env())
+    assert again.returncode != 0 and "already contains data" in again.stderr
+
+    migrated = storage.DataStore(SQLiteBackend("migrated.db"))
+    migrated.load_all()
+    try:
+        for n in ("attendees", "tickets", "reservations", "payments", "workshops", "waitlist"):
+            assert len(getattr(migrated, n)) == len(getattr(store, n)), n
+        assert f"attendees: {len(store.attendees)}, tickets: {len(store.tickets)}" in out.stdout
+        assert migrated.verify_aggregates() == []
+        mine, theirs = store.aggregates, migrated.aggregates
+        assert theirs.revenue() == mine.revenue() and theirs.by_type_totals() == mine.by_type_totals()
+        assert [theirs.seats_on(d) for d in theirs.dates()] == [mine.seats_on(d) for d in mine.dates()]
+    finally:
+        migrated.backend.close()
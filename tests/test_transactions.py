@@ -0,0 +1,115 @@
+import pytest
+
+import storage
+from classes import Attendee, PaymentMethod, TicketType
+
+
+def _state(ds):
+    """Every record, index and aggregate a rollback must put back exactly."""
+    rec = lambda o: repr(sorted(o.__getstate__().items(), key=str))
+    agg = ds.aggregates
+    return {
+        "attendees": sorted((e, rec(a)) for e, a in ds.attendees.items()),
+        "by_id": sorted(ds.attendee_by_id),
+        "tickets": [rec(t) for t in ds.tickets],
+        "ticket_index": sorted(ds.ticket_index),
+        "payments": [rec(p) for p in ds.payments],
+        "payment_index": sorted(ds.payment_index),
+        "reservations": [rec(r) for r in ds.reservations],
+        "reservation_by_slot": sorted(ds.reservation_by_slot),
+        "reservations_by_attendee": {k: [r.reservation_id for r in v] for k, v in ds.reservations_by_attendee.items()
+                                     if v},
+        "schedule": sorted((k, sorted(v)) for k, v in ds.schedule.by_attendee.items() if v),
+        "waitlist": sorted(ds.waitlist),
+        "workshops": {w: (ws.capacity, list(ws.attendees_ids)) for w, ws in ds.workshops.items()},
+        "aggregates": (agg.by_type_totals(), agg.by_day_totals(), agg.revenue(),
+                       [agg.seats_on(d) for d in agg.dates()]),
+        "entitlements": {a.attendee_id: ds.entitlement(a) for a in ds.attendees.values()},
+        "pending": dict(ds._pending),
+    }
+
+
+@pytest.fixture
+def busy(store):
+    """The sample conference with two attendees holding tickets and reservations."""
+    out = []
+    for i, tt in enumerate((TicketType.AllAccessPass, TicketType.ExhibitionPass)):
+        a, err = Attendee.register(f"Person {i}", f"p{i}@example.com", "0501234567", "password1")
+        assert err is None, err
+        sel = None if tt == TicketType.AllAccessPass else [store.exhibitions[0].name]
+        t, err = a.purchase_ticket(tt, 500.0 if sel is None else 200.0, PaymentMethod.Wallet, {"wallet_id": "w"},
+                                   sel)
+        assert err is None, err
+        r, err = a.reserve_workshop(store.exhibitions[0].workshops[0].workshop_id)
+        assert err is None, err
+        out.append(a)
+    return store, out
+
+
+def _mutate(ds, a, b):
+    """One of every kind of change, through the same calls the screens make."""
+    wid = ds.exhibitions[1].workshops[1].workshop_id
+    assert a.purchase_ticket(TicketType.ExhibitionPass, 200.0, PaymentMethod.Wallet, {"wallet_id": "w"},
+                             [ds.exhibitions[1].name])[1] is None
+    assert a.reserve_workshop(wid)[1] is None
+    assert b.cancel_reservation(ds.reservations_for(b.attendee_id, active_only=True)[0].reservation_id) is None
+    assert b.refund_ticket(b.tickets[0]) is None
+    assert a.update_profile("Renamed", "renamed@example.com", "0509999999", None) is None
+    assert ds.set_capacity(wid, 5) is None
+    assert Attendee.register("New One", "new@example.com", "0501234567", "password1")[1] is None
+
+
+def test_rollback_restores_records_indexes_and_aggregates(busy):
+    ds, (a, b) = busy
+    before = _state(ds)
+    with pytest.raises(RuntimeError):
+        with ds.transaction():
+            _mutate(ds, a, b)
+            assert _state(ds) != before
+            raise RuntimeError("abort")
+    assert _state(ds) == before
+    assert ds.verify_aggregates() == []
+
+
+def test_failed_savepoint_keeps_the_outer_changes(busy):
+    ds, (a, b) = busy
+    with ds.transaction():
+        assert Attendee.register("Outer", "outer@example.com", "0501234567", "password1")[1] is None
+        kept = _state(ds)
+        with pytest.raises(RuntimeError):
+            with ds.transaction():
+                _mutate(ds, a, b)
+                raise RuntimeError("abort the savepoint")
+        assert _state(ds) == kept
+        # A savepoint that succeeds after the failed one is kept too
+        with ds.transaction():
+            assert a.reserve_workshop(ds.exhibitions[2].workshops[0].workshop_id)[1] is None
+        after = _state(ds)
+    assert "outer@example.com" in ds.attendees and "renamed@example.com" not in ds.attendees
+    assert ds.verify_aggregates() == []
+
+    # What was committed is exactly what is in memory
+    fresh = storage.DataStore(storage.PickleBackend())
+    fresh.load_all()
+    after.pop("pending")
+    reloaded = _state(fresh)
+    reloaded.pop("pending")
+    assert reloaded == after
+
+
+def test_nested_savepoints_roll_back_innermost_first(busy):
+    ds, (a, b) = busy
+    start = _state(ds)
+    with pytest.raises(RuntimeError):
+        with ds.transaction():
+            assert Attendee.register("Level 1", "l1@example.com", "0501234567", "password1")[1] is None
+            level1 = _state(ds)
+            with pytest.raises(RuntimeError):
+                with ds.transaction():
+                    assert b.refund_ticket(b.tickets[0]) is None
+                    with ds.transaction():
+                        assert a.update_profile("Deep", "deep@example.com", "0501111111", None) is None
+                    raise RuntimeError("abort level 2")
+            assert _state(ds) == level1
+            raise RuntimeError("abort level 1")
+    assert _state(ds) == start
@@ -0,0 +1,134 @@
+import pytest
+
+import classes
+import storage
+from classes import ALL_ACCESS_PRICE, BUNDLE_PRICES, Attendee, PaymentMethod, TicketType
+from storage import Journal
+
+
+def _attendee(name, tt, ws):
+    """A new attendee with an All-Access pass, or an Exhibition Pass for `ws`'s exhibition."""
+    a, err = Attendee.register(name.title(), f"{name}@example.com", "0501234567", "password1")
+    assert err is None, err
+    sel = None if tt == TicketType.AllAccessPass else [ws.exhibition_name]
+    price = ALL_ACCESS_PRICE if sel is None else BUNDLE_PRICES[1]
+    assert a.purchase_ticket(tt, price, PaymentMethod.Wallet, {"wallet_id": "w"}, sel)[1] is None
+    return a
+
+
+def _join(ws, *names, tt=TicketType.ExhibitionPass):
+    out = []
+    for name in names:
+        a = _attendee(name, tt, ws)
+        e, err = a.join_waitlist(ws.workshop_id)
+        assert err is None, err
+        out.append(a)
+    return out
+
+
+def _booked(ds, ws, a):
+    return ds.active_reservation(ws.workshop_id, a.attendee_id) is not None
+
+
+@pytest.fixture
+def full(store):
+    """A one-seat workshop, overlapped by other workshops, taken by an All-Access holder."""
+    ws = next(w for w in store.workshops.values() if len(store.schedule.during(*w.interval)) > 1)
+    holder = _attendee("holder", TicketType.AllAccessPass, ws)
+    assert holder.reserve_workshop(ws.workshop_id)[1] is None
+    assert store.set_capacity(ws.workshop_id, 1) is None
+    return store, ws, holder
+
+
+def test_waiters_are_promoted_first_come_first_served(full):
+    ds, ws, _ = full
+    w = _join(ws, "first", "second", "third")
+    assert [ds.waitlist_position(ws.workshop_id, a.attendee_id) for a in w] == [1, 2, 3]
+
+    assert ds.set_capacity(ws.workshop_id, 3) is None
+    assert [_booked(ds, ws, a) for a in w] == [True, True, False]
+    assert ds.waitlist_position(ws.workshop_id, w[2].attendee_id) == 1
+    assert ds.waiting(ws.workshop_id) == 1
+
+
+@pytest.mark.parametrize("all_access_first", [True, False])
+def test_all_access_holders_go_first_when_enabled(full, monkeypatch, all_access_first):
+    monkeypatch.setattr(classes, "WAITLIST_ALL_ACCESS_FIRST", all_access_first)
+    ds, ws, _ = full
+    early, late = _join(ws, "early", "late")
+    (vip,) = _join(ws, "vip", tt=TicketType.AllAccessPass)
+
+    order = [vip, early, late] if all_access_first else [early, late, vip]
+    for n in range(1, 4):
+        # One more seat each time: it goes to the next in `order`
+        assert ds.set_capacity(ws.workshop_id, 1 + n) is None
+        assert [_booked(ds, ws, a) for a in order] == [i < n for i in range(3)]
+
+
+def _free_seat(ds, ws, holder, how):
+    if how == "cancel":
+        r = ds.active_reservation(ws.workshop_id, holder.attendee_id)
+        assert holder.cancel_reservation(r.reservation_id) is None
+    elif how == "refund":
+        assert holder.refund_ticket(holder.tickets[0]) is None
+    else:
+        assert ds.set_capacity(ws.workshop_id, 2) is None
+
+
+@pytest.mark.parametrize("how", ["cancel", "refund", "capacity"])
+def test_freed_seat_is_promoted_in_the_same_commit(full, how):
+    ds, ws, holder = full
+    (waiter,) = _join(ws, "waiter")
+    entry = ds.waitlist_entry(ws.workshop_id, waiter.attendee_id)
+    commits = len(list(Journal("journal.log").replay()))
+
+    _free_seat(ds, ws, holder, how)
+    assert _booked(ds, ws, waiter) and ds.waiting(ws.workshop_id) == 0
+
+    # One journal record: the freed seat, the reservation it went to and the waitlist entry it used up
+    records = list(Journal("journal.log").replay())
+    assert len(records) == commits + 1
+    ops = {(store, op, key): obj for store, op, key, obj in records[-1]}
+    assert ("waitlist", "del", entry.entry_id) in ops
+    promoted = ds.active_reservation(ws.workshop_id, waiter.attendee_id)
+    assert ops[("reservations", "put", promoted.reservation_id)].attendee_id == waiter.attendee_id
+    assert ("workshops", "put", ws.workshop_id) in ops
+
+    fresh = storage.DataStore(storage.PickleBackend())
+    fresh.load_all()
+    assert waiter.attendee_id in fresh.workshops[ws.workshop_id].attendees_ids
+    assert fresh.waiting(ws.workshop_id) == 0
+    assert fresh.verify_aggregates() == []
+
+
+def test_failed_commit_undoes_its_promotions(full, monkeypatch):
+    ds, ws, holder = full
+    (waiter,) = _join(ws, "waiter")
+    booked = list(ws.attendees_ids)
+
+    def fail(*args, **kwargs): raise OSError("disk full")
+    with monkeypatch.context() as m, pytest.raises(OSError):
+        m.setattr(ds.backend, "commit", fail)
+        _free_seat(ds, ws, holder, "cancel")
+
+    assert ws.attendees_ids == booked and _booked(ds, ws, holder) and not _booked(ds, ws, waiter)
+    assert ds.waitlist_position(ws.workshop_id, waiter.attendee_id) == 1
+    assert ds.verify_aggregates() == []
+
+
+def test_waiters_who_cannot_take_the_seat_are_skipped(full):
+    ds, ws, holder = full
+    (clashing,) = _join(ws, "clashing", tt=TicketType.AllAccessPass)
+    refunded, served = _join(ws, "refunded", "served")
+    # Since joining: one booked an overlapping workshop, the other gave their ticket back
+    other = next(w for w in ds.schedule.during(*ws.interval) if w is not ws)
+    assert clashing.reserve_workshop(other.workshop_id)[1] is None
+    assert refunded.refund_ticket(refunded.tickets[0]) is None
+
+    _free_seat(ds, ws, holder, "cancel")
+    assert _booked(ds, ws, served)
+    assert not _booked(ds, ws, clashing) and not _booked(ds, ws, refunded)
+    # Skipped waiters lose their place
+    assert ds.waitlist_entry(ws.workshop_id, clashing.attendee_id) is None
+    assert ds.waitlist_entry(ws.workshop_id, refunded.attendee_id) is None
+    assert ds.waiting(ws.workshop_id) == 0